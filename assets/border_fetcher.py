@@ -1,6 +1,17 @@
 import requests
 import json
 
+from assets.geojson_stream import FeatureStreamParser
+
+# Shared session so repeated downloads from the same host reuse connections.
+_session = requests.Session()
+# Timeout in seconds for border downloads; the Natural Earth files are large.
+REQUEST_TIMEOUT = 30
+# Size of the chunks a border download is read and parsed in.
+CHUNK_SIZE = 256 * 1024
+# Downloaded bytes between two progress reports.
+PROGRESS_INTERVAL = 2 * 1024 * 1024
+
 # URL for high-resolution country borders - RESTORED TO WORKING VERSION
 COUNTRIES_URL = "https://raw.githubusercontent.com/datasets/geo-countries/master/data/countries.geojson"
 
@@ -16,6 +27,8 @@ COUNTRY_SPECIFIC_REGIONS = {
 
 # Fallback URL for other countries' regions from Natural Earth
 GENERAL_REGIONS_URL = "https://raw.githubusercontent.com/nvkelso/natural-earth-vector/master/geojson/ne_10m_admin_1_states_provinces.geojson"
+# Property naming the country a Natural Earth region belongs to
+GENERAL_REGIONS_KEY = "admin"
 
 # A specific list of European countries to keep the menu clean and fast
 EUROPEAN_COUNTRIES = [
@@ -28,14 +41,78 @@ EUROPEAN_COUNTRIES = [
     "Slovenia", "Spain", "Sweden", "Switzerland", "Ukraine", "United Kingdom", "Vatican City"
 ]
 
-def get_geojson_from_url(url):
+class DownloadCancelled(Exception):
+    """ Raised when a border download is cancelled before it is complete. """
+
+
+class _StreamedDownload:
+    """
+    Feeds a download chunk by chunk to a FeatureStreamParser, reports the progress
+    and aborts between two chunks once cancelled() returns True.
+    """
+
+    def __init__(self, keep=None, progress=None, cancelled=None):
+        self.parser = FeatureStreamParser(keep)
+        self.progress = progress
+        self.cancelled = cancelled
+        self.received = 0
+        self._next_report = PROGRESS_INTERVAL
+
+    def check_cancelled(self):
+        if self.cancelled is not None and self.cancelled():
+            raise DownloadCancelled()
+
+    def feed(self, chunk):
+        self.check_cancelled()
+        self.parser.feed(chunk)
+        self.received += len(chunk)
+        if self.progress is not None and self.received >= self._next_report:
+            self._next_report = self.received + PROGRESS_INTERVAL
+            self.progress(self.received, self.parser.feature_count)
+
+    def parse(self, body):
+        """ Finishes a streamed download, or parses a body that came from the cache. """
+        if not self.received:
+            if self.parser.keep is None:
+                return json.loads(body)
+            # Served from the cache: filtered by the same parser a download goes through
+            self.parser.feed(body)
+        return self.parser.close()
+
+
+def get_geojson_from_url(url, cache=None, keep=None, progress=None, cancelled=None, cache_parsed=True):
     """
     Fetches GeoJSON data from a given URL.
+
+    Downloads are streamed and their features parsed, and filtered by keep, as the
+    bytes arrive. With an HttpCache the document is served from disk while it is
+    fresh, then revalidated with a conditional request. Unfiltered documents are
+    parsed only once per version; the cache keeps their parsed form as well.
+
+    Args:
+        keep (callable): Optional predicate; only features it accepts are returned.
+        progress (callable): Called as progress(bytes, features) while downloading.
+        cancelled (callable): Polled between chunks; once it returns True the
+            download is abandoned.
+        cache_parsed (bool): Keep the parsed form in the cache as well. Off for
+            documents that are stored elsewhere once parsed, e.g. in a RegionStore.
+
+    Raises:
+        DownloadCancelled: If the download was cancelled.
     """
+    download = _StreamedDownload(keep, progress, cancelled)
     try:
-        response = requests.get(url, timeout=30) # Increased timeout for larger files
-        response.raise_for_status()
-        return response.json()
+        download.check_cancelled()
+        if cache is not None:
+            if keep is None and cache_parsed:
+                return cache.fetch_parsed(_session, url, REQUEST_TIMEOUT, download.parse, download.feed)
+            # Only the body is cached: the parsed form the cache keeps is per URL, not per filter
+            return download.parse(cache.fetch(_session, url, REQUEST_TIMEOUT, download.feed))
+        with _session.get(url, timeout=REQUEST_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                download.feed(chunk)
+        return download.parser.close()
     except requests.exceptions.RequestException as e:
         print(f"Error fetching data from {url}: {e}")
         raise
@@ -43,29 +120,45 @@ def get_geojson_from_url(url):
         print(f"Error decoding JSON from {url}")
         raise
 
-def get_admin_borders(admin_level, country_name=None):
+def get_admin_borders(admin_level, country_name=None, cache=None, region_store=None,
+                      progress=None, cancelled=None, log=None):
     """
     Returns GeoJSON data for a given administrative level.
+
+    With a RegionStore the Natural Earth regions are ingested once and then read
+    per country, instead of loading the whole file for every country; the cache then
+    keeps only the file's body for revalidation. progress and cancelled are passed
+    on to get_geojson_from_url, log to RegionStore.feature_collection.
     """
     if admin_level == 4:  # All Countries
         print("Fetching all country borders...")
-        return get_geojson_from_url(COUNTRIES_URL)
+        return get_geojson_from_url(COUNTRIES_URL, cache, progress=progress, cancelled=cancelled)
     elif admin_level == 6:  # Regions
         if country_name == "ALL":
              print("Fetching all European regions...")
-             return get_geojson_from_url(GENERAL_REGIONS_URL)
+             return get_geojson_from_url(GENERAL_REGIONS_URL, cache, progress=progress, cancelled=cancelled)
         if country_name in COUNTRY_SPECIFIC_REGIONS:
             print(f"Fetching specific regions for {country_name}...")
-            return get_geojson_from_url(COUNTRY_SPECIFIC_REGIONS[country_name])
+            return get_geojson_from_url(
+                COUNTRY_SPECIFIC_REGIONS[country_name], cache, progress=progress, cancelled=cancelled
+            )
         elif country_name:
              # Fallback to the general regions file for other countries
             print(f"Fetching regions for {country_name} from general source...")
-            all_regions = get_geojson_from_url(GENERAL_REGIONS_URL)
-            country_features = [
-                f for f in all_regions.get('features', [])
-                if f.get('properties', {}).get('admin') == country_name
-            ]
-            return {"type": "FeatureCollection", "features": country_features}
+            if region_store is not None:
+                return region_store.feature_collection(
+                    GENERAL_REGIONS_URL, country_name, GENERAL_REGIONS_KEY,
+                    lambda: get_geojson_from_url(
+                        GENERAL_REGIONS_URL, cache, progress=progress, cancelled=cancelled, cache_parsed=False
+                    ),
+                    log=log
+                )
+            # Only this country's features are kept while the file streams in
+            return get_geojson_from_url(
+                GENERAL_REGIONS_URL, cache,
+                keep=lambda f: (f.get('properties') or {}).get(GENERAL_REGIONS_KEY) == country_name,
+                progress=progress, cancelled=cancelled
+            )
         else:
              return {"type": "FeatureCollection", "features": []}
     else:
@@ -0,0 +1,151 @@
+# This module contains the scheduler that runs border downloads and their preparation in a worker pool.
+
+import threading
+import time
+from collections import deque
+
+# Number of worker threads; border jobs are large downloads followed by CPU-heavy simplification.
+DEFAULT_WORKERS = 2
+# Seconds shutdown waits for running jobs; workers still busy after that are daemons and end with the app.
+SHUTDOWN_TIMEOUT = 2.0
+
+
+class _BorderJob:
+    """ One queued or running job for a border layer. """
+    __slots__ = ("key", "work", "cancelled")
+
+    def __init__(self, key, work):
+        self.key = key
+        self.work = work
+        self.cancelled = False
+
+
+class BorderJobScheduler:
+    """
+    A fixed pool of worker threads running at most one job per key (a border layer id).
+
+    Requesting a key that is already queued or running does not start a second job,
+    the most recently requested job is started first, and jobs can be cancelled:
+    a queued one is dropped, a running one is asked to stop through the cancelled
+    callable it receives and its result is not delivered. The callbacks are
+    invoked from the worker threads.
+    """
+
+    def __init__(self, on_success, on_error, on_progress=None, workers=DEFAULT_WORKERS):
+        """
+        Initializes the scheduler and starts its worker threads.
+
+        Args:
+            on_success (callable): Called with (key, result) for each finished job.
+            on_error (callable): Called with (key, error_message) for each failed job.
+            on_progress (callable): Called with (key, *args) for the progress a job reports.
+            workers (int): Number of worker threads.
+        """
+        self.on_success = on_success
+        self.on_error = on_error
+        self.on_progress = on_progress
+
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._jobs = {}
+        self._is_running = True
+
+        self._threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"BorderJobs-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, work):
+        """
+        Queues a job unless one for key is already queued or running.
+
+        Args:
+            key (str): Identifies the job, e.g. the border layer id.
+            work (callable): Called as work(cancelled, progress) on a worker thread;
+                cancelled() returns True once the job is cancelled, progress(*args)
+                is forwarded to on_progress. Its return value is the result.
+
+        Returns:
+            bool: False if the request joined an existing job.
+        """
+        with self._condition:
+            if not self._is_running or key in self._jobs:
+                return False
+            job = _BorderJob(key, work)
+            self._jobs[key] = job
+            self._queue.append(job)
+            self._condition.notify()
+            return True
+
+    def cancel(self, key):
+        """ Cancels the job for key, if there is one. """
+        with self._condition:
+            job = self._jobs.pop(key, None)
+            if job is None:
+                return
+            job.cancelled = True
+            if job in self._queue:
+                self._queue.remove(job)
+
+    def is_pending(self, key):
+        """ Returns True if a job for key is queued or running. """
+        with self._condition:
+            return key in self._jobs
+
+    def shutdown(self, wait=True, timeout=SHUTDOWN_TIMEOUT):
+        """
+        Cancels every job and stops the workers.
+
+        Args:
+            wait (bool): Wait for running jobs to return.
+            timeout (float): Longest time in seconds to wait for them in total, or None
+                to wait indefinitely. A job that is busy e.g. simplifying a large layer
+                may not notice the cancellation in time; its worker is left to finish
+                on its own and its result is discarded.
+
+        Returns:
+            bool: True if no worker is running any more.
+        """
+        with self._condition:
+            self._is_running = False
+            for job in self._jobs.values():
+                job.cancelled = True
+            self._queue.clear()
+            self._jobs.clear()
+            self._condition.notify_all()
+        if wait:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            for thread in self._threads:
+                thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while self._is_running and not self._queue:
+                    self._condition.wait()
+                if not self._is_running:
+                    return
+                # Newest first: the last ticked layer is the one the user is waiting for
+                job = self._queue.pop()
+
+            result, error = None, None
+            try:
+                result = job.work(lambda: job.cancelled, lambda *args: self._report_progress(job, *args))
+            except Exception as e:
+                error = str(e)
+
+            with self._condition:
+                if job.cancelled:
+                    continue
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+            if error is None:
+                self.on_success(job.key, result)
+            else:
+                self.on_error(job.key, error)
+
+    def _report_progress(self, job, *args):
+        if self.on_progress is not None and not job.cancelled:
+            self.on_progress(job.key, *args)
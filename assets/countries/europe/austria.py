@@ -23,3 +23,8 @@ layer_logic = {
         "0": 'at_dtm' # Use this layer at all zoom levels when inside the austria bounds
     }
 }
+
+# Ranks below Bavaria and above Switzerland, Italy and Germany where their boxes overlap Austria's.
+priority = {
+    "austria": 40
+}
@@ -55,3 +55,9 @@ layer_logic = {
         "0": 'de_gelaende'
     }
 }
+
+# Bavaria's LiDAR relief takes precedence over all neighbours; Germany is the fallback.
+priority = {
+    "bavaria": 50,
+    "germany": 10
+}
@@ -28,3 +28,8 @@ layer_logic = {
         "0": 'it_dtm' # Use this layer at all zoom levels when inside the italy bounds
     }
 }
+
+# Ranks below Austria and Switzerland, whose relief is used where Italy's box reaches into the Alps.
+priority = {
+    "italy": 20
+}
@@ -27,3 +27,8 @@ layer_logic = {
         "0": 'ch_dtm' # Use this layer at all zoom levels when inside the switzerland bounds
     }
 }
+
+# Ranks above Italy and Germany; Bavaria and Austria win where their boxes reach into eastern Switzerland.
+priority = {
+    "switzerland": 30
+}
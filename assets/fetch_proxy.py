@@ -0,0 +1,192 @@
+# This module contains the pooled HTTP fetcher behind the page's L.Util.ajax proxy.
+
+import json
+import sqlite3
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Number of worker threads shared by all proxied requests.
+DEFAULT_WORKERS = 6
+# Maximum number of parallel requests against a single host.
+DEFAULT_PER_HOST = 4
+# Timeout in seconds for a single upstream request.
+DEFAULT_TIMEOUT = 10
+
+
+class _FetchJob:
+    """ One upstream request, shared by every request id asking for the same URL. """
+    __slots__ = ("url", "host", "request_ids", "started")
+
+    def __init__(self, url):
+        self.url = url
+        self.host = urlsplit(url).netloc
+        self.request_ids = set()
+        self.started = False
+
+
+class FetchPool:
+    """
+    A fixed pool of worker threads sharing one keep-alive requests.Session.
+
+    Identical URLs that are requested while a download is queued or running are
+    coalesced into a single job, each host is limited to a bounded number of
+    parallel requests, and request ids can be cancelled until their response
+    has been delivered. The callbacks are invoked from the worker threads.
+    """
+
+    def __init__(self, on_success, on_error, workers=DEFAULT_WORKERS,
+                 per_host=DEFAULT_PER_HOST, timeout=DEFAULT_TIMEOUT, cache=None):
+        """
+        Initializes the pool and starts its worker threads.
+
+        Args:
+            on_success (callable): Called with (request_ids, data) for each finished job.
+            on_error (callable): Called with (request_ids, error_message) for each failed job.
+            workers (int): Number of worker threads.
+            per_host (int): Maximum number of parallel requests per host.
+            timeout (float): Timeout in seconds for a single request.
+            cache (HttpCache): Optional persistent response cache consulted before the network.
+        """
+        self.on_success = on_success
+        self.on_error = on_error
+        self.per_host = per_host
+        self.timeout = timeout
+        self.cache = cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._jobs_by_url = {}
+        self._jobs_by_request = {}
+        self._active_per_host = {}
+        self._is_running = True
+
+        self._threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"FetchPool-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, request_id, url):
+        """ Queues a request, joining an identical queued or running download if there is one. """
+        with self._condition:
+            if not self._is_running:
+                return
+            job = self._jobs_by_url.get(url)
+            if job is None:
+                job = _FetchJob(url)
+                self._jobs_by_url[url] = job
+                self._queue.append(job)
+            job.request_ids.add(request_id)
+            self._jobs_by_request[request_id] = job
+            self._condition.notify()
+
+    def cancel(self, request_id):
+        """
+        Cancels a request. A queued download is dropped once nobody waits for it
+        anymore; a running one finishes, but its result is not delivered.
+        """
+        with self._condition:
+            job = self._jobs_by_request.pop(request_id, None)
+            if job is None:
+                return
+            job.request_ids.discard(request_id)
+            if not job.request_ids and not job.started:
+                self._queue.remove(job)
+                del self._jobs_by_url[job.url]
+
+    def pending_count(self):
+        """ Returns the number of queued or running downloads. """
+        with self._condition:
+            return len(self._jobs_by_url)
+
+    def shutdown(self, wait=False):
+        """ Stops the workers. Running downloads are abandoned unless wait is True. """
+        with self._condition:
+            self._is_running = False
+            self._queue.clear()
+            self._jobs_by_url.clear()
+            self._jobs_by_request.clear()
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self.session.close()
+
+    def _next_job_locked(self):
+        """ Returns the oldest queued job whose host still has a free slot. """
+        for job in self._queue:
+            if self._active_per_host.get(job.host, 0) < self.per_host:
+                self._queue.remove(job)
+                return job
+        return None
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                job = None
+                while self._is_running:
+                    job = self._next_job_locked()
+                    if job:
+                        break
+                    self._condition.wait()
+                if not self._is_running:
+                    return
+                job.started = True
+                self._active_per_host[job.host] = self._active_per_host.get(job.host, 0) + 1
+
+            data, error = None, None
+            try:
+                if self.cache:
+                    body = self.cache.fetch(self.session, job.url, self.timeout)
+                else:
+                    response = self.session.get(job.url, timeout=self.timeout)
+                    response.raise_for_status()
+                    body = response.content
+                data = json.loads(body)
+            except ValueError:
+                error = "Invalid JSON response"
+            except requests.exceptions.RequestException as e:
+                error = str(e)
+            except sqlite3.Error as e:
+                error = f"Cache error: {e}"
+            except Exception as e:
+                # Anything else must not kill the worker either; on_error tells the requesters
+                error = f"Unexpected error: {e!r}"
+            finally:
+                # Also runs on BaseException, so the host slot and the job are never leaked
+                with self._condition:
+                    self._active_per_host[job.host] -= 1
+                    if self._jobs_by_url.get(job.url) is job:
+                        del self._jobs_by_url[job.url]
+                    request_ids = list(job.request_ids)
+                    for request_id in request_ids:
+                        self._jobs_by_request.pop(request_id, None)
+                    is_running = self._is_running
+                    self._condition.notify_all()
+
+            if not is_running or not request_ids:
+                continue
+            self._deliver(request_ids, data, error)
+
+    def _deliver(self, request_ids, data, error):
+        """ Invokes on_success or on_error; a callback that raises must not end the worker. """
+        try:
+            if error is None:
+                self.on_success(request_ids, data)
+                return
+        except Exception as e:
+            error = f"Unexpected error: {e!r}"
+        try:
+            self.on_error(request_ids, error)
+        except Exception:
+            # Nowhere left to report it; the requesters are not answered
+            pass
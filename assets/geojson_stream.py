@@ -0,0 +1,91 @@
+# This module contains an incremental parser for the features of GeoJSON FeatureCollections.
+
+import codecs
+import json
+import re
+
+# Start of the features array; everything before it (type, name, crs, ...) is skipped.
+_FEATURES_PATTERN = re.compile(r'"features"\s*:\s*\[')
+# Whitespace and commas between the features of the array.
+_SEPARATOR_PATTERN = re.compile(r"[\s,]*")
+
+
+class FeatureStreamParser:
+    """
+    Parses the 'features' array of a FeatureCollection from chunks of bytes as they
+    arrive, so features can be filtered (and the download abandoned) long before the
+    document is complete. Only whole features are kept in memory; members of the
+    collection after the features array are ignored.
+    """
+
+    def __init__(self, keep=None):
+        """
+        Args:
+            keep (callable): Optional predicate; only features it accepts are kept.
+        """
+        self.keep = keep
+        self.features = []
+        self.feature_count = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._in_array = False
+        self._done = False
+        # A feature that is still incomplete is only decoded again once this much text is pending
+        self._retry_size = 0
+
+    def feed(self, chunk):
+        """ Parses the features completed by a chunk of the document. """
+        if self._done:
+            return
+        self._buffer += self._decoder.decode(chunk)
+        self._parse()
+
+    def close(self):
+        """
+        Finishes parsing and returns the FeatureCollection of the kept features.
+
+        Raises:
+            json.JSONDecodeError: If the document ended before its features array did.
+        """
+        self._buffer += self._decoder.decode(b"", final=True)
+        self._retry_size = 0
+        self._parse()
+        if not self._done:
+            raise json.JSONDecodeError("Incomplete FeatureCollection", self._buffer, len(self._buffer))
+        return {"type": "FeatureCollection", "features": self.features}
+
+    def _parse(self):
+        if self._done:
+            return
+        buffer = self._buffer
+        position = 0
+        if not self._in_array:
+            match = _FEATURES_PATTERN.search(buffer)
+            if not match:
+                return
+            self._in_array = True
+            position = match.end()
+
+        while True:
+            position = _SEPARATOR_PATTERN.match(buffer, position).end()
+            if position >= len(buffer) or len(buffer) - position < self._retry_size:
+                break
+            if buffer[position] == "]":
+                self._done = True
+                position += 1
+                break
+            if buffer[position] != "{":
+                raise json.JSONDecodeError("Expected a feature object", buffer, position)
+            try:
+                feature, position = self._json.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Most likely cut off by the end of the chunk; doubling the wait keeps
+                # large features from being decoded over and over
+                self._retry_size = 2 * (len(buffer) - position)
+                break
+            self._retry_size = 0
+            self.feature_count += 1
+            if self.keep is None or self.keep(feature):
+                self.features.append(feature)
+        self._buffer = buffer[position:]
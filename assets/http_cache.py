@@ -0,0 +1,345 @@
+# This module contains a persistent, size-capped HTTP response cache backed by SQLite.
+
+import email.utils
+import marshal
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+# Default upper limit for the stored response bodies.
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Lifetime used for responses marked as immutable.
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# zlib level for compressed caches; the fastest level already shrinks JSON several-fold.
+COMPRESSION_LEVEL = 1
+# Size of the chunks a streamed body is handed to its consumer in.
+STREAM_CHUNK_SIZE = 256 * 1024
+# Access times are only rewritten when they are older than this, so hits need no write.
+ACCESS_RESOLUTION = 3600
+
+_MAX_AGE_PATTERN = re.compile(r"max-age\s*=\s*(\d+)")
+
+
+def _parse_http_date(value):
+    """ Converts an HTTP date header to a unix timestamp, or None if it is invalid. """
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpCache:
+    """
+    A persistent cache for GET responses that honours ETag, Last-Modified and
+    Cache-Control. Entries are evicted least-recently-used first once the total
+    body size exceeds max_bytes. Safe to use from several threads.
+
+    Optionally bodies are stored zlib-compressed, and fetch_parsed keeps the parsed
+    form of a body next to it so that it does not have to be parsed again.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, default_max_age=0, min_max_age=0, compress=False):
+        """
+        Opens (or creates) the cache database.
+
+        Args:
+            path (str): Path of the SQLite file.
+            max_bytes (int): Size cap for all stored bodies.
+            default_max_age (int): Lifetime in seconds for responses that carry no
+                freshness information of their own.
+            min_max_age (int): Lower bound in seconds for the lifetime of every
+                response, for data that changes far less often than its server claims.
+            compress (bool): Store new bodies zlib-compressed.
+        """
+        self.max_bytes = max_bytes
+        self.default_max_age = default_max_age
+        self.min_max_age = min_max_age
+        self.compress = compress
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                expires REAL NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                encoding TEXT NOT NULL DEFAULT 'identity',
+                parsed BLOB,
+                parsed_encoding TEXT NOT NULL DEFAULT 'identity'
+            )
+        """)
+        # Databases created before compression and parsed bodies existed
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(responses)")}
+        if "encoding" not in columns:
+            self._db.execute("ALTER TABLE responses ADD COLUMN encoding TEXT NOT NULL DEFAULT 'identity'")
+        if "parsed" not in columns:
+            self._db.execute("ALTER TABLE responses ADD COLUMN parsed BLOB")
+        if "parsed_encoding" not in columns:
+            self._db.execute("ALTER TABLE responses ADD COLUMN parsed_encoding TEXT NOT NULL DEFAULT 'identity'")
+            # How the existing parsed forms were written is unknown; they are rebuilt on the next fetch_parsed
+            self._db.execute(
+                "UPDATE responses SET size = size - LENGTH(parsed), parsed = NULL WHERE parsed IS NOT NULL"
+            )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._db.commit()
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def fetch(self, session, url, timeout, consume=None):
+        """
+        Returns the body for url, served from the cache while it is fresh and
+        revalidated with a conditional request once it is stale.
+
+        Args:
+            consume (callable): Optional; a downloaded body is then streamed and
+                consume(chunk) is called for every chunk as it arrives. Bodies
+                served from the cache are not passed to it.
+
+        Raises:
+            requests.exceptions.RequestException: If the upstream request fails.
+            Anything consume raises; the download is then abandoned and not stored.
+        """
+        entry = self._lookup(url)
+        headers = {}
+        if entry:
+            body, etag, last_modified, expires = entry
+            if expires > time.time():
+                self._count("hits")
+                return body
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        response = session.get(url, timeout=timeout, headers=headers, stream=consume is not None)
+        with response:
+            if entry and response.status_code == 304:
+                self._count("revalidated")
+                self._refresh(url, response)
+                return entry[0]
+
+            response.raise_for_status()
+            if consume is None:
+                body = response.content
+            else:
+                chunks = []
+                for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                    consume(chunk)
+                    chunks.append(chunk)
+                body = b"".join(chunks)
+        self._count("misses")
+        self._store(url, response, body)
+        return body
+
+    def fetch_parsed(self, session, url, timeout, parse, consume=None):
+        """
+        Like fetch, but returns parse(body). The result is stored next to the body in
+        marshal form and reused for as long as the body is fresh or unchanged upstream,
+        which is considerably faster than parsing e.g. a large JSON document again.
+
+        Args:
+            parse (callable): Turns the body bytes into a value marshal can store
+                (dicts, lists, strings, numbers, booleans and None).
+            consume (callable): Passed on to fetch, e.g. to parse a download
+                incrementally; parse then only has to finish that work.
+
+        Raises:
+            requests.exceptions.RequestException: If the upstream request fails.
+            Anything parse raises.
+        """
+        found, value = self._load_parsed(url, fresh_only=True)
+        if found:
+            self._count("hits")
+            return value
+        body = self.fetch(session, url, timeout, consume)
+        # A 304 keeps the stored parsed form, a new body has cleared it
+        found, value = self._load_parsed(url, fresh_only=False)
+        if found:
+            return value
+        value = parse(body)
+        self._store_parsed(url, value)
+        return value
+
+    def stats(self):
+        """ Returns the hit/miss counters and the current size of the cache. """
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            total_bytes = self._total_bytes
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self):
+        """ Removes every stored response and resets the counters. """
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._total_bytes = 0
+            self.hits = self.revalidated = self.misses = 0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _server_expiry_for(self, response):
+        """ Computes the expiry timestamp the response headers allow, or None if it must not be stored. """
+        now = time.time()
+        cache_control = response.headers.get("Cache-Control", "").lower()
+        if "no-store" in cache_control:
+            return None
+        if "no-cache" in cache_control:
+            return now
+        if "immutable" in cache_control:
+            return now + IMMUTABLE_MAX_AGE
+        match = _MAX_AGE_PATTERN.search(cache_control)
+        if match:
+            return now + int(match.group(1))
+        expires = _parse_http_date(response.headers.get("Expires"))
+        if expires is not None:
+            return expires
+        # Heuristic freshness (RFC 7234, 4.2.2): a tenth of the time since the last change
+        last_modified = _parse_http_date(response.headers.get("Last-Modified"))
+        date = _parse_http_date(response.headers.get("Date")) or now
+        if last_modified is not None and date > last_modified:
+            return now + max((date - last_modified) / 10, self.default_max_age)
+        return now + self.default_max_age
+
+    def _expiry_for(self, response):
+        """ Computes the expiry timestamp of a response, or None if it must not be stored. """
+        expires = self._server_expiry_for(response)
+        if expires is None:
+            return None
+        return max(expires, time.time() + self.min_max_age)
+
+    def _touch_locked(self, url, last_access):
+        """ Moves url to the recently used end of the eviction order, at most once per ACCESS_RESOLUTION. """
+        now = time.time()
+        if now - last_access > ACCESS_RESOLUTION:
+            self._db.execute("UPDATE responses SET last_access = ? WHERE url = ?", (now, url))
+            self._db.commit()
+
+    def _lookup(self, url):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, last_modified, expires, encoding, last_access FROM responses WHERE url = ?",
+                (url,)
+            ).fetchone()
+            if row:
+                self._touch_locked(url, row[5])
+        if not row:
+            return None
+        body, etag, last_modified, expires, encoding, _ = row
+        if encoding == "zlib":
+            body = zlib.decompress(body)
+        return body, etag, last_modified, expires
+
+    def _load_parsed(self, url, fresh_only):
+        """ Returns (found, value) for the stored parsed form of url's body. """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT parsed, parsed_encoding, expires, last_access FROM responses "
+                "WHERE url = ? AND parsed IS NOT NULL", (url,)
+            ).fetchone()
+            if not row or (fresh_only and row[2] <= time.time()):
+                return False, None
+            self._touch_locked(url, row[3])
+        parsed, encoding = row[0], row[1]
+        try:
+            return True, marshal.loads(zlib.decompress(parsed) if encoding == "zlib" else parsed)
+        except (EOFError, ValueError, TypeError, zlib.error):
+            # Written by another Python version; parse again
+            return False, None
+
+    def _store_parsed(self, url, value):
+        try:
+            parsed = marshal.dumps(value)
+        except ValueError:
+            return
+        encoding = "identity"
+        if self.compress:
+            parsed, encoding = zlib.compress(parsed, COMPRESSION_LEVEL), "zlib"
+        with self._lock:
+            row = self._db.execute("SELECT size, parsed FROM responses WHERE url = ?", (url,)).fetchone()
+            if not row:
+                return
+            old_parsed_size = len(row[1]) if row[1] is not None else 0
+            size = row[0] - old_parsed_size + len(parsed)
+            self._db.execute(
+                "UPDATE responses SET parsed = ?, parsed_encoding = ?, size = ? WHERE url = ?",
+                (parsed, encoding, size, url)
+            )
+            self._total_bytes += size - row[0]
+            self._evict_locked()
+            self._db.commit()
+
+    def _refresh(self, url, response):
+        expires = self._expiry_for(response)
+        with self._lock:
+            if expires is None:
+                self._delete_locked(url)
+            else:
+                self._db.execute("UPDATE responses SET expires = ? WHERE url = ?", (expires, url))
+            self._db.commit()
+
+    def _store(self, url, response, body):
+        expires = self._expiry_for(response)
+        encoding = "identity"
+        if self.compress:
+            body, encoding = zlib.compress(body, COMPRESSION_LEVEL), "zlib"
+        with self._lock:
+            # The new response replaces the old one even if it is not cached itself
+            self._delete_locked(url)
+            if expires is None or len(body) > self.max_bytes:
+                self._db.commit()
+                return
+            self._db.execute(
+                "INSERT INTO responses (url, body, etag, last_modified, expires, size, last_access, encoding) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, body, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                 expires, len(body), time.time(), encoding)
+            )
+            self._total_bytes += len(body)
+            self._evict_locked()
+            self._db.commit()
+
+    def _delete_locked(self, url):
+        row = self._db.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+        if row:
+            self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self._total_bytes -= row[0]
+
+    def _evict_locked(self):
+        """ Deletes the least recently used entries until the size cap is met. """
+        while self._total_bytes > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT url, size FROM responses ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self._total_bytes -= size
@@ -0,0 +1,176 @@
+# This module contains the build step that rasterises the map icons into sprite sheets.
+
+import base64
+import hashlib
+import json
+import os
+from urllib.parse import unquote
+
+from PyQt6.QtCore import QByteArray, QRectF, Qt
+from PyQt6.QtGui import QImage, QPainter
+from PyQt6.QtSvg import QSvgRenderer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+# Pixel ratios a sprite sheet is rendered for.
+ATLAS_SCALES = (1, 2)
+# Maximum width in CSS pixels of a sprite sheet row.
+ATLAS_MAX_WIDTH = 256
+# Free pixels around every icon, so neighbours do not bleed in when the sheet is scaled.
+ATLAS_PADDING = 1
+# Bump when the layout or file format changes, so existing cached atlases are rebuilt.
+ATLAS_VERSION = 1
+
+
+def find_file(path):
+    """
+    Returns path, or a file in the same directory whose name only differs in case.
+    Icon names in map_assets do not always match the case of the files on disk.
+    """
+    if os.path.isfile(path):
+        return path
+    directory, name = os.path.split(path)
+    if not os.path.isdir(directory):
+        return None
+    for entry in os.listdir(directory):
+        if entry.lower() == name.lower():
+            return os.path.join(directory, entry)
+    return None
+
+
+def icon_source(icon_url):
+    """
+    Returns the SVG bytes of an icon given as data URI or as path relative to the project.
+
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If a data URI cannot be decoded.
+    """
+    if icon_url.startswith("data:"):
+        header, _, payload = icon_url.partition(",")
+        if header.endswith(";base64"):
+            return base64.b64decode(payload)
+        return unquote(payload).encode("utf-8")
+    path = find_file(os.path.join(ROOT_DIR, icon_url))
+    if path is None:
+        raise OSError(f"Icon file not found: {icon_url}")
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _layout(sizes):
+    """
+    Packs icon sizes into rows (tallest first) and returns the positions by source
+    digest together with the sheet size, all in CSS pixels.
+    """
+    positions = {}
+    x = y = row_height = sheet_width = 0
+    for digest, (width, height) in sorted(sizes.items(), key=lambda item: (-item[1][1], item[0])):
+        if x and x + width + ATLAS_PADDING > ATLAS_MAX_WIDTH:
+            x, y, row_height = 0, y + row_height + ATLAS_PADDING, 0
+        positions[digest] = (x, y)
+        x += width + ATLAS_PADDING
+        row_height = max(row_height, height)
+        sheet_width = max(sheet_width, x)
+    return positions, sheet_width, y + row_height
+
+
+def _render_sheet(sources, sizes, positions, width, height, scale):
+    image = QImage(max(width, 1) * scale, max(height, 1) * scale, QImage.Format.Format_ARGB32_Premultiplied)
+    image.fill(Qt.GlobalColor.transparent)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    for digest, (x, y) in positions.items():
+        icon_width, icon_height = sizes[digest]
+        renderer = QSvgRenderer(QByteArray(sources[digest]))
+        renderer.render(painter, QRectF(x * scale, y * scale, icon_width * scale, icon_height * scale))
+    painter.end()
+    return image
+
+
+def build_icon_atlas(icons, cache_dir):
+    """
+    Rasterises all SVG icons into one sprite sheet per scale in ATLAS_SCALES and
+    returns its lookup table. Icons with identical content share one sprite. The
+    result is stored in cache_dir under a hash of the icon contents and sizes, so it
+    is only rendered again when an icon changes.
+
+    Args:
+        icons (dict): Leaflet icon options by icon key (see map_assets.icons).
+        cache_dir (str): Directory for the sheets and their lookup tables.
+
+    Returns:
+        dict: {'hash', 'width', 'height', 'sheets': {scale: file name},
+        'icons': {key: {'x', 'y', 'width', 'height'}}} in CSS pixels. Icons that
+        could not be read or rendered are left out, so the page keeps using their
+        original URL.
+    """
+    sources = {}
+    sizes = {}
+    icon_digests = {}
+    for key, icon in icons.items():
+        try:
+            source = icon_source(icon["iconUrl"])
+        except (OSError, ValueError) as e:
+            print(f"Icon '{key}' is left out of the atlas: {e}")
+            continue
+        width, height = icon.get("iconSize", [32, 32])
+        digest = hashlib.sha1(source + f"@{width}x{height}".encode("ascii")).hexdigest()
+        sources[digest] = source
+        sizes[digest] = (width, height)
+        icon_digests[key] = digest
+
+    atlas_hash = hashlib.sha256(
+        json.dumps([ATLAS_VERSION, ATLAS_SCALES, sorted(icon_digests.items())]).encode("utf-8")
+    ).hexdigest()[:16]
+    table_file = os.path.join(cache_dir, f"{atlas_hash}.json")
+    try:
+        with open(table_file, "r", encoding="utf-8") as f:
+            atlas = json.load(f)
+        if all(os.path.isfile(os.path.join(cache_dir, name)) for name in atlas["sheets"].values()):
+            return atlas
+    except (OSError, ValueError, KeyError):
+        pass
+
+    invalid = {digest for digest, source in sources.items() if not QSvgRenderer(QByteArray(source)).isValid()}
+    for key in [key for key, digest in icon_digests.items() if digest in invalid]:
+        print(f"Icon '{key}' is left out of the atlas: invalid SVG")
+        del icon_digests[key]
+    for digest in invalid:
+        del sources[digest], sizes[digest]
+
+    positions, width, height = _layout(sizes)
+    os.makedirs(cache_dir, exist_ok=True)
+    sheets = {}
+    for scale in ATLAS_SCALES:
+        name = f"{atlas_hash}@{scale}x.png"
+        image = _render_sheet(sources, sizes, positions, width, height, scale)
+        if not image.save(os.path.join(cache_dir, name), "PNG"):
+            raise OSError(f"Could not write icon atlas {name}")
+        sheets[str(scale)] = name
+
+    atlas = {
+        "hash": atlas_hash,
+        "width": width,
+        "height": height,
+        "sheets": sheets,
+        "icons": {
+            key: {
+                "x": positions[digest][0],
+                "y": positions[digest][1],
+                "width": sizes[digest][0],
+                "height": sizes[digest][1],
+            }
+            for key, digest in icon_digests.items()
+        },
+    }
+    with open(table_file, "w", encoding="utf-8") as f:
+        json.dump(atlas, f)
+    _remove_stale_atlases(cache_dir, atlas_hash)
+    return atlas
+
+
+def _remove_stale_atlases(cache_dir, current_hash):
+    """ Deletes the sheets and tables of atlases built for earlier icon sets. """
+    for entry in os.listdir(cache_dir):
+        if not entry.startswith(current_hash) and (entry.endswith(".png") or entry.endswith(".json")):
+            os.remove(os.path.join(cache_dir, entry))
@@ -179,7 +179,7 @@ L.UtfGrid = (L.Layer || L.Class).extend({
 
 	_objectForEvent: function (e) {
 		var point = this._map.project(e.latlng);
-		var_tile = this._getTile(point);
+		var tile = this._getTile(point);
 		if (!tile) {
 			return null;
 		}
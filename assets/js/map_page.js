@@ -0,0 +1,969 @@
+// Static part of the map page. Everything that depends on the application state is
+// passed in through window.mapConfig (see MapWidget.create_map_html_file), so this file
+// never changes at runtime and QtWebEngine can cache its compiled code.
+
+var map, searchMarker;
+var baseLayers = {};
+var terrainLayerInfo = {};
+var terrainLayers = {};
+var activeTerrainKey = null;
+var warmTerrainKeys = [];
+var terrainUpdateTimer = null;
+const TERRAIN_WARM_POOL_SIZE = 2;
+const TERRAIN_UPDATE_DELAY_MS = 150;
+var poiLayers = {};
+var permanentMarkers = {};
+// Version of the permanent markers shown (see MarkerSync in assets/marker_sync.py); null until the first full diff
+var permanentMarkersVersion = null;
+var markerResyncRequested = false;
+var isTerrainAutoMode = false;
+var currentTerrainOpacity = 0.7;
+var allPoiDataFromPython = {};
+// POI indices per layer to show while a region filter is set (see filter_pois_by_region in main.py)
+var poiRegionFilter = null;
+var borderLayers = {};
+var borderLevelZooms = {};
+var borderLevelShown = {};
+var borderViewBounds = {};
+// Fraction of the view size loaded around it on every side, so small pans need no new request
+const BORDER_VIEW_PADDING = 0.5;
+var borderWorker = null;
+// Latest message per layer still being prepared by the worker, redone here if the worker fails
+var borderWorkerMessages = {};
+// Zoom levels whose border paths a canvas border layer keeps (see BorderCanvasLayer)
+const BORDER_PATH_CACHE_ZOOMS = 4;
+var borderRequestIds = {};
+var nextBorderRequestId = 0;
+var selectedAreaRect = null;
+
+const terrainData = mapConfig.terrainData;
+const baseLayerData = mapConfig.baseLayers;
+const icons_data = mapConfig.icons;
+const cultureColors = mapConfig.cultureColors;
+const iconAtlas = mapConfig.iconAtlas;
+const icons = {};
+var atlasImages = {};
+// Layer URLs starting with '/' point at the local tile cache server. Its port changes with
+// every start, so it is passed in the page URL instead of being written into the page.
+const tileServerUrl = new URLSearchParams(window.location.search).get('tileServer') || '';
+
+function resolveTileUrl(url) { return url.startsWith('/') ? tileServerUrl + url : url; }
+
+// Icons in the atlas are cut from one pre-rasterised sprite sheet (1x or 2x, picked by
+// the browser), so the sheet is decoded once instead of rasterising an SVG per marker.
+function installIconAtlasStyle() {
+    if (!iconAtlas) return;
+    const imageSet = Object.keys(iconAtlas.sheets).map(scale => `url("${iconAtlas.sheets[scale]}") ${scale}x`).join(', ');
+    const style = document.createElement('style');
+    style.textContent = `.atlas-icon {
+        background-image: -webkit-image-set(${imageSet});
+        background-image: image-set(${imageSet});
+        background-size: ${iconAtlas.width}px ${iconAtlas.height}px;
+        background-repeat: no-repeat;
+    }`;
+    document.head.appendChild(style);
+}
+
+function createIcon(key, options) {
+    const sprite = iconAtlas && iconAtlas.icons[key];
+    if (!sprite) return L.icon(options);
+    const iconOptions = {
+        className: 'atlas-marker',
+        html: `<div class="atlas-icon" style="width:${sprite.width}px;height:${sprite.height}px;background-position:-${sprite.x}px -${sprite.y}px"></div>`,
+        iconSize: [sprite.width, sprite.height]
+    };
+    if (options.iconAnchor) iconOptions.iconAnchor = options.iconAnchor;
+    if (options.popupAnchor) iconOptions.popupAnchor = options.popupAnchor;
+    return L.divIcon(iconOptions);
+}
+
+// Canvas counterpart of createIcon: draws an atlas icon centred on (x, y) from the sheet
+// matching the device pixel ratio. Returns false if the icon is not in the atlas or the
+// sheet is still loading.
+function drawAtlasIcon(ctx, key, x, y) {
+    const sprite = iconAtlas && iconAtlas.icons[key];
+    if (!sprite) return false;
+    const scale = window.devicePixelRatio > 1 && iconAtlas.sheets['2'] ? 2 : 1;
+    if (!atlasImages[scale]) {
+        atlasImages[scale] = new Image();
+        atlasImages[scale].src = iconAtlas.sheets[scale];
+    }
+    const image = atlasImages[scale];
+    if (!image.complete || !image.naturalWidth) return false;
+    ctx.drawImage(image, sprite.x * scale, sprite.y * scale, sprite.width * scale, sprite.height * scale,
+        x - sprite.width / 2, y - sprite.height / 2, sprite.width, sprite.height);
+    return true;
+}
+
+function log(msg) { if(window.bridge) window.bridge.log(msg); }
+
+document.addEventListener('DOMContentLoaded', () => {
+    new QWebChannel(qt.webChannelTransport, channel => {
+        window.bridge = channel.objects.bridge;
+        initializeMap();
+    });
+});
+
+function initializeMap() {
+    var requestCallbacks = {};
+    L.Util.ajax = function(url, callback, errorCallback) {
+        const requestId = 'req_' + Math.random().toString(36).substr(2, 9);
+        requestCallbacks[requestId] = { onSuccess: callback, onError: errorCallback };
+        window.bridge.fetchUrl(requestId, url);
+        return requestId;
+    };
+
+    window.cancelFetch = function(requestId) {
+        if (requestCallbacks[requestId]) {
+            delete requestCallbacks[requestId];
+            window.bridge.cancelFetch(requestId);
+        }
+    };
+
+    window.onDataFetched = function(requestId, data) {
+        const callbacks = requestCallbacks[requestId];
+        if (callbacks) {
+            delete requestCallbacks[requestId];
+            callbacks.onSuccess(data);
+        }
+    };
+
+    window.onDataFetchError = function(requestId, error) {
+        log(`Fetch error for ${requestId}: ${error}`);
+        const callbacks = requestCallbacks[requestId];
+        delete requestCallbacks[requestId];
+        if (callbacks && callbacks.onError) callbacks.onError(error);
+    };
+
+    installIconAtlasStyle();
+    for (const key in icons_data) {
+        if (icons_data.hasOwnProperty(key)) {
+            icons[key] = createIcon(key, icons_data[key]);
+        }
+    }
+
+    map = L.map('map', { crs: L.CRS.EPSG3857, center: [49.5, 12.5], zoom: 6 });
+
+    for (const name in baseLayerData) {
+        baseLayers[name] = L.tileLayer(resolveTileUrl(baseLayerData[name].url), baseLayerData[name].options);
+    }
+    baseLayers[Object.keys(baseLayers)[0]].addTo(map);
+
+    L.control.layers(baseLayers).addTo(map);
+
+    var dareUtfGrid = L.utfGrid('https://dh.gu.se/tiles/pleiades/{z}/{x}/{y}.grid.json', {
+        resolution: 4,
+        useJsonP: false
+    });
+
+    dareUtfGrid.on('click', function (e) {
+        if (e.data) {
+            const key = Object.keys(e.data)[0];
+            if (key) {
+                const placeInfo = e.data[key];
+                var content = `<b>${placeInfo.name}</b><br><a href="${placeInfo.pleiades_url}" target="_blank">Details auf Pleiades ansehen</a>`;
+                L.popup()
+                    .setLatLng(e.latlng)
+                    .setContent(content)
+                    .openOn(map);
+            }
+        }
+    });
+    dareUtfGrid.on('mouseover', function (e) { map.getContainer().style.cursor = 'pointer'; });
+    dareUtfGrid.on('mouseout', function (e) { map.getContainer().style.cursor = ''; });
+
+    map.on('baselayerchange', function (e) {
+        if (e.name === 'Roman Empire') {
+            map.addLayer(dareUtfGrid);
+        } else {
+            if (map.hasLayer(dareUtfGrid)) {
+                map.removeLayer(dareUtfGrid);
+            }
+        }
+    });
+
+    map.createPane('terrainPane').style.zIndex = 450;
+    map.getPane('terrainPane').style.pointerEvents = 'none';
+    map.createPane('borderPane').style.zIndex = 500;
+    map.getPane('borderPane').style.pointerEvents = 'none';
+
+    // Terrain layers are only created once they are selected (see getTerrainLayer)
+    terrainLayerInfo = terrainData.layers;
+
+    borderWorker = createBorderWorker();
+    borderLayers[4] = createBorderLayer({ color: '#0000FF', weight: 2, fillOpacity: 0.05 });
+
+    map.on('contextmenu', e => window.bridge.onMapRightClicked(e.latlng.lat, e.latlng.lng));
+    map.on('moveend zoomend', scheduleAutoTerrainUpdate);
+    map.on('moveend', requestBorderViews);
+
+    if(window.bridge) window.bridge.onMapReady();
+}
+
+// Keeps UtfGrid tiles of all zoom levels in a bounded LRU cache, tracks in-flight
+// requests so duplicates are not sent, cancels requests for tiles that are no
+// longer wanted and prefetches neighbouring and parent tiles while the page is idle.
+L.UtfGrid.mergeOptions({ maxCachedTiles: 512, prefetchRadius: 1 });
+L.UtfGrid.include({
+    _tileCache: function() {
+        if (!this._lru) this._lru = new Map();
+        return this._lru;
+    },
+    _cacheGet: function(key) {
+        const cache = this._tileCache();
+        const tile = cache.get(key);
+        if (tile) {
+            cache.delete(key);
+            cache.set(key, tile);
+        }
+        return tile;
+    },
+    _cacheSet: function(key, tile) {
+        const cache = this._tileCache();
+        cache.delete(key);
+        cache.set(key, tile);
+        while (cache.size > this.options.maxCachedTiles) {
+            cache.delete(cache.keys().next().value);
+        }
+    },
+    _loadTile: function(coords) {
+        const key = this._tileCoordsToKey(coords);
+        this._pending = this._pending || {};
+        if (this._tileCache().has(key) || this._pending[key]) return;
+        this._pending[key] = L.Util.ajax(this.getTileUrl(coords), L.bind(function(data) {
+            delete this._pending[key];
+            this._cacheSet(key, data);
+            if (this._map && coords.z === this._map.getZoom()) this._update();
+        }, this), L.bind(function() {
+            delete this._pending[key];
+        }, this));
+    },
+    _getTile: function(point) {
+        const coords = this._getTileCoords(point);
+        const tile = this._cacheGet(this._tileCoordsToKey(coords));
+        if (!tile) {
+            this._loadTile(coords);
+            return null;
+        }
+        const origin = this._getTilePoint(coords);
+        tile.x = origin.x;
+        tile.y = origin.y;
+        return tile;
+    },
+    _onZoom: function() {
+        this._cancelUnwanted();
+        this._update();
+        this._schedulePrefetch();
+    },
+    _onMove: function() {
+        this._cancelUnwanted();
+        this._update();
+        this._schedulePrefetch();
+    },
+    onRemove: function() {
+        this._cancelUnwanted(true);
+        this._removeEvents();
+        this._mouseOn = null;
+        if (this.options.useJsonP) delete window[this._windowKey];
+    },
+    // Tile range of the current view at the given zoom, grown by margin tiles.
+    _tileRange: function(zoom, margin) {
+        const bounds = this._map.getBounds();
+        const tileSize = this.options.tileSize;
+        const min = this._map.project(bounds.getNorthWest(), zoom).divideBy(tileSize).floor();
+        const max = this._map.project(bounds.getSouthEast(), zoom).divideBy(tileSize).floor();
+        const last = Math.pow(2, zoom) - 1;
+        return {
+            z: zoom,
+            minX: Math.max(min.x - margin, 0), maxX: Math.min(max.x + margin, last),
+            minY: Math.max(min.y - margin, 0), maxY: Math.min(max.y + margin, last)
+        };
+    },
+    _wantedRanges: function() {
+        const zoom = this._map.getZoom();
+        const ranges = [this._tileRange(zoom, this.options.prefetchRadius)];
+        if (zoom - 1 >= this.options.minZoom) ranges.push(this._tileRange(zoom - 1, 0));
+        return ranges;
+    },
+    _cancelUnwanted: function(cancelAll) {
+        if (!this._pending) return;
+        const ranges = cancelAll ? [] : this._wantedRanges();
+        for (const key in this._pending) {
+            const [z, x, y] = key.split('/').map(Number);
+            const isWanted = ranges.some(r => r.z === z && x >= r.minX && x <= r.maxX && y >= r.minY && y <= r.maxY);
+            if (!isWanted) {
+                window.cancelFetch(this._pending[key]);
+                delete this._pending[key];
+            }
+        }
+    },
+    _schedulePrefetch: function() {
+        if (this._prefetchHandle) return;
+        const idle = window.requestIdleCallback || (cb => setTimeout(cb, 200));
+        this._prefetchHandle = idle(L.bind(function() {
+            this._prefetchHandle = null;
+            this._prefetch();
+        }, this));
+    },
+    _prefetch: function() {
+        if (!this._map) return;
+        const zoom = this._map.getZoom();
+        if (zoom > this.options.maxZoom || zoom < this.options.minZoom) return;
+        this._wantedRanges().forEach(r => {
+            for (let x = r.minX; x <= r.maxX; x++) {
+                for (let y = r.minY; y <= r.maxY; y++) {
+                    this._loadTile({ x: x, y: y, z: r.z });
+                }
+            }
+        });
+    }
+});
+
+function getTerrainLayer(key) {
+    if (!terrainLayers[key]) {
+        const layerInfo = terrainLayerInfo[key];
+        const layerOptions = { ...layerInfo.options, pane: 'terrainPane' };
+        if (layerInfo.url.includes('{z}')) {
+            terrainLayers[key] = L.tileLayer(resolveTileUrl(layerInfo.url), layerOptions);
+        } else {
+            terrainLayers[key] = L.tileLayer.wms(resolveTileUrl(layerInfo.url), layerOptions);
+        }
+    }
+    return terrainLayers[key];
+}
+
+// Shows only the target terrain layer. The previous layer stays on the map until
+// the new one has loaded (avoids flicker) and is then kept as a warm instance so
+// switching back is cheap; older instances are dropped.
+function setActiveTerrainLayer(targetKey) {
+    if (targetKey && !terrainLayerInfo[targetKey]) targetKey = null;
+    const previousKey = activeTerrainKey;
+    activeTerrainKey = targetKey;
+
+    if (targetKey) {
+        const layer = getTerrainLayer(targetKey).setOpacity(currentTerrainOpacity);
+        if (!map.hasLayer(layer)) map.addLayer(layer);
+        warmTerrainKeys = [targetKey, ...warmTerrainKeys.filter(key => key !== targetKey)];
+    }
+    if (previousKey && previousKey !== targetKey) {
+        const previousLayer = terrainLayers[previousKey];
+        const retire = () => {
+            if (activeTerrainKey !== previousKey && map.hasLayer(previousLayer)) map.removeLayer(previousLayer);
+        };
+        const activeLayer = targetKey && terrainLayers[targetKey];
+        if (activeLayer && activeLayer.isLoading && activeLayer.isLoading()) {
+            activeLayer.once('load', retire);
+        } else {
+            retire();
+        }
+    }
+    for (const key of warmTerrainKeys.splice(TERRAIN_WARM_POOL_SIZE)) {
+        if (key !== activeTerrainKey && terrainLayers[key]) {
+            if (map.hasLayer(terrainLayers[key])) map.removeLayer(terrainLayers[key]);
+            delete terrainLayers[key];
+        }
+    }
+}
+
+// Looks up the terrain layer for a position in the precomputed grid index: only the
+// regions registered for the position's cell are tested, in priority order.
+function findTerrainLayerKey(center, zoom) {
+    const index = terrainData.index;
+    const cell = Math.floor(center.lat / index.cellSize) + '_' + Math.floor(center.lng / index.cellSize);
+    for (const regionIndex of index.cells[cell] || []) {
+        const region = terrainData.regions[regionIndex];
+        const [[south, west], [north, east]] = region.bounds;
+        if (center.lat >= south && center.lat <= north && center.lng >= west && center.lng <= east) {
+            const rule = region.logic.find(([minZoom]) => zoom >= minZoom);
+            return rule ? rule[1] : null;
+        }
+    }
+    return null;
+}
+
+function scheduleAutoTerrainUpdate() {
+    clearTimeout(terrainUpdateTimer);
+    terrainUpdateTimer = setTimeout(updateAutoTerrain, TERRAIN_UPDATE_DELAY_MS);
+}
+
+function updateAutoTerrain() {
+    if (!isTerrainAutoMode) {
+        setActiveTerrainLayer(null);
+        map.getContainer().style.filter = 'none';
+        return;
+    }
+
+    const zoom = map.getZoom();
+    const targetKey = findTerrainLayerKey(map.getCenter(), zoom);
+    setActiveTerrainLayer(targetKey);
+
+    const mapContainer = map.getContainer();
+    let filterStyle = (zoom >= 15 && targetKey) ? 'brightness(70%) contrast(120%)' : 'none';
+    mapContainer.style.filter = filterStyle;
+}
+
+// Border layers come in several resolution levels (see simplify.BorderLevels). The page
+// only holds the polygons around the current view in the level for the current zoom, and
+// asks Python for new ones once the view leaves the loaded area or the level changes.
+function borderLevelForZoom(zooms, zoom) {
+    let level = 0;
+    zooms.forEach((levelZoom, index) => { if (zoom >= levelZoom) level = index; });
+    return level;
+}
+
+function requestBorderViews() {
+    const zoom = map.getZoom();
+    const view = map.getBounds();
+    for (const layerId in borderLevelZooms) {
+        const layer = borderLayers[layerId];
+        if (!layer || !map.hasLayer(layer)) continue;
+        const level = borderLevelForZoom(borderLevelZooms[layerId], zoom);
+        if (borderLevelShown[layerId] === level && borderViewBounds[layerId] && borderViewBounds[layerId].contains(view)) {
+            continue;
+        }
+        const bounds = view.pad(BORDER_VIEW_PADDING);
+        borderLevelShown[layerId] = level;
+        borderViewBounds[layerId] = bounds;
+        window.bridge.requestBorderView(String(layerId), level,
+            bounds.getSouth(), bounds.getWest(), bounds.getNorth(), bounds.getEast());
+    }
+}
+
+window.setBorderLevels = function(layerId, zooms) {
+    borderLevelZooms[layerId] = zooms;
+    delete borderLevelShown[layerId];
+    delete borderViewBounds[layerId];
+    requestBorderViews();
+};
+
+// Decodes the compact topology of Topology.encode (topology.py) into GeoJSON: arcs are
+// delta-encoded positions on a grid, rings are lists of arc references (~i = reversed).
+function decodeTopology(topology) {
+    const [kx, ky] = topology.transform.scale;
+    const [tx, ty] = topology.transform.translate;
+    const arcs = topology.arcs.map(arc => {
+        let x = 0, y = 0;
+        return arc.map(delta => {
+            x += delta[0];
+            y += delta[1];
+            return [x * kx + tx, y * ky + ty];
+        });
+    });
+    const decodeRing = refs => {
+        const positions = [];
+        refs.forEach(ref => {
+            const arc = ref >= 0 ? arcs[ref] : arcs[~ref].slice().reverse();
+            for (let i = positions.length ? 1 : 0; i < arc.length; i++) positions.push(arc[i]);
+        });
+        return positions.length >= 4 ? positions : null;
+    };
+    const decodePolygon = rings => {
+        const decoded = rings.map(decodeRing);
+        return decoded.length && decoded[0] ? decoded.filter(ring => ring) : null;
+    };
+
+    const features = [];
+    topology.features.forEach(feature => {
+        let geometry = feature.geometry;
+        if (geometry && geometry.arcs) {
+            if (geometry.type === 'Polygon') {
+                const coordinates = decodePolygon(geometry.arcs);
+                if (!coordinates) return;
+                geometry = { type: 'Polygon', coordinates: coordinates };
+            } else {
+                const coordinates = geometry.arcs.map(decodePolygon).filter(polygon => polygon);
+                if (!coordinates.length) return;
+                geometry = { type: 'MultiPolygon', coordinates: coordinates };
+            }
+        }
+        features.push({ type: 'Feature', properties: feature.properties, geometry: geometry });
+    });
+    return { type: 'FeatureCollection', features: features };
+}
+
+// Projects the polygon rings of a FeatureCollection into zoom-0 pixel coordinates of
+// Leaflet's Web Mercator CRS; multiplying by 2^zoom and subtracting the map's pixel
+// origin turns them into layer points. Rings are stored back to back in one array.
+function projectBorderFeatures(geoJson) {
+    const MAX_LATITUDE = 85.0511287798;
+    const coords = [], rings = [0], ringBounds = [];
+    const addRing = ring => {
+        let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+        ring.forEach(position => {
+            const lat = Math.max(Math.min(position[1], MAX_LATITUDE), -MAX_LATITUDE) * Math.PI / 180;
+            const x = 256 * (0.5 + position[0] / 360);
+            const y = 256 * (0.5 - Math.log(Math.tan(Math.PI / 4 + lat / 2)) / (2 * Math.PI));
+            coords.push(x, y);
+            if (x < minX) minX = x;
+            if (x > maxX) maxX = x;
+            if (y < minY) minY = y;
+            if (y > maxY) maxY = y;
+        });
+        rings.push(coords.length / 2);
+        ringBounds.push(minX, minY, maxX, maxY);
+    };
+    (geoJson.features || []).forEach(feature => {
+        const geometry = feature.geometry;
+        if (!geometry) return;
+        const polygons = geometry.type === 'Polygon' ? [geometry.coordinates]
+            : geometry.type === 'MultiPolygon' ? geometry.coordinates : [];
+        polygons.forEach(polygon => polygon.forEach(addRing));
+    });
+    return { coords: new Float64Array(coords), rings: new Uint32Array(rings), ringBounds: new Float64Array(ringBounds) };
+}
+
+// Turns the JSON text of a border level (see setBorderLevelData) into projected paths.
+function prepareBorderPaths(message) {
+    try {
+        const data = JSON.parse(message.json);
+        const geoJson = data && data.type === 'Topology' ? decodeTopology(data) : data;
+        return Object.assign({ layerId: message.layerId, requestId: message.requestId }, projectBorderFeatures(geoJson || {}));
+    } catch (e) {
+        return { layerId: message.layerId, requestId: message.requestId, error: String(e) };
+    }
+}
+
+function borderWorkerMain() {
+    self.onmessage = function(e) {
+        const result = prepareBorderPaths(e.data);
+        self.postMessage(result, result.error ? [] : [result.coords.buffer, result.rings.buffer, result.ringBounds.buffer]);
+    };
+}
+
+// Border data is parsed, decoded and projected in a Web Worker built from the functions
+// above, so the UI thread only draws. Without workers, or once the worker fails (e.g. its
+// Blob URL script is refused after construction), it is done here instead.
+function createBorderWorker() {
+    try {
+        const source = [decodeTopology, projectBorderFeatures, prepareBorderPaths].map(f => f.toString()).join('\n')
+            + '\n(' + borderWorkerMain.toString() + ')();';
+        const worker = new Worker(URL.createObjectURL(new Blob([source], { type: 'application/javascript' })));
+        worker.onmessage = e => {
+            if (borderWorkerMessages[e.data.layerId] && borderWorkerMessages[e.data.layerId].requestId === e.data.requestId) {
+                delete borderWorkerMessages[e.data.layerId];
+            }
+            applyBorderPaths(e.data);
+        };
+        worker.onerror = e => {
+            log(`[JS Warning] Border worker failed, preparing borders on the UI thread: ${e.message}`);
+            worker.terminate();
+            if (borderWorker === worker) borderWorker = null;
+            const messages = Object.values(borderWorkerMessages);
+            borderWorkerMessages = {};
+            messages.forEach(message => applyBorderPaths(prepareBorderPaths(message)));
+        };
+        return worker;
+    } catch (e) {
+        log(`[JS Warning] Border worker unavailable, preparing borders on the UI thread: ${e}`);
+        return null;
+    }
+}
+
+// Draws projected border paths (see projectBorderFeatures) as one SVG path, rebuilt from
+// the rings inside the renderer's padded bounds whenever the view changes.
+const BorderSvgLayer = L.SVG.extend({
+    initialize: function(style, options) {
+        L.SVG.prototype.initialize.call(this, options);
+        this._style = style;
+        this._paths = null;
+    },
+
+    _initContainer: function() {
+        L.SVG.prototype._initContainer.call(this);
+        this._path = L.SVG.create('path');
+        this._path.setAttribute('stroke', this._style.color);
+        this._path.setAttribute('stroke-width', this._style.weight);
+        this._path.setAttribute('stroke-linejoin', 'round');
+        this._path.setAttribute('fill', this._style.color);
+        this._path.setAttribute('fill-opacity', this._style.fillOpacity);
+        this._path.setAttribute('fill-rule', 'evenodd');
+        this._path.setAttribute('pointer-events', 'none');
+        this._rootGroup.appendChild(this._path);
+    },
+
+    onAdd: function() {
+        L.SVG.prototype.onAdd.call(this);
+        this.on('update', this._redraw, this);
+        this._redraw();
+    },
+
+    onRemove: function() {
+        this.off('update', this._redraw, this);
+        L.SVG.prototype.onRemove.call(this);
+    },
+
+    setPaths: function(paths) {
+        this._paths = paths;
+        this._redraw();
+    },
+
+    _redraw: function() {
+        if (!this._map || !this._path || !this._bounds) return;
+        let d = '';
+        if (this._paths) {
+            const { coords, rings, ringBounds } = this._paths;
+            const scale = this._map.getZoomScale(this._map.getZoom(), 0);
+            const origin = this._map.getPixelOrigin();
+            const min = this._bounds.min, max = this._bounds.max;
+            for (let r = 0; r < rings.length - 1; r++) {
+                if (ringBounds[4 * r + 2] * scale - origin.x < min.x || ringBounds[4 * r] * scale - origin.x > max.x ||
+                    ringBounds[4 * r + 3] * scale - origin.y < min.y || ringBounds[4 * r + 1] * scale - origin.y > max.y) continue;
+                for (let i = rings[r]; i < rings[r + 1]; i++) {
+                    const x = Math.round((coords[2 * i] * scale - origin.x) * 10) / 10;
+                    const y = Math.round((coords[2 * i + 1] * scale - origin.y) * 10) / 10;
+                    d += (i === rings[r] ? 'M' : 'L') + x + ' ' + y;
+                }
+                d += 'z';
+            }
+        }
+        this._path.setAttribute('d', d || 'M0 0');
+    }
+});
+
+// Draws projected border paths on a canvas. The rings are turned into one Path2D per zoom
+// level for the layer's style, kept for the last few zoom levels, so panning and
+// returning to a zoom only fill and stroke cached paths. L.Canvas calls _draw after
+// every view change.
+const BorderCanvasLayer = L.Canvas.extend({
+    initialize: function(style, options) {
+        L.Canvas.prototype.initialize.call(this, options);
+        this._style = style;
+        this._paths = null;
+        this._pathCache = new Map();
+    },
+
+    setPaths: function(paths) {
+        this._paths = paths;
+        this._pathCache.clear();
+        let minX = Infinity, minY = Infinity;
+        for (let r = 0; r < paths.ringBounds.length; r += 4) {
+            minX = Math.min(minX, paths.ringBounds[r]);
+            minY = Math.min(minY, paths.ringBounds[r + 1]);
+        }
+        this._anchor = L.point(minX, minY);
+        if (this._map) this._redraw();
+    },
+
+    // Path coordinates are relative to the data's top-left corner, so they stay small
+    // enough for the canvas' single-precision floats at high zoom levels.
+    _pathForZoom: function(zoom) {
+        let path = this._pathCache.get(zoom);
+        if (path) {
+            // Re-insert to keep the Map in least-recently-used order
+            this._pathCache.delete(zoom);
+            this._pathCache.set(zoom, path);
+            return path;
+        }
+        const { coords, rings } = this._paths;
+        const scale = this._map.getZoomScale(zoom, 0);
+        path = new Path2D();
+        for (let r = 0; r < rings.length - 1; r++) {
+            for (let i = rings[r]; i < rings[r + 1]; i++) {
+                const x = (coords[2 * i] - this._anchor.x) * scale;
+                const y = (coords[2 * i + 1] - this._anchor.y) * scale;
+                if (i === rings[r]) path.moveTo(x, y);
+                else path.lineTo(x, y);
+            }
+            path.closePath();
+        }
+        this._pathCache.set(zoom, path);
+        if (this._pathCache.size > BORDER_PATH_CACHE_ZOOMS) {
+            this._pathCache.delete(this._pathCache.keys().next().value);
+        }
+        return path;
+    },
+
+    _draw: function() {
+        if (!this._map || !this._paths || this._paths.rings.length < 2) return;
+        const zoom = this._map.getZoom();
+        const scale = this._map.getZoomScale(zoom, 0);
+        const origin = this._map.getPixelOrigin();
+        const path = this._pathForZoom(zoom);
+        const ctx = this._ctx;
+        ctx.save();
+        ctx.translate(this._anchor.x * scale - origin.x, this._anchor.y * scale - origin.y);
+        ctx.globalAlpha = this._style.fillOpacity;
+        ctx.fillStyle = this._style.color;
+        ctx.fill(path, 'evenodd');
+        ctx.globalAlpha = 1;
+        ctx.lineWidth = this._style.weight;
+        ctx.lineJoin = 'round';
+        ctx.strokeStyle = this._style.color;
+        ctx.stroke(path);
+        ctx.restore();
+    }
+});
+
+function createBorderLayer(style) {
+    const LayerClass = mapConfig.borderRenderer === 'svg' ? BorderSvgLayer : BorderCanvasLayer;
+    return new LayerClass(style, { pane: 'borderPane' });
+}
+
+// Pans a border layer's current data back and forth with each renderer and logs the
+// average frame time, measured over animation frames so painting is included.
+window.benchmarkBorderRenderers = function(layerId, frames) {
+    const source = borderLayers[layerId];
+    if (!source || !source._paths) {
+        log(`[Benchmark] Border layer ${layerId} has no data.`);
+        return;
+    }
+    frames = frames || 60;
+    const wasShown = map.hasLayer(source);
+    if (wasShown) map.removeLayer(source);
+    const renderers = [['svg', BorderSvgLayer], ['canvas', BorderCanvasLayer]];
+    const results = [];
+    const runNext = () => {
+        if (!renderers.length) {
+            if (wasShown) map.addLayer(source);
+            const points = source._paths.coords.length / 2;
+            log(`[Benchmark] Border layer ${layerId} (${points} points): ${results.join(', ')}`);
+            return;
+        }
+        const [name, LayerClass] = renderers.shift();
+        const layer = new LayerClass(source._style, { pane: 'borderPane' }).addTo(map);
+        layer.setPaths(source._paths);
+        let frame = 0, start = null;
+        const step = timestamp => {
+            if (start === null) start = timestamp;
+            if (frame === frames) {
+                results.push(`${name} ${((timestamp - start) / frames).toFixed(1)} ms/frame`);
+                map.removeLayer(layer);
+                runNext();
+                return;
+            }
+            // Small pans stay inside the loaded area, so no new data is requested
+            map.panBy([frame % 2 ? -100 : 100, 0], { animate: false });
+            frame++;
+            requestAnimationFrame(step);
+        };
+        requestAnimationFrame(step);
+    };
+    runNext();
+};
+
+function applyBorderPaths(result) {
+    // Ignore results that were superseded by a newer request while they were prepared
+    if (borderRequestIds[result.layerId] !== result.requestId || !borderLayers[result.layerId]) return;
+    if (result.error) {
+        log(`[JS Error] Could not prepare border layer ${result.layerId}: ${result.error}`);
+        return;
+    }
+    borderLayers[result.layerId].setPaths(result);
+}
+
+// json is the level as JSON text; parsing it is left to the worker.
+window.setBorderLevelData = function(layerId, level, json) {
+    // Ignore levels that were superseded by further zooming while they were prepared
+    if (!borderLayers[layerId] || borderLevelShown[layerId] !== level) return;
+    const message = { layerId: String(layerId), requestId: ++nextBorderRequestId, json: json };
+    borderRequestIds[message.layerId] = message.requestId;
+    if (borderWorker) {
+        borderWorkerMessages[message.layerId] = message;
+        borderWorker.postMessage(message);
+    } else {
+        applyBorderPaths(prepareBorderPaths(message));
+    }
+};
+
+window.toggleBorderLayer = function(level, show) {
+    const layer = borderLayers[level];
+    if (layer) {
+        if (show && !map.hasLayer(layer)) {
+            map.addLayer(layer);
+            requestBorderViews();
+        } else if (!show && map.hasLayer(layer)) {
+            map.removeLayer(layer);
+        }
+    }
+};
+
+window.addCountryRegionsLayer = function(layerId, zooms) {
+    if (borderLayers[layerId]) {
+        map.removeLayer(borderLayers[layerId]);
+    }
+    borderLayers[layerId] = createBorderLayer({ color: '#008000', weight: 2, fillOpacity: 0.05 }).addTo(map);
+    window.setBorderLevels(layerId, zooms);
+};
+
+window.removeBorderLayer = function(layerId) {
+    if (borderLayers[layerId]) {
+        map.removeLayer(borderLayers[layerId]);
+        delete borderLayers[layerId];
+    }
+    delete borderLevelZooms[layerId];
+    delete borderLevelShown[layerId];
+    delete borderViewBounds[layerId];
+    delete borderRequestIds[layerId];
+};
+
+window.getMapState = function() {
+    return {
+        bbox: map.getBounds().toBBoxString(),
+        zoom: map.getZoom()
+    };
+};
+
+window.setInitialPoiData = function(data) {
+    allPoiDataFromPython = data;
+    for (const layerKey in allPoiDataFromPython) {
+        if (allPoiDataFromPython.hasOwnProperty(layerKey)) {
+            if (!poiLayers[layerKey]) {
+                poiLayers[layerKey] = L.layerGroup();
+            }
+        }
+    }
+};
+
+window.setPoiLayerData = function(layerKey, data) {
+    allPoiDataFromPython[layerKey] = data;
+    if (!poiLayers[layerKey]) poiLayers[layerKey] = L.layerGroup();
+};
+
+window.togglePoiLayerVisibility = function(layerKey, show) {
+    const layer = poiLayers[layerKey];
+    const data = allPoiDataFromPython[layerKey];
+    if (!layer || !data) return;
+
+    if (show) {
+        layer.clearLayers();
+        const pathParts = layerKey.split('/');
+        const era = pathParts.length > 1 ? pathParts[0] : 'unknown';
+        let filename = pathParts.length > 1 ? pathParts[1] : pathParts[0];
+        let typeFromFilename = filename.replace(/\.json$/, '');
+
+        if (filename.includes('viereckschanze')) {
+            typeFromFilename = 'viereckschanze';
+        } else if (filename.includes('siedlung') || filename.includes('oppida')) {
+            typeFromFilename = 'siedlung';
+        } else {
+            typeFromFilename = typeFromFilename.split('_').slice(1).join('_');
+        }
+
+        const allowed = poiRegionFilter ? new Set(poiRegionFilter[layerKey] || []) : null;
+        data.forEach((poi, index) => {
+            if (allowed && !allowed.has(index)) return;
+            if (poi && typeof poi.lat === 'number' && typeof poi.lon === 'number') {
+                let popupContent = `<div class="poi-popup-content"><b>${poi.name}</b>`;
+                if (poi.zusammenfassung) popupContent += `<br><p>${poi.zusammenfassung.substring(0, 200)}...</p>`;
+                if (poi.url) popupContent += `<br><a href="${poi.url}" target="_blank">Weitere Infos</a>`;
+                popupContent += `</div>`;
+
+                let iconToUse = icons[typeFromFilename] || icons[era] || icons['punkt'];
+                L.marker([poi.lat, poi.lon], { icon: iconToUse }).bindPopup(popupContent).addTo(layer);
+            } else {
+                log(`[JS Warning] Skipping invalid POI object in ${layerKey}: ${JSON.stringify(poi)}`);
+            }
+        });
+        if (!map.hasLayer(layer)) map.addLayer(layer);
+    } else {
+        if (map.hasLayer(layer)) map.removeLayer(layer);
+    }
+};
+
+window.setPoiRegionFilter = function(filter) {
+    poiRegionFilter = filter;
+    for (const layerKey in poiLayers) {
+        if (map.hasLayer(poiLayers[layerKey])) window.togglePoiLayerVisibility(layerKey, true);
+    }
+};
+
+function isValidMarkerData(data) {
+    if (data && typeof data.lat === 'number' && typeof data.lon === 'number') return true;
+    log(`[JS Warning] Skipping invalid permanent marker: ${JSON.stringify(data)}`);
+    return false;
+}
+
+function addPermanentMarker(data) {
+    if (!isValidMarkerData(data)) return;
+    const marker = L.marker([data.lat, data.lon], {icon: icons[data.icon] || icons['punkt']}).addTo(map).bindPopup(`<b>${data.comment}</b>`);
+    marker.markerData = data;
+    permanentMarkers[data.id] = marker;
+}
+
+function updatePermanentMarker(data) {
+    const marker = permanentMarkers[data.id];
+    if (!marker) { addPermanentMarker(data); return; }
+    if (!isValidMarkerData(data)) return;
+    const previous = marker.markerData;
+    if (data.lat !== previous.lat || data.lon !== previous.lon) marker.setLatLng([data.lat, data.lon]);
+    if (data.icon !== previous.icon) marker.setIcon(icons[data.icon] || icons['punkt']);
+    if (data.comment !== previous.comment) marker.setPopupContent(`<b>${data.comment}</b>`);
+    marker.markerData = data;
+}
+
+function removePermanentMarker(id) {
+    if (!permanentMarkers[id]) return;
+    map.removeLayer(permanentMarkers[id]);
+    delete permanentMarkers[id];
+}
+
+// Applies a batch of marker changes (see MarkerSync.diff). A diff for another version than the
+// one shown means one was lost, e.g. while the page reloaded; Python then sends all markers again.
+window.applyMarkerDiff = function(diff) {
+    if (diff.reset) {
+        for (const id in permanentMarkers) map.removeLayer(permanentMarkers[id]);
+        permanentMarkers = {};
+        markerResyncRequested = false;
+    } else if (diff.base !== permanentMarkersVersion) {
+        if (!markerResyncRequested) {
+            log(`[JS Warning] Marker diff for version ${diff.base} does not apply to version ${permanentMarkersVersion}, requesting all markers`);
+            markerResyncRequested = true;
+            window.bridge.requestMarkerResync();
+        }
+        return;
+    }
+    diff.remove.forEach(removePermanentMarker);
+    diff.update.forEach(updatePermanentMarker);
+    diff.add.forEach(addPermanentMarker);
+    permanentMarkersVersion = diff.version;
+};
+
+window.setTerrainAutoMode = (enabled) => { isTerrainAutoMode = enabled; updateAutoTerrain(); };
+window.setTerrainOpacity = (opacity) => { currentTerrainOpacity = opacity; updateAutoTerrain(); };
+window.setTerrainEnhancement = function(value) {
+    const pane = map.getPane('terrainPane');
+    if (!pane) return;
+    if (value === 0) { pane.style.filter = 'none'; return; }
+    const contrast = 100 + value * 2;
+    const brightness = 100 - (value / 5);
+    const saturate = 100 - (value / 1.5);
+    pane.style.filter = `contrast(${contrast}%) brightness(${brightness}%) saturate(${saturate}%)`;
+};
+// Lets the user drag a rectangle on the map and reports its bounds to Python.
+window.startAreaSelection = function() {
+    window.clearAreaSelection();
+    const container = map.getContainer();
+    let start = null;
+    map.dragging.disable();
+    container.style.cursor = 'crosshair';
+
+    function onMouseDown(e) {
+        start = e.latlng;
+        selectedAreaRect = L.rectangle([start, start], { color: '#ff7800', weight: 2, fillOpacity: 0.1, interactive: false }).addTo(map);
+    }
+    function onMouseMove(e) {
+        if (start) selectedAreaRect.setBounds(L.latLngBounds(start, e.latlng));
+    }
+    function onMouseUp(e) {
+        if (!start) return;
+        map.off('mousedown', onMouseDown).off('mousemove', onMouseMove).off('mouseup', onMouseUp);
+        map.dragging.enable();
+        container.style.cursor = '';
+        const bounds = L.latLngBounds(start, e.latlng);
+        selectedAreaRect.setBounds(bounds);
+        window.bridge.onAreaSelected(bounds.getSouth(), bounds.getWest(), bounds.getNorth(), bounds.getEast());
+    }
+    map.on('mousedown', onMouseDown).on('mousemove', onMouseMove).on('mouseup', onMouseUp);
+};
+window.clearAreaSelection = function() {
+    if (selectedAreaRect) {
+        map.removeLayer(selectedAreaRect);
+        selectedAreaRect = null;
+    }
+};
+window.setView = (lat, lon, zoom = 13) => map.setView([lat, lon], zoom);
+window.openMarkerPopup = (id) => { if(permanentMarkers[id]) permanentMarkers[id].openPopup(); };
+window.addSearchMarker = (lat, lon, popupText) => {
+    if (searchMarker) { map.removeLayer(searchMarker); }
+    searchMarker = L.marker([lat, lon], {icon: icons['start']}).addTo(map).bindPopup(popupText).openPopup();
+};
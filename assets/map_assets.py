@@ -22,4 +22,36 @@ culture_colors = {
     'mittelalter': '#28a745',
     'weltkriege': '#dc2626',
     'modern': '#000000'
-}
\ No newline at end of file
+}
+
+# Base layers offered in the layer control; the first one is shown on startup.
+# Each 'id' names the layer's tile cache file.
+base_layers = {
+    'OpenStreetMap': {
+        'id': 'osm',
+        'url': 'https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png',
+        'options': {'attribution': '© OpenStreetMap contributors', 'maxZoom': 19}
+    },
+    'Satellit': {
+        'id': 'esri_satellite',
+        'url': 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
+        'options': {'attribution': 'Tiles © Esri', 'maxZoom': 19}
+    },
+    'Topographisch': {
+        'id': 'opentopomap',
+        'url': 'https://{s}.tile.opentopomap.org/{z}/{x}/{y}.png',
+        'options': {
+            'attribution': 'Map data: © OpenStreetMap contributors, SRTM | Map style: © OpenTopoMap (CC-BY-SA)',
+            'maxZoom': 17
+        }
+    },
+    'Roman Empire': {
+        'id': 'dare_imperium',
+        'url': 'https://dh.gu.se/tiles/imperium/{z}/{x}/{y}.png',
+        'options': {
+            'attribution': '<a href="https://imperium.ahlfeldt.se/" target="_blank">DARE</a>',
+            'maxNativeZoom': 11,
+            'maxZoom': 19
+        }
+    }
+}
@@ -0,0 +1,248 @@
+# This module contains the SQLite store for the user's own markers ("Meine Fundorte").
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+
+# Marker fields stored in columns of their own; any others go into the properties column.
+MARKER_COLUMNS = ("id", "lat", "lon", "comment", "icon")
+# Markers read per query while iterating over all of them.
+ITER_BATCH_SIZE = 5000
+# Suffix of the legacy JSON file once it has been migrated; the file itself is kept as a backup.
+MIGRATED_SUFFIX = ".migrated"
+
+
+def _row(marker):
+    properties = {key: value for key, value in marker.items() if key not in MARKER_COLUMNS}
+    return (marker["id"], float(marker["lat"]), float(marker["lon"]), marker.get("comment", ""),
+            marker.get("icon", ""), json.dumps(properties) if properties else None)
+
+
+def _marker(row):
+    marker_id, lat, lon, comment, icon, properties = row
+    marker = {"id": marker_id, "lat": lat, "lon": lon, "comment": comment, "icon": icon}
+    if properties:
+        marker.update(json.loads(properties))
+    return marker
+
+
+class MarkerStore:
+    """
+    The user's markers in a SQLite file with an R-tree index on their positions.
+
+    Reads are synchronous. Writes (add, delete) are queued and executed one row
+    at a time by a background thread, so logging a find never waits for the disk;
+    writes queued while another commit is running are committed together.
+    If such a commit fails, none of its writes are stored and on_error is told
+    which markers they concerned. Safe to use from several threads.
+    """
+
+    def __init__(self, path, on_error=None):
+        """
+        Opens (or creates) the store.
+
+        Args:
+            path (str): Path of the SQLite file.
+            on_error (callable): Optional; called on the writer thread with the ids of
+                the markers whose queued writes failed and the error message.
+        """
+        self.on_error = on_error
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS markers (
+                key INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                comment TEXT,
+                icon TEXT,
+                properties TEXT
+            );
+        """)
+        try:
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS marker_index USING rtree(key, min_lat, max_lat, min_lon, max_lon)"
+            )
+            self._has_rtree = True
+        except sqlite3.OperationalError:
+            # SQLite built without the R-tree module; bounding box queries scan an ordinary index
+            self._db.execute("CREATE INDEX IF NOT EXISTS markers_lat_lon ON markers (lat, lon)")
+            self._has_rtree = False
+        self._db.commit()
+
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="MarkerStore", daemon=True)
+        self._writer.start()
+
+    def load_all(self):
+        """ Returns all markers as {id: marker}, in the order they were added. """
+        self.flush()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, lat, lon, comment, icon, properties FROM markers ORDER BY key"
+            ).fetchall()
+        return {row[0]: _marker(row) for row in rows}
+
+    def iter_markers(self, batch_size=ITER_BATCH_SIZE):
+        """ Yields all markers in the order they were added, reading batch_size of them at a time. """
+        self.flush()
+        last_key = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT key, id, lat, lon, comment, icon, properties FROM markers WHERE key > ? ORDER BY key LIMIT ?",
+                    (last_key, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_key = rows[-1][0]
+            for row in rows:
+                yield _marker(row[1:])
+
+    def get_many(self, marker_ids):
+        """ Returns the stored markers among the given ids as {id: marker}; unknown ids are left out. """
+        self.flush()
+        markers = {}
+        with self._lock:
+            for marker_id in marker_ids:
+                row = self._db.execute(
+                    "SELECT id, lat, lon, comment, icon, properties FROM markers WHERE id = ?", (marker_id,)
+                ).fetchone()
+                if row:
+                    markers[marker_id] = _marker(row)
+        return markers
+
+    def in_bbox(self, south, west, north, east):
+        """ Returns the markers inside a bounding box, in the order they were added. """
+        self.flush()
+        if self._has_rtree:
+            query = ("SELECT id, lat, lon, comment, icon, properties FROM markers WHERE key IN "
+                     "(SELECT key FROM marker_index WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?) "
+                     "ORDER BY key")
+        else:
+            query = ("SELECT id, lat, lon, comment, icon, properties FROM markers "
+                     "WHERE lat >= ? AND lat <= ? AND lon >= ? AND lon <= ? ORDER BY key")
+        with self._lock:
+            rows = self._db.execute(query, (south, north, west, east)).fetchall()
+        return [_marker(row) for row in rows]
+
+    def add(self, marker):
+        """ Queues storing a marker dict (id, lat, lon, comment, icon, ...); an existing one with the same id is replaced. """
+        self._writes.put(("put", _row(marker)))
+
+    def delete(self, marker_id):
+        """ Queues deleting the marker with the given id. """
+        self._writes.put(("delete", marker_id))
+
+    def add_many(self, markers):
+        """
+        Stores many markers in one transaction, e.g. an import; existing ones with
+        the same ids are replaced. Runs on the calling thread, after the queued writes.
+
+        Returns:
+            int: Number of stored markers.
+
+        Raises:
+            sqlite3.Error: If storing fails; none of the markers are stored then.
+        """
+        self.flush()
+        count = 0
+        with self._lock:
+            try:
+                for marker in markers:
+                    self._put(_row(marker))
+                    count += 1
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return count
+
+    def flush(self):
+        """ Waits until all queued writes are committed. """
+        self._writes.join()
+
+    def migrate_json(self, path):
+        """
+        Imports the markers of the legacy JSON file ({id: marker}) in one transaction,
+        once: the file is renamed afterwards and kept as a backup.
+
+        Returns:
+            int: Number of imported markers, 0 if there was nothing to migrate.
+
+        Raises:
+            OSError, ValueError, sqlite3.Error: If the file cannot be read or stored;
+                it is left in place.
+        """
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            markers = json.load(f)
+        self.add_many(markers.values())
+        os.replace(path, path + MIGRATED_SUFFIX)
+        return len(markers)
+
+    def close(self):
+        """ Commits the queued writes and closes the database. """
+        self._writes.put(None)
+        self._writer.join()
+        with self._lock:
+            self._db.close()
+
+    def _put(self, row):
+        key = self._db.execute(
+            "INSERT INTO markers (id, lat, lon, comment, icon, properties) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET lat = excluded.lat, lon = excluded.lon, comment = excluded.comment, "
+            "icon = excluded.icon, properties = excluded.properties RETURNING key", row
+        ).fetchone()[0]
+        if self._has_rtree:
+            lat, lon = row[1], row[2]
+            self._db.execute("INSERT OR REPLACE INTO marker_index VALUES (?, ?, ?, ?, ?)", (key, lat, lat, lon, lon))
+
+    def _delete(self, marker_id):
+        if self._has_rtree:
+            self._db.execute("DELETE FROM marker_index WHERE key IN (SELECT key FROM markers WHERE id = ?)", (marker_id,))
+        self._db.execute("DELETE FROM markers WHERE id = ?", (marker_id,))
+
+    def _write_loop(self):
+        while True:
+            writes = [self._writes.get()]
+            # Whatever was queued meanwhile goes into the same commit
+            while True:
+                try:
+                    writes.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in writes
+            error = None
+            try:
+                with self._lock:
+                    try:
+                        for write in writes:
+                            if write is None:
+                                continue
+                            operation, argument = write
+                            if operation == "put":
+                                self._put(argument)
+                            else:
+                                self._delete(argument)
+                        self._db.commit()
+                    except sqlite3.Error as e:
+                        self._db.rollback()
+                        print(f"MarkerStore write failed: {e}")
+                        error = str(e)
+                if error and self.on_error:
+                    # Put rows start with the marker id, deletes are the id itself
+                    marker_ids = [argument[0] if operation == "put" else argument
+                                  for operation, argument in filter(None, writes)]
+                    self.on_error(list(dict.fromkeys(marker_ids)), error)
+            finally:
+                for _ in writes:
+                    self._writes.task_done()
+            if stop:
+                return
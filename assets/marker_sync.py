@@ -0,0 +1,77 @@
+# This module contains the versioned diff protocol that keeps the page's permanent markers in step with the app.
+
+# Marker fields the page uses; changes to other fields are not sent.
+PAGE_FIELDS = ("id", "lat", "lon", "comment", "icon")
+
+
+def _page_state(marker):
+    return tuple(marker.get(field) for field in PAGE_FIELDS)
+
+
+class MarkerSync:
+    """
+    Tracks which markers the page shows and turns changes of the app's markers
+    into diffs: batches of added, updated and removed markers keyed by id.
+
+    Every diff names the version it applies to (base) and the version it
+    produces. The page applies a diff only on top of its current version and
+    asks for a resync otherwise (see window.applyMarkerDiff in map_page.js); a
+    resync is a diff with 'reset' set that replaces all markers.
+    """
+
+    def __init__(self):
+        self.version = 0
+        # (id, lat, lon, comment, icon) of every marker the page shows, by id
+        self._sent = {}
+        self._reset = True
+
+    def reset(self):
+        """ Forgets what the page shows, e.g. after it was (re)loaded; the next diff replaces all markers. """
+        self._sent = {}
+        self._reset = True
+
+    def diff(self, markers, changed=None):
+        """
+        Returns the diff that brings the page from what it shows to markers, or
+        None if there is nothing to send.
+
+        Args:
+            markers (dict): The app's markers, {id: marker}.
+            changed (iterable): Optional ids of the markers that were added, edited
+                or deleted since the last diff; only these are compared. All markers
+                are compared if it is None or a reset is pending.
+
+        Returns:
+            dict: {'base', 'version', 'reset', 'add', 'update', 'remove'}; add and
+                update hold marker dicts with the PAGE_FIELDS, remove holds ids.
+        """
+        if changed is None or self._reset:
+            changed = set(markers) | set(self._sent)
+        added, updated, removed = [], [], []
+        for marker_id in changed:
+            marker = markers.get(marker_id)
+            sent = self._sent.get(marker_id)
+            if marker is None:
+                if sent is not None:
+                    removed.append(marker_id)
+                    del self._sent[marker_id]
+                continue
+            state = _page_state(marker)
+            if state == sent:
+                continue
+            (added if sent is None else updated).append(dict(zip(PAGE_FIELDS, state)))
+            self._sent[marker_id] = state
+
+        if not (added or updated or removed or self._reset):
+            return None
+        diff = {
+            "base": self.version,
+            "version": self.version + 1,
+            "reset": self._reset,
+            "add": added,
+            "update": updated,
+            "remove": removed,
+        }
+        self.version += 1
+        self._reset = False
+        return diff
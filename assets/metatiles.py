@@ -0,0 +1,66 @@
+# This module contains helpers for requesting WMS maps as metatiles and slicing them into XYZ tiles.
+
+from PyQt6.QtCore import QBuffer, QIODevice
+from PyQt6.QtGui import QImage
+
+from assets import tile_math
+
+# Number of tiles along each side of a metatile.
+META_SIZE = 4
+# Extra pixels requested around a metatile so that labels and hillshading are
+# rendered consistently across the edges of the sliced tiles.
+META_BUFFER = 32
+
+
+class MetatileError(Exception):
+    """ Raised when a metatile image cannot be decoded or sliced. """
+
+
+def metatile_origin(z, x, y, meta_size=META_SIZE):
+    """
+    Returns (meta_x, meta_y, span) of the metatile containing tile (x, y): the
+    top-left tile of the block and its width in tiles, which is smaller than
+    meta_size at zoom levels with fewer tiles.
+    """
+    span = min(meta_size, 1 << z)
+    return x - x % span, y - y % span, span
+
+
+def metatile_request(z, meta_x, meta_y, span, tile_size=256, buffer=META_BUFFER):
+    """
+    Returns (bounds, width, height) for the GetMap request of a metatile,
+    including the buffer around it, in EPSG:3857.
+    """
+    minx, miny, maxx, maxy = tile_math.tile_bounds_3857(z, meta_x, meta_y, span)
+    metres_per_pixel = (maxx - minx) / (span * tile_size)
+    pad = buffer * metres_per_pixel
+    size = span * tile_size + 2 * buffer
+    return (minx - pad, miny - pad, maxx + pad, maxy + pad), size, size
+
+
+def slice_metatile(data, z, meta_x, meta_y, span, tile_size=256, buffer=META_BUFFER, image_format="png"):
+    """
+    Cuts a metatile image into its XYZ tiles.
+
+    Returns:
+        list: (z, x, y, bytes) for every tile of the metatile.
+
+    Raises:
+        MetatileError: If the image cannot be decoded or has an unexpected size.
+    """
+    image = QImage.fromData(data)
+    expected = span * tile_size + 2 * buffer
+    if image.isNull() or image.width() != expected or image.height() != expected:
+        raise MetatileError(f"Unexpected metatile image ({image.width()}x{image.height()}, expected {expected})")
+
+    qt_format = "JPG" if "jp" in image_format.lower() else "PNG"
+    tiles = []
+    for column in range(span):
+        for row in range(span):
+            tile = image.copy(buffer + column * tile_size, buffer + row * tile_size, tile_size, tile_size)
+            buffer_device = QBuffer()
+            buffer_device.open(QIODevice.OpenModeFlag.WriteOnly)
+            if not tile.save(buffer_device, qt_format):
+                raise MetatileError("Could not encode a sliced tile")
+            tiles.append((z, meta_x + column, meta_y + row, bytes(buffer_device.data())))
+    return tiles
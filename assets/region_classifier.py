@@ -0,0 +1,209 @@
+# This module contains the point-in-polygon engine that assigns POIs and markers to regions.
+
+import hashlib
+
+import numpy as np
+
+from assets import topology
+
+# Properties that hold a region's name in the border datasets, in order of preference.
+NAME_PROPERTIES = ("name", "NAME", "name_de", "reg_name", "nom", "NAME_1", "NAME_0", "ADMIN", "admin")
+# Average number of grid cells per polygon edge; more cells mean fewer edges to test per point.
+CELLS_PER_EDGE = 2
+# Bounds for the number of grid cells along each axis.
+MIN_GRID_SIZE = 16
+MAX_GRID_SIZE = 2048
+# Points classified together; bounds the size of the (point, edge) pair arrays.
+CHUNK_SIZE = 200000
+
+
+def region_name(properties, index=0):
+    """ Returns the display name of a region feature. """
+    for key in NAME_PROPERTIES:
+        value = (properties or {}).get(key)
+        if value:
+            return str(value)
+    return f"Region {index + 1}"
+
+
+def _edges(feature_collection):
+    """ Returns the ring edges of all polygon features as (x0, y0, x1, y1) rows and the feature index of each. """
+    edges, owners = [], []
+    for index, feature in enumerate(feature_collection.get("features", [])):
+        geometry = feature.get("geometry")
+        if not geometry or geometry.get("type") not in topology.POLYGON_TYPES:
+            continue
+        polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+        for polygon in polygons:
+            for ring in polygon:
+                positions = np.asarray([position[:2] for position in ring], dtype=float).reshape(-1, 2)
+                if len(positions) < 3:
+                    continue
+                if not (positions[0] == positions[-1]).all():
+                    positions = np.vstack((positions, positions[:1]))
+                edges.append(np.hstack((positions[:-1], positions[1:])))
+                owners.append(np.full(len(positions) - 1, index))
+    if not edges:
+        return np.zeros((0, 4)), np.zeros(0, dtype=int)
+    return np.concatenate(edges), np.concatenate(owners)
+
+
+def _orientation(ax, ay, bx, by, px, py):
+    return (bx - ax) * (py - ay) - (by - ay) * (px - ax)
+
+
+class PreparedRegions:
+    """
+    Region polygons prepared for classifying many points at once.
+
+    The regions' bounding box is divided into a grid. For the centre of every cell
+    the containing region is determined once by ray casting; a point then only has
+    to be tested against the edges that touch its own cell: every edge crossed on
+    the way from the cell centre to the point toggles the membership of that
+    edge's region. Points in cells without edges, the vast majority, need no test
+    at all. Regions are assumed not to overlap, as administrative regions do not.
+    """
+
+    def __init__(self, feature_collection):
+        features = feature_collection.get("features", [])
+        self.names = [region_name(feature.get("properties"), index) for index, feature in enumerate(features)]
+        self.edges, self.owners = _edges(feature_collection)
+        self.version = hashlib.sha1(self.edges.tobytes() + self.owners.tobytes()).hexdigest()
+        self._assignments = {}
+        self._build_grid()
+
+    def _build_grid(self):
+        edges = self.edges
+        if not len(edges):
+            self.origin, self.cell, self.shape = np.zeros(2), np.ones(2), (1, 1)
+            self.center_regions = np.full(1, -1)
+            self.cell_starts = np.zeros(2, dtype=int)
+            self.cell_edges = np.zeros(0, dtype=int)
+            return
+        low = np.minimum(edges[:, :2], edges[:, 2:]).min(axis=0)
+        high = np.maximum(edges[:, :2], edges[:, 2:]).max(axis=0)
+        extent = np.maximum(high - low, 1e-9)
+        cells = int(np.clip(np.sqrt(len(edges) * CELLS_PER_EDGE), MIN_GRID_SIZE, MAX_GRID_SIZE))
+        # Square-ish cells: the longer side gets the full count
+        shape = np.maximum(np.round(cells * extent / extent.max()).astype(int), 1)
+        self.origin, self.cell, self.shape = low, extent / shape, (int(shape[0]), int(shape[1]))
+
+        # Every edge is registered in all cells of its bounding box
+        first = self._cells_of(np.minimum(edges[:, :2], edges[:, 2:]))
+        last = self._cells_of(np.maximum(edges[:, :2], edges[:, 2:]))
+        spans = last - first + 1
+        counts = spans[:, 0] * spans[:, 1]
+        edge_ids = np.repeat(np.arange(len(edges)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        span_y = np.repeat(spans[:, 1], counts)
+        cx = np.repeat(first[:, 0], counts) + offsets // span_y
+        cy = np.repeat(first[:, 1], counts) + offsets % span_y
+        cell_ids = cx * self.shape[1] + cy
+        order = np.argsort(cell_ids, kind="stable")
+        self.cell_edges = edge_ids[order]
+        self.cell_starts = np.concatenate(([0], np.cumsum(np.bincount(cell_ids, minlength=self.shape[0] * self.shape[1]))))
+
+        self.center_regions = self._ray_cast_centers()
+
+    def _cells_of(self, points):
+        cells = np.floor((points - self.origin) / self.cell).astype(int)
+        return np.clip(cells, 0, np.array(self.shape) - 1)
+
+    def _center(self, cell_ids):
+        cx, cy = np.divmod(cell_ids, self.shape[1])
+        return self.origin[0] + (cx + 0.5) * self.cell[0], self.origin[1] + (cy + 0.5) * self.cell[1]
+
+    def _ray_cast_centers(self):
+        """ Returns the region containing each cell centre, by casting rays towards +x along every grid row. """
+        x0, y0, x1, y1 = self.edges.T
+        nx, ny = self.shape
+        center_x = self.origin[0] + (np.arange(nx) + 0.5) * self.cell[0]
+        result = np.full(nx * ny, -1)
+        for row in range(ny):
+            y = self.origin[1] + (row + 0.5) * self.cell[1]
+            crossing = (y0 > y) != (y1 > y)
+            if not crossing.any():
+                continue
+            ex0, ey0, ex1, ey1 = x0[crossing], y0[crossing], x1[crossing], y1[crossing]
+            xs = ex0 + (y - ey0) * (ex1 - ex0) / (ey1 - ey0)
+            owners = self.owners[crossing]
+            for owner in np.unique(owners):
+                owner_xs = np.sort(xs[owners == owner])
+                inside = (len(owner_xs) - np.searchsorted(owner_xs, center_x, side="right")) % 2 == 1
+                result[np.arange(nx)[inside] * ny + row] = owner
+        return result
+
+    def classify(self, lons, lats):
+        """
+        Returns the index of the region (feature) containing each point, -1 for none.
+
+        Args:
+            lons (array-like): Longitudes of the points.
+            lats (array-like): Latitudes of the points.
+        """
+        lons = np.asarray(lons, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+        result = np.full(len(lons), -1)
+        for start in range(0, len(lons), CHUNK_SIZE):
+            result[start:start + CHUNK_SIZE] = self._classify_chunk(lons[start:start + CHUNK_SIZE],
+                                                                  lats[start:start + CHUNK_SIZE])
+        return result
+
+    def _classify_chunk(self, px, py):
+        if not len(self.edges):
+            return np.full(len(px), -1)
+        cells = self._cells_of(np.column_stack((px, py)))
+        cell_ids = cells[:, 0] * self.shape[1] + cells[:, 1]
+        result = self.center_regions[cell_ids].copy()
+        outside = (px < self.origin[0]) | (py < self.origin[1]) | \
+                  (px > self.origin[0] + self.shape[0] * self.cell[0]) | \
+                  (py > self.origin[1] + self.shape[1] * self.cell[1])
+        result[outside] = -1
+
+        # (point, edge) pairs for the points in cells that edges pass through
+        counts = self.cell_starts[cell_ids + 1] - self.cell_starts[cell_ids]
+        counts[outside] = 0
+        if not counts.any():
+            return result
+        points = np.repeat(np.arange(len(px)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        edges = self.cell_edges[np.repeat(self.cell_starts[cell_ids], counts) + offsets]
+
+        # Does the segment from the cell centre to the point cross the edge?
+        cx, cy = self._center(cell_ids[points])
+        qx, qy = px[points], py[points]
+        ax, ay, bx, by = self.edges[edges].T
+        crosses = ((_orientation(ax, ay, bx, by, qx, qy) > 0) != (_orientation(ax, ay, bx, by, cx, cy) > 0)) & \
+                  ((_orientation(cx, cy, qx, qy, ax, ay) > 0) != (_orientation(cx, cy, qx, qy, bx, by) > 0))
+        points, owners = points[crosses], self.owners[edges[crosses]]
+        if not len(points):
+            return result
+
+        # Regions whose boundary was crossed an odd number of times were left or entered
+        keys, parity = np.unique(points * len(self.names) + owners, return_counts=True)
+        toggled = keys[parity % 2 == 1]
+        toggled_points, toggled_regions = np.divmod(toggled, len(self.names))
+        left = toggled_regions == result[toggled_points]
+        result[toggled_points[left]] = -1
+        entered = ~left
+        result[toggled_points[entered]] = toggled_regions[entered]
+        return result
+
+    def assign(self, key, lons, lats):
+        """
+        Like classify, but remembers the result per key (e.g. a POI layer) and the
+        points' coordinates, so it is reused until the points or the regions change.
+        """
+        lons = np.asarray(lons, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+        digest = hashlib.sha1(lons.tobytes() + lats.tobytes()).hexdigest()
+        cached = self._assignments.get(key)
+        if cached is None or cached[0] != digest:
+            cached = (digest, self.classify(lons, lats))
+            self._assignments[key] = cached
+        return cached[1]
+
+    def counts(self, assignment):
+        """ Returns {region name: number of points} for a result of classify or assign. """
+        counts = np.bincount(assignment[assignment >= 0], minlength=len(self.names))
+        return {name: int(count) for name, count in zip(self.names, counts) if count}
@@ -0,0 +1,153 @@
+# This module contains an indexed on-disk store for the features of large region datasets.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# Age in seconds after which an ingested dataset is loaded and ingested again.
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+
+
+def _iter_positions(coordinates):
+    """ Yields every [lon, lat] position of a (nested) GeoJSON coordinate array. """
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        yield coordinates
+        return
+    for part in coordinates or ():
+        yield from _iter_positions(part)
+
+
+def geometry_bbox(geometry):
+    """ Returns (min_lon, min_lat, max_lon, max_lat) of a GeoJSON geometry, or None if it is empty. """
+    if not geometry:
+        return None
+    if geometry.get("type") == "GeometryCollection":
+        boxes = [box for box in map(geometry_bbox, geometry.get("geometries", [])) if box]
+        if not boxes:
+            return None
+        return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
+    positions = list(_iter_positions(geometry.get("coordinates")))
+    if not positions:
+        return None
+    lons = [position[0] for position in positions]
+    lats = [position[1] for position in positions]
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+class RegionStore:
+    """
+    Splits FeatureCollections into single features stored in SQLite, indexed by a
+    key property (e.g. the 'admin' country name of Natural Earth admin-1 regions)
+    and by bounding box. Reading the regions of one country then only touches that
+    country's rows instead of downloading and parsing the whole dataset.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, path, max_age=DEFAULT_MAX_AGE):
+        """
+        Args:
+            path (str): Path of the SQLite file.
+            max_age (int): Seconds after which a dataset is ingested again.
+        """
+        self.max_age = max_age
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._ingest_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS sources (
+                source TEXT PRIMARY KEY,
+                key_property TEXT NOT NULL,
+                ingested REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS features (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                key TEXT,
+                min_lon REAL, min_lat REAL, max_lon REAL, max_lat REAL,
+                data BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS features_source_key ON features (source, key);
+        """)
+        self._db.commit()
+
+    def is_current(self, source, key_property):
+        """ Returns True if the dataset was ingested by key_property within max_age. """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT key_property, ingested FROM sources WHERE source = ?", (source,)
+            ).fetchone()
+        return bool(row) and row[0] == key_property and row[1] > time.time() - self.max_age
+
+    def ingest(self, source, feature_collection, key_property):
+        """
+        Replaces the stored features of a dataset.
+
+        Args:
+            source (str): Identifies the dataset, usually its URL.
+            feature_collection (dict): The GeoJSON FeatureCollection.
+            key_property (str): Feature property the features are looked up by.
+
+        Returns:
+            int: Number of stored features.
+        """
+        rows = []
+        for feature in feature_collection.get("features", []):
+            bbox = geometry_bbox(feature.get("geometry")) or (None, None, None, None)
+            key = (feature.get("properties") or {}).get(key_property)
+            data = zlib.compress(json.dumps(feature, separators=(",", ":")).encode("utf-8"))
+            rows.append((source, key, *bbox, data))
+        with self._lock:
+            self._db.execute("DELETE FROM features WHERE source = ?", (source,))
+            self._db.executemany(
+                "INSERT INTO features (source, key, min_lon, min_lat, max_lon, max_lat, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO sources (source, key_property, ingested) VALUES (?, ?, ?)",
+                (source, key_property, time.time())
+            )
+            self._db.commit()
+        return len(rows)
+
+    def features(self, source, key, bbox=None):
+        """
+        Returns the stored features of a dataset whose key property equals key.
+
+        Args:
+            bbox (tuple): Optional (south, west, north, east); only features whose
+                bounding box intersects it are returned.
+        """
+        query = "SELECT data FROM features WHERE source = ? AND key = ?"
+        params = [source, key]
+        if bbox is not None:
+            south, west, north, east = bbox
+            query += " AND max_lon >= ? AND min_lon <= ? AND max_lat >= ? AND min_lat <= ?"
+            params += [west, east, south, north]
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY id", params).fetchall()
+        return [json.loads(zlib.decompress(row[0])) for row in rows]
+
+    def feature_collection(self, source, key, key_property, load, bbox=None, log=None):
+        """
+        Returns a FeatureCollection of the features matching key, ingesting the dataset
+        first (via load, which returns the whole FeatureCollection) if it is missing
+        or older than max_age. log, if given, is called with a message once it is ingested.
+        """
+        if not self.is_current(source, key_property):
+            with self._ingest_lock:
+                # Another thread may have ingested it while this one waited
+                if not self.is_current(source, key_property):
+                    count = self.ingest(source, load(), key_property)
+                    if log is not None:
+                        log(f"Ingested {count} features from {source}")
+        return {"type": "FeatureCollection", "features": self.features(source, key, bbox)}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
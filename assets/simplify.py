@@ -0,0 +1,152 @@
+# This module contains the multi-resolution simplification of border geometry.
+
+import numpy as np
+
+from assets import region_classifier
+from assets import topology
+
+# Zoom levels from which each resolution level is shown. The last level is the
+# unsimplified geometry.
+LEVEL_ZOOMS = (0, 5, 7, 9, 11, 13)
+# Largest deviation, in screen pixels at a level's first zoom, a simplified border may have.
+TOLERANCE_PIXELS = 0.5
+# Zoom whose tolerance sets the quantisation grid of the full-resolution level (about 0.4 m).
+FULL_RESOLUTION_ZOOM = 18
+
+
+def zoom_tolerance(zoom):
+    """ Returns the simplification tolerance in degrees for a zoom level. """
+    return TOLERANCE_PIXELS * 360.0 / (256 * 2 ** zoom)
+
+
+def _segment_distances(points, starts, ends, indices, segment_of):
+    """ Distances of points[indices] to the segments starts[segment_of] - ends[segment_of]. """
+    a = points[starts[segment_of]]
+    b = points[ends[segment_of]]
+    p = points[indices]
+    ab = b - a
+    length_sq = (ab * ab).sum(axis=1)
+    t = np.zeros(len(indices))
+    nonzero = length_sq > 0
+    t[nonzero] = np.clip(((p - a) * ab).sum(axis=1)[nonzero] / length_sq[nonzero], 0.0, 1.0)
+    closest = a + ab * t[:, None]
+    return np.hypot(*(p - closest).T)
+
+
+def arc_importance(arcs, min_tolerance):
+    """
+    Computes the Douglas-Peucker importance of every arc vertex: the largest tolerance
+    at which the vertex is still kept. All arcs are processed together, one level of
+    the recursion per step, so each step is a handful of NumPy operations.
+
+    A vertex never gets a higher importance than the vertex that split its segment,
+    so every simplified level is contained in the next finer one. Vertices below
+    min_tolerance get importance 0 and only appear in the full-resolution level.
+    End points, and for closed arcs the two most important other vertices (so
+    islands keep an area), get infinite importance.
+
+    Returns:
+        list: One float array per arc.
+    """
+    if not arcs:
+        return []
+    lengths = np.array([len(arc) for arc in arcs])
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    points = np.concatenate(arcs)
+    importance = np.zeros(len(points))
+    importance[offsets] = np.inf
+    importance[offsets + lengths - 1] = np.inf
+
+    starts, ends = offsets, offsets + lengths - 1
+    limits = np.full(len(arcs), np.inf)
+    while True:
+        active = ends - starts >= 2
+        starts, ends, limits = starts[active], ends[active], limits[active]
+        if not len(starts):
+            break
+        interior = ends - starts - 1
+        segment_of = np.repeat(np.arange(len(starts)), interior)
+        first_index = np.cumsum(interior) - interior
+        indices = np.arange(interior.sum()) - np.repeat(first_index, interior) + np.repeat(starts + 1, interior)
+        distances = _segment_distances(points, starts, ends, indices, segment_of)
+
+        # Farthest vertex of every segment: sort by segment, then by descending distance
+        order = np.lexsort((-distances, segment_of))
+        farthest = order[first_index]
+        split = indices[farthest]
+        split_distance = np.minimum(distances[farthest], limits)
+
+        keep = split_distance >= min_tolerance
+        importance[split[keep]] = split_distance[keep]
+        starts, ends, split, limits = starts[keep], ends[keep], split[keep], split_distance[keep]
+        starts, ends, limits = (np.concatenate((starts, split)), np.concatenate((split, ends)),
+                                np.concatenate((limits, limits)))
+
+    result = np.split(importance, offsets[1:])
+    for arc, arc_importance_values in zip(arcs, result):
+        if len(arc) > 3 and (arc[0] == arc[-1]).all():
+            arc_importance_values[1 + np.argsort(-arc_importance_values[1:-1])[:2]] = np.inf
+    return result
+
+
+class BorderLevels:
+    """
+    Precomputed resolution levels of a border FeatureCollection. The polygons are
+    converted into a topology first, so a boundary shared by two regions is
+    simplified once and both regions still meet without gaps or overlaps.
+    """
+
+    def __init__(self, feature_collection, level_zooms=LEVEL_ZOOMS):
+        self.zooms = list(level_zooms)
+        self.topology = topology.extract_arcs(feature_collection)
+        self.tolerances = [zoom_tolerance(zoom) for zoom in self.zooms[:-1]] + [0.0]
+        min_tolerance = min(self.tolerances[:-1], default=0.0)
+        self.importance = arc_importance(self.topology.arcs, min_tolerance)
+        self._levels = {}
+        self._regions = None
+
+    def level_for_zoom(self, zoom):
+        """ Returns the index of the level shown at a zoom. """
+        level = 0
+        for index, level_zoom in enumerate(self.zooms):
+            if zoom >= level_zoom:
+                level = index
+        return level
+
+    def simplified_arcs(self, level):
+        """ Returns the arcs of a level. """
+        tolerance = self.tolerances[level]
+        if tolerance <= 0:
+            return self.topology.arcs
+        return [arc[importance >= tolerance] for arc, importance in zip(self.topology.arcs, self.importance)]
+
+    def level(self, level):
+        """ Returns the FeatureCollection of a level. """
+        return self.topology.to_geojson(self.simplified_arcs(level))
+
+    def encoded_level(self, level, bbox=None):
+        """
+        Returns a level in the compact topology form sent to the page (see
+        Topology.encode). Positions are quantised to half the level's tolerance.
+
+        Args:
+            bbox (tuple): Optional (south, west, north, east); only the polygons
+                intersecting it are included (see Topology.subset). Whole levels
+                are memoised.
+        """
+        step = (self.tolerances[level] or zoom_tolerance(FULL_RESOLUTION_ZOOM)) / 2
+        if bbox is not None:
+            return self.topology.subset(bbox, self.simplified_arcs(level)).encode(step)
+        if level not in self._levels:
+            self._levels[level] = self.topology.encode(step, self.simplified_arcs(level))
+        return self._levels[level]
+
+    def prepared_regions(self):
+        """ Returns (and memoises) the full-resolution regions prepared for point-in-polygon tests. """
+        if self._regions is None:
+            self._regions = region_classifier.PreparedRegions(self.level(len(self.zooms) - 1))
+        return self._regions
+
+    def point_counts(self):
+        """ Returns the number of arc vertices of every level. """
+        return [sum(len(arc) for arc in self.simplified_arcs(level)) for level in range(len(self.zooms))]
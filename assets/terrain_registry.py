@@ -0,0 +1,107 @@
+# This module discovers the terrain definitions in assets/countries and compiles them
+# into the registry the map page uses to pick a terrain layer.
+#
+# Every module below assets/countries/<continent>/ is a country and declares:
+#   bounds         - {region: [[south_lat, west_lon], [north_lat, east_lon]]}
+#   terrain_layers - {layer_key: {'url': ..., 'options': {...}}}
+#   layer_logic    - {region: {min_zoom (str): layer_key}}
+#   priority       - optional {region: int}; regions without one have priority 0
+#
+# Priority decides between overlapping regions: of all regions whose bounds contain
+# a position, only the one with the highest priority is used. A detailed region must
+# therefore outrank the country around it (Bavaria over Germany). If the winning
+# region has no layer for the zoom, no terrain layer is shown; lower regions are not
+# consulted. Equal priorities keep discovery order (continent, then module name).
+
+import importlib
+import math
+import os
+import pkgutil
+
+COUNTRIES_DIR = os.path.join(os.path.dirname(__file__), "countries")
+# Edge length in degrees of the grid cells of the spatial lookup index.
+INDEX_CELL_SIZE = 1.0
+
+
+def discover_country_modules(countries_dir=COUNTRIES_DIR):
+    """ Imports and returns every country module, keyed by module name. """
+    modules = {}
+    for continent in sorted(entry.name for entry in os.scandir(countries_dir) if entry.is_dir()):
+        if continent.startswith("__"):
+            continue
+        continent_dir = os.path.join(countries_dir, continent)
+        for module_info in pkgutil.iter_modules([continent_dir]):
+            if module_info.ispkg:
+                continue
+            modules[module_info.name] = importlib.import_module(
+                f"assets.countries.{continent}.{module_info.name}"
+            )
+    return modules
+
+
+def _region_cells(bounds, cell_size):
+    """ Yields the keys of all grid cells a bounding box touches. """
+    (south, west), (north, east) = bounds
+    for lat_cell in range(math.floor(south / cell_size), math.floor(north / cell_size) + 1):
+        for lon_cell in range(math.floor(west / cell_size), math.floor(east / cell_size) + 1):
+            yield f"{lat_cell}_{lon_cell}"
+
+
+def build_terrain_registry(modules=None, cell_size=INDEX_CELL_SIZE):
+    """
+    Compiles the country modules into a JSON-serialisable registry:
+
+        layers  - every terrain layer, keyed by layer key
+        regions - one entry per region, sorted by descending priority, with its
+                  bounds and a [[min_zoom, layer_key], ...] list (highest zoom first)
+        index   - a grid of cell_size-degree cells, each listing the indices of the
+                  regions overlapping it in priority order
+
+    A lookup only tests the few candidates of one cell, so selection cost does not
+    grow with the number of regions.
+    """
+    if modules is None:
+        modules = discover_country_modules()
+
+    layers = {}
+    regions = []
+    for country, module in modules.items():
+        layers.update(module.terrain_layers)
+        priorities = getattr(module, "priority", {})
+        for region, bounds in module.bounds.items():
+            logic = module.layer_logic.get(region)
+            if not logic:
+                continue
+            regions.append({
+                "id": f"{country}/{region}",
+                "bounds": bounds,
+                "logic": sorted(([int(zoom), key] for zoom, key in logic.items()), reverse=True),
+                "priority": priorities.get(region, 0),
+            })
+    regions.sort(key=lambda region: -region["priority"])
+
+    cells = {}
+    for region_index, region in enumerate(regions):
+        for cell in _region_cells(region["bounds"], cell_size):
+            cells.setdefault(cell, []).append(region_index)
+
+    return {
+        "layers": layers,
+        "regions": regions,
+        "index": {"cellSize": cell_size, "cells": cells},
+    }
+
+
+def find_terrain_layer(registry, lat, lon, zoom):
+    """ Python counterpart of the page's lookup; returns the layer key or None. """
+    cell_size = registry["index"]["cellSize"]
+    cell = f"{math.floor(lat / cell_size)}_{math.floor(lon / cell_size)}"
+    for region_index in registry["index"]["cells"].get(cell, []):
+        region = registry["regions"][region_index]
+        (south, west), (north, east) = region["bounds"]
+        if south <= lat <= north and west <= lon <= east:
+            for min_zoom, key in region["logic"]:
+                if zoom >= min_zoom:
+                    return key
+            return None
+    return None
@@ -0,0 +1,239 @@
+# This module contains the bulk downloader that pre-seeds the tile cache for offline use.
+
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from assets import tile_math
+from assets.tile_server import TileNotFound, USER_AGENT
+
+# Number of parallel download workers.
+DEFAULT_WORKERS = 2
+# Maximum requests per second against a single host.
+DEFAULT_RATE_PER_HOST = 2.0
+# Tile hosts whose usage terms do not allow bulk or offline downloads (OpenStreetMap's
+# tile usage policy, Esri's ArcGIS Online terms) or that run on volunteer capacity
+# (OpenTopoMap). Their layers are only cached while browsing.
+BULK_DOWNLOAD_FORBIDDEN_HOSTS = ("tile.openstreetmap.org", "arcgisonline.com", "opentopomap.org")
+# Upper bound for the number of tiles of one download, over all of its layers.
+MAX_TILES = 25000
+# Sent with every download request, so providers can tell offline downloads from map use.
+BULK_USER_AGENT = f"{USER_AGENT} offline-download"
+# Minimum interval in seconds between two progress reports.
+PROGRESS_INTERVAL = 0.5
+
+
+class HostRateLimiter:
+    """ Spaces out requests so that each host sees at most `rate` requests per second. """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host, cancel_event):
+        """ Blocks until the host may be contacted again. Returns False if cancelled meanwhile. """
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        return not cancel_event.wait(slot - now) if slot > now else not cancel_event.is_set()
+
+
+def bulk_download_allowed(url_template):
+    """ Returns False if the host of a layer's URL does not allow bulk downloads (see BULK_DOWNLOAD_FORBIDDEN_HOSTS). """
+    host = urlsplit(url_template).netloc.lower()
+    return not any(host == forbidden or host.endswith("." + forbidden) for forbidden in BULK_DOWNLOAD_FORBIDDEN_HOSTS)
+
+
+def save_job(path, job):
+    """ Persists the parameters of a download so it can be resumed after an interruption. """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(job, f)
+
+
+def load_job(path):
+    """ Returns the parameters of an unfinished download, or None. """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def clear_job(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class TileDownloader:
+    """
+    Downloads every tile of the given layers inside a bounding box and zoom range
+    into the layers' MBTiles stores.
+
+    Downloaded tiles are pinned in the store, so neither the download itself nor
+    later browsing evicts them. Tiles already in the store are pinned and skipped,
+    which makes a restarted download resume
+    where the previous one stopped; for WMS layers this also skips the other tiles
+    of an already fetched metatile. Identical images (e.g. blank tiles) are stored
+    once thanks to the content-hash keyed store. Layers are fetched through the
+    TileServer, so XYZ and WMS sources are handled the same way as on the map and
+    downloads are shared with tiles the map requests at the same time.
+    """
+
+    def __init__(self, tile_server, layer_ids, bbox, min_zoom, max_zoom,
+                 workers=DEFAULT_WORKERS, rate_per_host=DEFAULT_RATE_PER_HOST, on_progress=None):
+        """
+        Args:
+            tile_server (TileServer): Provides the layer definitions, upstream access and stores.
+            layer_ids (list): Ids of the registered layers to download.
+            bbox (tuple): (south, west, north, east) in degrees.
+            min_zoom (int): Lowest zoom level to download.
+            max_zoom (int): Highest zoom level to download.
+            workers (int): Number of parallel download threads.
+            rate_per_host (float): Maximum requests per second per upstream host.
+            on_progress (callable): Called with a progress dict (see `progress`).
+
+        Raises:
+            ValueError: If a layer does not allow bulk downloads or the job has more than MAX_TILES tiles.
+        """
+        self.tile_server = tile_server
+        self.layer_ids = list(layer_ids)
+        self.bbox = tuple(bbox)
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.workers = workers
+        self.rate_limiter = HostRateLimiter(rate_per_host)
+        self.on_progress = on_progress
+
+        for layer_id in self.layer_ids:
+            if not bulk_download_allowed(tile_server.layers[layer_id]["url"]):
+                raise ValueError(f"Layer '{layer_id}' does not allow bulk downloads")
+        self.total = sum(
+            tile_math.count_tiles(self.bbox, min_zoom, self._max_zoom_for(layer_id))
+            for layer_id in self.layer_ids
+        )
+        if self.total > MAX_TILES:
+            raise ValueError(f"{self.total} tiles exceed the limit of {MAX_TILES} per download")
+        self.downloaded = 0
+        self.skipped = 0
+        self.deduplicated = 0
+        self.failed = 0
+        # Message of the most recent failure, "<layer> <z>/<x>/<y>: <error>"
+        self.last_error = None
+
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._tasks = self._iter_tasks()
+        self._started_at = None
+        self._last_report = 0.0
+
+    def _max_zoom_for(self, layer_id):
+        """ Highest useful zoom of a layer; beyond its native zoom Leaflet only scales tiles. """
+        options = self.tile_server.layers[layer_id]["options"]
+        native = options.get("maxNativeZoom", options.get("maxZoom", self.max_zoom))
+        return max(self.min_zoom - 1, min(self.max_zoom, native))
+
+    def _iter_tasks(self):
+        for layer_id in self.layer_ids:
+            for z, x, y in tile_math.iter_tiles(self.bbox, self.min_zoom, self._max_zoom_for(layer_id)):
+                yield layer_id, z, x, y
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def progress(self):
+        """ Returns counters, the estimated remaining seconds and the most recent failure. """
+        with self._lock:
+            done = self.downloaded + self.skipped + self.failed
+            eta = None
+            elapsed = time.monotonic() - self._started_at if self._started_at else 0
+            # Skipped tiles cost next to nothing, so only downloads count towards the rate
+            if self.downloaded and elapsed > 0:
+                eta = (self.total - done) * elapsed / max(self.downloaded + self.failed, 1)
+            return {
+                "total": self.total,
+                "done": done,
+                "downloaded": self.downloaded,
+                "skipped": self.skipped,
+                "deduplicated": self.deduplicated,
+                "failed": self.failed,
+                "eta": eta,
+                "last_error": self.last_error,
+            }
+
+    def run(self):
+        """ Downloads all tiles, blocking until done or cancelled, and returns the final progress. """
+        self._started_at = time.monotonic()
+        threads = [threading.Thread(target=self._worker, name=f"TileDownloader-{i}", daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._report(force=True)
+        return self.progress()
+
+    def _next_task(self):
+        with self._lock:
+            return next(self._tasks, None)
+
+    def _worker(self):
+        while not self._cancel_event.is_set():
+            task = self._next_task()
+            if task is None:
+                return
+            try:
+                if not self._download(*task):
+                    return
+            except TileNotFound:
+                self._count("skipped")
+            except Exception as e:
+                # Network, metatile and store errors alike; a resumed download tries the tile again
+                layer_id, z, x, y = task
+                with self._lock:
+                    self.last_error = f"{layer_id} {z}/{x}/{y}: {e}"
+                self._count("failed")
+
+    def _download(self, layer_id, z, x, y):
+        """ Downloads and pins one tile unless the store has it. Returns False if cancelled meanwhile. """
+        store = self.tile_server.tile_cache.store(layer_id)
+        if store.pin(z, x, y):
+            self._count("skipped")
+            return True
+
+        host = urlsplit(self.tile_server.layers[layer_id]["url"]).netloc
+        if not self.rate_limiter.wait(host, self._cancel_event):
+            return False
+        _, duplicates, fetched = self.tile_server.download_tile(
+            layer_id, z, x, y, headers={"User-Agent": BULK_USER_AGENT}, pinned=True
+        )
+        if not fetched:
+            # Downloaded by the map meanwhile, which stores tiles unpinned
+            store.pin(z, x, y)
+        if duplicates:
+            self._count("deduplicated", duplicates)
+        self._count("downloaded" if fetched else "skipped")
+        return True
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+        self._report()
+
+    def _report(self, force=False):
+        if not self.on_progress:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_report < PROGRESS_INTERVAL:
+                return
+            self._last_report = now
+        self.on_progress(self.progress())
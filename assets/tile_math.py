@@ -0,0 +1,61 @@
+# This module contains helpers for Web Mercator (EPSG:3857) XYZ tile coordinates.
+
+import math
+
+# Half the circumference of the earth in EPSG:3857 metres.
+ORIGIN_SHIFT = 20037508.342789244
+# Latitude limit of the Web Mercator projection.
+MAX_LATITUDE = 85.0511287798
+
+
+def lonlat_to_tile(lon, lat, z):
+    """ Returns the (x, y) tile containing a WGS84 coordinate at zoom z. """
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    n = 1 << z
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds_3857(z, x, y, span=1):
+    """
+    Returns (minx, miny, maxx, maxy) in EPSG:3857 metres for the block of
+    span x span tiles whose top-left tile is (x, y).
+    """
+    tile_size = 2 * ORIGIN_SHIFT / (1 << z)
+    minx = -ORIGIN_SHIFT + x * tile_size
+    maxy = ORIGIN_SHIFT - y * tile_size
+    return minx, maxy - span * tile_size, minx + span * tile_size, maxy
+
+
+def tile_range(bbox, z):
+    """
+    Returns (min_x, min_y, max_x, max_y) of the tiles covering a bounding box.
+
+    Args:
+        bbox (tuple): (south, west, north, east) in degrees.
+        z (int): Zoom level.
+    """
+    south, west, north, east = bbox
+    min_x, min_y = lonlat_to_tile(west, north, z)
+    max_x, max_y = lonlat_to_tile(east, south, z)
+    return min_x, min_y, max_x, max_y
+
+
+def count_tiles(bbox, min_zoom, max_zoom):
+    """ Returns the number of tiles covering bbox over the zoom range (inclusive). """
+    total = 0
+    for z in range(min_zoom, max_zoom + 1):
+        min_x, min_y, max_x, max_y = tile_range(bbox, z)
+        total += (max_x - min_x + 1) * (max_y - min_y + 1)
+    return total
+
+
+def iter_tiles(bbox, min_zoom, max_zoom):
+    """ Yields every (z, x, y) covering bbox, lowest zoom first. """
+    for z in range(min_zoom, max_zoom + 1):
+        min_x, min_y, max_x, max_y = tile_range(bbox, z)
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                yield z, x, y
@@ -0,0 +1,278 @@
+# This module contains a local HTTP server that serves map tiles from the MBTiles cache,
+# downloading and storing them on a cache miss.
+
+import re
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from assets import metatiles
+
+# Identifies the application to tile providers (required by the OSM tile usage policy).
+USER_AGENT = "TreasureHunter/1.0 (+https://github.com/Archaonpash22/Treasure_Hunter)"
+# Maximum number of parallel upstream requests per tile host.
+DEFAULT_PER_HOST = 4
+# Timeout in seconds for a single upstream tile request.
+DEFAULT_TIMEOUT = 15
+# Lifetime the browser may keep a served tile in its own cache.
+BROWSER_MAX_AGE = 24 * 3600
+
+_TILE_PATH = re.compile(r"^/tiles/(?P<layer>[\w\-]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)(?:\.\w+)?$")
+
+
+class TileNotFound(Exception):
+    """ Raised when upstream has no tile for the requested coordinates. """
+
+
+def content_type_for(data):
+    """ Guesses the image content type from the first bytes of a tile. """
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def format_tile_url(url_template, options, z, x, y):
+    """ Fills a Leaflet-style {s}/{z}/{x}/{y} URL template for one tile. """
+    url = url_template.replace("{z}", str(z)).replace("{x}", str(x)).replace("{y}", str(y))
+    if "{s}" in url:
+        subdomains = options.get("subdomains", "abc")
+        url = url.replace("{s}", subdomains[(x + y) % len(subdomains)])
+    return url
+
+
+def wms_params(options, bounds, width, height):
+    """
+    Builds GetMap parameters for an EPSG:3857 bounding box, using the same
+    defaults as Leaflet's L.tileLayer.wms.
+    """
+    version = options.get("version", "1.1.1")
+    params = {
+        "SERVICE": "WMS",
+        "REQUEST": "GetMap",
+        "VERSION": version,
+        "LAYERS": options.get("layers", ""),
+        "STYLES": options.get("styles", ""),
+        "FORMAT": options.get("format", "image/jpeg"),
+        "TRANSPARENT": "TRUE" if options.get("transparent") else "FALSE",
+        "WIDTH": width,
+        "HEIGHT": height,
+        "BBOX": ",".join(f"{value:.6f}" for value in bounds),
+    }
+    params["CRS" if version >= "1.3" else "SRS"] = "EPSG:3857"
+    return params
+
+
+class _TileRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        match = _TILE_PATH.match(urlsplit(self.path).path)
+        if not match:
+            self.send_error(404)
+            return
+        try:
+            data = self.server.tile_server.get_tile(
+                match["layer"], int(match["z"]), int(match["x"]), int(match["y"])
+            )
+        except KeyError:
+            self.send_error(404, "Unknown layer")
+            return
+        except TileNotFound:
+            self.send_error(404)
+            return
+        except (requests.exceptions.RequestException, metatiles.MetatileError) as e:
+            self.send_error(502, str(e))
+            return
+        except sqlite3.Error as e:
+            # The tile cache could not be read or written; answer instead of dropping the connection
+            self.send_error(500, f"Tile cache error: {e}")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type_for(data))
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", f"max-age={BROWSER_MAX_AGE}")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TileServer:
+    """
+    Serves the registered tile layers on http://127.0.0.1:<port>/tiles/<layer>/{z}/{x}/{y}.
+    Upstream layers are either XYZ URL templates or WMS endpoints. WMS layers are
+    requested as buffered metatiles in EPSG:3857 and sliced locally, so one GetMap
+    fills a whole block of tiles without seams. Tiles are answered from the TileCache;
+    misses are fetched upstream once (concurrent requests for the same tile or
+    metatile wait for the same download) and stored.
+    """
+
+    def __init__(self, tile_cache, host="127.0.0.1", port=0):
+        self.tile_cache = tile_cache
+        self.layers = {}
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._host_slots = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.upstream_requests = 0
+
+        self.httpd = ThreadingHTTPServer((host, port), _TileRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.tile_server = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def register_layer(self, layer_id, url_template, options=None):
+        """
+        Registers an upstream XYZ template or WMS endpoint and returns the local
+        URL template Leaflet should use.
+        """
+        kind = "xyz" if "{z}" in url_template else "wms"
+        self.layers[layer_id] = {"url": url_template, "options": options or {}, "kind": kind}
+        return self.local_url(layer_id)
+
+    def local_path(self, layer_id):
+        """ Returns the server-relative URL template of a layer. """
+        return f"/tiles/{layer_id}/{{z}}/{{x}}/{{y}}"
+
+    def local_url(self, layer_id):
+        return self.base_url + self.local_path(layer_id)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="TileServer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.session.close()
+        self.tile_cache.close()
+
+    def get_tile(self, layer_id, z, x, y):
+        """
+        Returns the bytes of a tile, from the cache or from upstream.
+
+        Raises:
+            KeyError: If the layer is not registered.
+            TileNotFound: If upstream has no such tile.
+            requests.exceptions.RequestException: If the download fails.
+            metatiles.MetatileError: If a WMS metatile cannot be sliced.
+            sqlite3.Error: If the tile cache cannot be read or written.
+        """
+        if layer_id not in self.layers:
+            # Checked before the cache lookup, which would create a store for any name
+            raise KeyError(layer_id)
+        data = self.tile_cache.store(layer_id).get(z, x, y)
+        if data is not None:
+            return data
+        tiles, _, _ = self.download_tile(layer_id, z, x, y)
+        if (z, x, y) not in tiles:
+            raise TileNotFound(f"{layer_id}/{z}/{x}/{y}")
+        return tiles[(z, x, y)]
+
+    def download_tile(self, layer_id, z, x, y, headers=None, pinned=False):
+        """
+        Fetches a tile (for WMS layers its whole metatile) upstream and stores it.
+        Concurrent calls for the same tile or metatile share one download.
+
+        Args:
+            headers (dict): Optional extra request headers, e.g. another User-Agent.
+            pinned (bool): Pins the stored tiles (see MBTilesStore.pin).
+
+        Returns:
+            tuple: (tiles, duplicates, fetched) - tiles maps (z, x, y) to the bytes of
+            everything obtained, duplicates is the number of images the store already
+            had, and fetched is False if the download was made by another caller.
+
+        Raises:
+            Same as get_tile.
+        """
+        layer = self.layers[layer_id]
+        if layer["kind"] == "wms":
+            key = (layer_id, z) + metatiles.metatile_origin(z, x, y)
+        else:
+            key = (layer_id, z, x, y)
+        with self._lock:
+            waiter = self._in_flight.get(key)
+            is_owner = waiter is None
+            if is_owner:
+                waiter = self._in_flight[key] = {"event": threading.Event(), "tiles": {}, "error": None}
+
+        if not is_owner:
+            waiter["event"].wait()
+            if waiter["error"]:
+                raise waiter["error"]
+            return waiter["tiles"], 0, False
+
+        try:
+            tiles = self.fetch_upstream(layer, z, x, y, headers)
+            duplicates = self.tile_cache.store(layer_id).put_many(tiles, pinned)
+            waiter["tiles"] = {(tz, tx, ty): tile_data for tz, tx, ty, tile_data in tiles}
+            return waiter["tiles"], duplicates, True
+        except Exception as e:
+            waiter["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            waiter["event"].set()
+
+    def fetch_upstream(self, layer, z, x, y, headers=None):
+        """
+        Downloads a tile from the layer's upstream server. For WMS layers the whole
+        metatile around it is requested and sliced.
+
+        Returns:
+            list: (z, x, y, bytes) for every tile obtained, including the requested one.
+        """
+        if layer["kind"] == "wms":
+            options = layer["options"]
+            tile_size = options.get("tileSize", 256)
+            meta_x, meta_y, span = metatiles.metatile_origin(z, x, y)
+            bounds, width, height = metatiles.metatile_request(z, meta_x, meta_y, span, tile_size)
+            data = self.download(layer["url"], wms_params(options, bounds, width, height), headers)
+            return metatiles.slice_metatile(
+                data, z, meta_x, meta_y, span, tile_size, image_format=options.get("format", "image/jpeg")
+            )
+        url = format_tile_url(layer["url"], layer["options"], z, x, y)
+        return [(z, x, y, self.download(url, headers=headers))]
+
+    def download(self, url, params=None, headers=None):
+        """ GETs url with the per-host concurrency limit and returns the body. """
+        with self._lock:
+            self.upstream_requests += 1
+        with self._host_slot(urlsplit(url).netloc):
+            response = self.session.get(url, params=params, headers=headers, timeout=DEFAULT_TIMEOUT)
+        if response.status_code in (204, 404):
+            raise TileNotFound(url)
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "")
+        if "xml" in content_type or content_type.startswith("text/"):
+            # WMS services report errors as XML documents with status 200
+            raise requests.exceptions.HTTPError(f"Unexpected {content_type} response from {url}")
+        return response.content
+
+    def _host_slot(self, host):
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(DEFAULT_PER_HOST)
+            return self._host_slots[host]
@@ -0,0 +1,236 @@
+# This module contains a size-capped MBTiles store used as the local tile cache.
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# Default size cap for the tile images of one layer.
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Access times are only rewritten when they are older than this, to keep reads cheap.
+ACCESS_RESOLUTION = 3600
+
+
+class MBTilesStore:
+    """
+    A single MBTiles file (normalised schema with a `tiles` view) holding the
+    tiles of one layer. Images are stored once per content hash, so identical
+    tiles such as blank sea or empty overlay tiles share their bytes. Tiles are
+    evicted least-recently-used first once the images exceed max_bytes, except
+    pinned ones: tiles of offline downloads stay until they are unpinned.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, path, name, max_bytes=DEFAULT_MAX_BYTES, tile_format="png"):
+        """
+        Opens (or creates) the MBTiles file.
+
+        Args:
+            path (str): Path of the .mbtiles file.
+            name (str): Tileset name written to the metadata table.
+            max_bytes (int): Size cap for the stored images.
+            tile_format (str): Image format written to the metadata table.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS images (
+                tile_id TEXT PRIMARY KEY,
+                tile_data BLOB NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS map (
+                zoom_level INTEGER NOT NULL,
+                tile_column INTEGER NOT NULL,
+                tile_row INTEGER NOT NULL,
+                tile_id TEXT NOT NULL,
+                last_access REAL NOT NULL,
+                pinned INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (zoom_level, tile_column, tile_row)
+            );
+            CREATE INDEX IF NOT EXISTS map_last_access ON map (last_access);
+            CREATE INDEX IF NOT EXISTS map_tile_id ON map (tile_id);
+            CREATE VIEW IF NOT EXISTS tiles AS
+                SELECT map.zoom_level AS zoom_level, map.tile_column AS tile_column,
+                       map.tile_row AS tile_row, images.tile_data AS tile_data
+                FROM map JOIN images ON images.tile_id = map.tile_id;
+        """)
+        # Stores created before tiles could be pinned
+        if "pinned" not in [column[1] for column in self._db.execute("PRAGMA table_info(map)")]:
+            self._db.execute("ALTER TABLE map ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+        self._db.executemany(
+            "INSERT OR IGNORE INTO metadata (name, value) VALUES (?, ?)",
+            [("name", name), ("format", tile_format), ("type", "overlay"), ("version", "1.3")]
+        )
+        self._db.commit()
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0]
+
+    @staticmethod
+    def _tms_row(z, y):
+        """ MBTiles stores rows in TMS order (origin bottom-left). """
+        return (1 << z) - 1 - y
+
+    def get(self, z, x, y):
+        """ Returns the image bytes of an XYZ tile, or None if it is not stored. """
+        row = self._tms_row(z, y)
+        with self._lock:
+            result = self._db.execute(
+                "SELECT images.tile_data, map.last_access FROM map JOIN images ON images.tile_id = map.tile_id "
+                "WHERE map.zoom_level = ? AND map.tile_column = ? AND map.tile_row = ?", (z, x, row)
+            ).fetchone()
+            if result is None:
+                return None
+            now = time.time()
+            if now - result[1] > ACCESS_RESOLUTION:
+                self._db.execute(
+                    "UPDATE map SET last_access = ? WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                    (now, z, x, row)
+                )
+                self._db.commit()
+            return result[0]
+
+    def has(self, z, x, y):
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM map WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, self._tms_row(z, y))
+            ).fetchone() is not None
+
+    def pin(self, z, x, y):
+        """ Exempts a stored tile from eviction. Returns False if the tile is not stored. """
+        with self._lock:
+            pinned = self._db.execute(
+                "UPDATE map SET pinned = 1 WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, self._tms_row(z, y))
+            ).rowcount > 0
+            self._db.commit()
+        return pinned
+
+    def unpin_all(self):
+        """ Makes all pinned tiles evictable again and evicts down to max_bytes. Returns the number unpinned. """
+        with self._lock:
+            count = self._db.execute("UPDATE map SET pinned = 0 WHERE pinned = 1").rowcount
+            self._evict_locked()
+            self._db.commit()
+        return count
+
+    def put(self, z, x, y, data):
+        """ Stores an XYZ tile and evicts old tiles if the size cap is exceeded. """
+        return self.put_many([(z, x, y, data)])
+
+    def put_many(self, tiles, pinned=False):
+        """
+        Stores several (z, x, y, data) tiles in one transaction. Tiles that were
+        pinned stay pinned when they are replaced.
+
+        Args:
+            pinned (bool): Pins the stored tiles (see pin).
+
+        Returns:
+            int: The number of tiles whose image was already stored (deduplicated).
+        """
+        now = time.time()
+        duplicates = 0
+        with self._lock:
+            for z, x, y, data in tiles:
+                tile_id = hashlib.sha1(data).hexdigest()
+                row = self._tms_row(z, y)
+                previous = self._db.execute(
+                    "SELECT tile_id, pinned FROM map WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", (z, x, row)
+                ).fetchone()
+                if self._db.execute("INSERT OR IGNORE INTO images (tile_id, tile_data, size) VALUES (?, ?, ?)",
+                                    (tile_id, data, len(data))).rowcount:
+                    self._total_bytes += len(data)
+                else:
+                    duplicates += 1
+                self._db.execute(
+                    "INSERT OR REPLACE INTO map (zoom_level, tile_column, tile_row, tile_id, last_access, pinned) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (z, x, row, tile_id, now, int(pinned or bool(previous and previous[1])))
+                )
+                if previous and previous[0] != tile_id:
+                    self._release_image_locked(previous[0])
+            self._evict_locked()
+            self._db.commit()
+        return duplicates
+
+    def stats(self):
+        with self._lock:
+            tiles, pinned = self._db.execute("SELECT COUNT(*), COALESCE(SUM(pinned), 0) FROM map").fetchone()
+            images = self._db.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+            return {"tiles": tiles, "pinned": pinned, "images": images, "bytes": self._total_bytes,
+                    "max_bytes": self.max_bytes}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _evict_locked(self):
+        """
+        Drops the least recently used unpinned tiles and their then unreferenced images.
+        Pinned tiles count towards max_bytes but are never dropped, so the store can stay
+        above the cap while they fill it.
+        """
+        while self._total_bytes > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT zoom_level, tile_column, tile_row, tile_id FROM map WHERE pinned = 0 "
+                "ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            for zoom_level, tile_column, tile_row, tile_id in rows:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                self._db.execute(
+                    "DELETE FROM map WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                    (zoom_level, tile_column, tile_row)
+                )
+                self._release_image_locked(tile_id)
+
+    def _release_image_locked(self, tile_id):
+        """ Deletes an image once no tile refers to it anymore. """
+        if self._db.execute("SELECT 1 FROM map WHERE tile_id = ?", (tile_id,)).fetchone():
+            return
+        size = self._db.execute("SELECT size FROM images WHERE tile_id = ?", (tile_id,)).fetchone()
+        if size:
+            self._db.execute("DELETE FROM images WHERE tile_id = ?", (tile_id,))
+            self._total_bytes -= size[0]
+
+
+class TileCache:
+    """ One MBTilesStore per layer, created on first use inside a cache directory. """
+
+    def __init__(self, directory, max_bytes_per_layer=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes_per_layer = max_bytes_per_layer
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def store(self, layer_id):
+        with self._lock:
+            if layer_id not in self._stores:
+                path = os.path.join(self.directory, f"{layer_id}.mbtiles")
+                self._stores[layer_id] = MBTilesStore(path, layer_id, self.max_bytes_per_layer)
+            return self._stores[layer_id]
+
+    def unpin_all(self):
+        """ Unpins the tiles of every layer store in the cache directory. Returns the number unpinned. """
+        layer_ids = [os.path.splitext(name)[0] for name in os.listdir(self.directory) if name.endswith(".mbtiles")] \
+            if os.path.isdir(self.directory) else []
+        return sum(self.store(layer_id).unpin_all() for layer_id in layer_ids)
+
+    def stats(self):
+        with self._lock:
+            stores = dict(self._stores)
+        return {layer_id: store.stats() for layer_id, store in stores.items()}
+
+    def close(self):
+        with self._lock:
+            for store in self._stores.values():
+                store.close()
+            self._stores.clear()
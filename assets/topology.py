@@ -0,0 +1,272 @@
+# This module contains the arc extraction that turns polygon FeatureCollections into a
+# topology: every boundary shared by neighbouring regions is stored once as an arc.
+
+import numpy as np
+
+POLYGON_TYPES = ("Polygon", "MultiPolygon")
+
+
+class Topology:
+    """
+    Polygon features expressed as references into a list of shared arcs.
+
+    arcs is a list of (n, 2) float arrays of [lon, lat] positions. A polygon
+    feature's geometry becomes {'type': ..., 'arcs': [...]} with one list of arc
+    references per ring (like TopoJSON, reference ~i means arc i reversed). Other
+    geometries are kept unchanged.
+    """
+
+    def __init__(self, arcs, features):
+        self.arcs = arcs
+        self.features = features
+        self._parts = None
+
+    def subset(self, bbox, arcs=None):
+        """
+        Returns a Topology of the polygons whose bounding box intersects bbox, with
+        only the arcs they use (renumbered). MultiPolygons keep just their
+        intersecting parts; features without arcs are kept as they are.
+
+        Args:
+            bbox (tuple): (south, west, north, east) in degrees.
+            arcs (list): Optional replacement arcs of the same count (e.g. simplified ones).
+        """
+        arcs = self.arcs if arcs is None else arcs
+        south, west, north, east = bbox
+        boxes, part_features, part_numbers = self._part_index()
+        hit = (boxes[:, 2] >= west) & (boxes[:, 0] <= east) & (boxes[:, 3] >= south) & (boxes[:, 1] <= north)
+        parts = {}
+        for feature_index, part_number in zip(part_features[hit].tolist(), part_numbers[hit].tolist()):
+            parts.setdefault(feature_index, []).append(part_number)
+
+        mapping = {}
+
+        def renumber(ref):
+            index = ref if ref >= 0 else ~ref
+            new_index = mapping.setdefault(index, len(mapping))
+            return new_index if ref >= 0 else ~new_index
+
+        features = []
+        for index, feature in enumerate(self.features):
+            geometry = feature["geometry"]
+            if not _has_arcs(geometry):
+                features.append(feature)
+                continue
+            if index not in parts:
+                continue
+            polygons = geometry["arcs"] if geometry["type"] == "MultiPolygon" else [geometry["arcs"]]
+            kept = [[[renumber(ref) for ref in ring] for ring in polygons[number]] for number in parts[index]]
+            arcs_value = kept if geometry["type"] == "MultiPolygon" else kept[0]
+            features.append({**feature, "geometry": {"type": geometry["type"], "arcs": arcs_value}})
+        return Topology([arcs[index] for index in mapping], features)
+
+    def _part_index(self):
+        """
+        Returns (and caches) the bounding boxes (min_lon, min_lat, max_lon, max_lat) of
+        all polygon parts, taken from their outer rings, with the feature index and
+        part number of each.
+        """
+        if self._parts is None:
+            if self.arcs:
+                lengths = [len(arc) for arc in self.arcs]
+                offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+                points = np.concatenate(self.arcs)
+                arc_boxes = np.hstack((np.minimum.reduceat(points, offsets), np.maximum.reduceat(points, offsets)))
+            boxes, part_features, part_numbers = [], [], []
+            for index, feature in enumerate(self.features):
+                geometry = feature["geometry"]
+                if not _has_arcs(geometry):
+                    continue
+                polygons = geometry["arcs"] if geometry["type"] == "MultiPolygon" else [geometry["arcs"]]
+                for number, polygon in enumerate(polygons):
+                    if not polygon or not polygon[0]:
+                        continue
+                    ring_boxes = arc_boxes[[ref if ref >= 0 else ~ref for ref in polygon[0]]]
+                    boxes.append(np.concatenate((ring_boxes[:, :2].min(axis=0), ring_boxes[:, 2:].max(axis=0))))
+                    part_features.append(index)
+                    part_numbers.append(number)
+            self._parts = (np.array(boxes).reshape(-1, 4), np.array(part_features, dtype=int),
+                           np.array(part_numbers, dtype=int))
+        return self._parts
+
+    def to_geojson(self, arcs=None):
+        """
+        Rebuilds a GeoJSON FeatureCollection, optionally from replacement arcs of the
+        same count (e.g. simplified ones). Rings left with fewer than four positions
+        are dropped, as are polygons that lose their outer ring.
+        """
+        arcs = self.arcs if arcs is None else arcs
+        arc_lists = [arc.tolist() for arc in arcs]
+        features = []
+        for feature in self.features:
+            geometry = feature["geometry"]
+            if _has_arcs(geometry):
+                polygons = geometry["arcs"] if geometry["type"] == "MultiPolygon" else [geometry["arcs"]]
+                coordinates = [p for p in (_polygon_coordinates(polygon, arc_lists) for polygon in polygons) if p]
+                if not coordinates:
+                    continue
+                if geometry["type"] == "MultiPolygon":
+                    geometry = {"type": "MultiPolygon", "coordinates": coordinates}
+                else:
+                    geometry = {"type": "Polygon", "coordinates": coordinates[0]}
+            features.append({**feature, "geometry": geometry})
+        return {"type": "FeatureCollection", "features": features}
+
+    def encode(self, step, arcs=None):
+        """
+        Returns a compact, JSON-serialisable form of the topology for the page, decoded
+        there by decodeTopology (map_page.js). It follows TopoJSON: positions are
+        quantised to a grid of step degrees and every arc is delta-encoded, so shared
+        boundaries are sent once and as small integers.
+
+        Args:
+            step (float): Grid size in degrees; the largest error is half of it.
+            arcs (list): Optional replacement arcs of the same count (e.g. simplified ones).
+        """
+        arcs = self.arcs if arcs is None else arcs
+        if arcs:
+            origin = np.min([arc.min(axis=0) for arc in arcs], axis=0)
+        else:
+            origin = np.zeros(2)
+        encoded = []
+        for arc in arcs:
+            quantised = np.rint((arc - origin) / step).astype(np.int64)
+            # Points that fall onto the same grid position carry no information
+            moved = np.ones(len(quantised), dtype=bool)
+            moved[1:] = (np.diff(quantised, axis=0) != 0).any(axis=1)
+            quantised = quantised[moved]
+            if len(quantised) == 1:
+                quantised = np.repeat(quantised, 2, axis=0)
+            deltas = np.diff(quantised, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+            encoded.append(deltas.tolist())
+        features = [
+            {"type": "Feature", "properties": feature.get("properties"), "geometry": feature["geometry"]}
+            for feature in self.features
+        ]
+        return {
+            "type": "Topology",
+            "transform": {"scale": [step, step], "translate": origin.tolist()},
+            "arcs": encoded,
+            "features": features,
+        }
+
+
+def _has_arcs(geometry):
+    return bool(geometry) and geometry.get("type") in POLYGON_TYPES and "arcs" in geometry
+
+
+def _ring_coordinates(ring, arc_lists):
+    positions = []
+    for ref in ring:
+        arc = arc_lists[ref] if ref >= 0 else arc_lists[~ref][::-1]
+        positions.extend(arc if not positions else arc[1:])
+    return positions if len(positions) >= 4 else None
+
+
+def _polygon_coordinates(polygon, arc_lists):
+    rings = [_ring_coordinates(ring, arc_lists) for ring in polygon]
+    if not rings or rings[0] is None:
+        return None
+    return [ring for ring in rings if ring is not None]
+
+
+def _polygons_of(geometry):
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    return geometry["coordinates"]
+
+
+def extract_arcs(feature_collection):
+    """
+    Builds the Topology of a FeatureCollection.
+
+    Rings are cut at junctions, the points where neighbouring rings stop sharing a
+    path, and identical pieces (in either direction) become one arc. Positions are
+    matched exactly, which holds for datasets with shared boundaries.
+    """
+    features = feature_collection.get("features", [])
+
+    # Collect every ring as an array of positions without the closing point
+    rings = []
+    for feature in features:
+        geometry = feature.get("geometry")
+        if not geometry or geometry.get("type") not in POLYGON_TYPES:
+            continue
+        for polygon in _polygons_of(geometry):
+            for ring in polygon:
+                positions = np.asarray([position[:2] for position in ring], dtype=float).reshape(-1, 2)
+                if len(positions) > 1 and (positions[0] == positions[-1]).all():
+                    positions = positions[:-1]
+                rings.append(positions)
+
+    if rings:
+        lengths = np.array([len(ring) for ring in rings])
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        points, ids = np.unique(np.concatenate(rings), axis=0, return_inverse=True)
+        ids = ids.reshape(-1)
+        is_junction = _junctions(ids, starts, lengths, len(points))
+    arcs = []
+    arc_index = {}
+
+    def add_arc(key):
+        if key in arc_index:
+            return arc_index[key]
+        reverse_key = key[::-1]
+        if reverse_key in arc_index:
+            return ~arc_index[reverse_key]
+        arc_index[key] = len(arcs)
+        arcs.append(points[list(key)])
+        return arc_index[key]
+
+    ring_number = 0
+    result = []
+    for feature in features:
+        geometry = feature.get("geometry")
+        if not geometry or geometry.get("type") not in POLYGON_TYPES:
+            result.append(feature)
+            continue
+        polygons = []
+        for polygon in _polygons_of(geometry):
+            ring_refs = []
+            for _ in polygon:
+                start, length = starts[ring_number], lengths[ring_number]
+                ring_number += 1
+                if length < 3:
+                    # Keeps the ring order; to_geojson drops the empty ring
+                    ring_refs.append([])
+                    continue
+                ring_ids = ids[start:start + length]
+                ring_refs.append([add_arc(key) for key in _cut_ring(ring_ids, is_junction[ring_ids])])
+            polygons.append(ring_refs)
+        arcs_value = polygons if geometry["type"] == "MultiPolygon" else polygons[0]
+        result.append({**feature, "geometry": {"type": geometry["type"], "arcs": arcs_value}})
+    return Topology(arcs, result)
+
+
+def _junctions(ids, starts, lengths, point_count):
+    """
+    Marks the points that are visited with different neighbours by different rings
+    (or by the same ring), i.e. where shared boundaries begin or end.
+    """
+    positions = np.arange(len(ids))
+    ring_of = np.repeat(np.arange(len(lengths)), lengths)
+    ring_start, ring_end = starts[ring_of], starts[ring_of] + lengths[ring_of] - 1
+    previous = ids[np.where(positions == ring_start, ring_end, positions - 1)]
+    following = ids[np.where(positions == ring_end, ring_start, positions + 1)]
+    neighbours = np.stack([ids, np.minimum(previous, following), np.maximum(previous, following)], axis=1)
+    distinct = np.unique(neighbours, axis=0)
+    return np.bincount(distinct[:, 0], minlength=point_count) > 1
+
+
+def _cut_ring(ring_ids, junction_mask):
+    """ Returns the point id tuples of the arcs a ring consists of. """
+    cuts = np.flatnonzero(junction_mask)
+    if len(cuts) == 0:
+        # Closed ring without junctions: start at the smallest id so that the same
+        # ring in another feature (e.g. an enclave and its hole) gives the same key
+        first = int(np.argmin(ring_ids))
+        rotated = np.concatenate((ring_ids[first:], ring_ids[:first], ring_ids[first:first + 1]))
+        return [tuple(rotated.tolist())]
+    rotated = np.concatenate((ring_ids[cuts[0]:], ring_ids[:cuts[0] + 1]))
+    cuts = np.append(cuts - cuts[0], len(ring_ids))
+    return [tuple(rotated[cuts[i]:cuts[i + 1] + 1].tolist()) for i in range(len(cuts) - 1)]
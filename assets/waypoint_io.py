@@ -0,0 +1,258 @@
+# This module contains streaming readers and writers for waypoint files (GPX, KML and CSV).
+
+import csv
+import os
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+# File formats by file extension.
+FORMATS = {".gpx": "gpx", ".kml": "kml", ".csv": "csv"}
+# Number of waypoints between two progress reports.
+PROGRESS_INTERVAL = 10000
+# Bytes of a CSV file looked at to detect its delimiter.
+CSV_SNIFF_SIZE = 64 * 1024
+# Accepted CSV column names, lower case, in order of preference.
+CSV_COLUMNS = {
+    "id": ("id",),
+    "lat": ("lat", "latitude", "breite", "y"),
+    "lon": ("lon", "lng", "long", "longitude", "laenge", "länge", "x"),
+    "name": ("comment", "name", "title", "kommentar"),
+    "description": ("description", "desc", "beschreibung"),
+    "icon": ("icon", "sym", "symbol", "type"),
+}
+# Column order of exported CSV files.
+CSV_EXPORT_COLUMNS = ("id", "lat", "lon", "comment", "icon")
+
+GPX_NAMESPACE = "http://www.topografix.com/GPX/1/1"
+KML_NAMESPACE = "http://www.opengis.net/kml/2.2"
+# Namespace of the GPX extension element carrying the marker id, so a re-import replaces instead of duplicating.
+GPX_EXTENSION_NAMESPACE = "https://github.com/Archaonpash22/Treasure_Hunter/gpx/1"
+
+
+def file_format(path):
+    """
+    Returns the format ('gpx', 'kml' or 'csv') of a waypoint file by its extension.
+
+    Raises:
+        ValueError: If the extension is not one of FORMATS.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unsupported waypoint file type '{extension}'")
+    return FORMATS[extension]
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child_text(element, name):
+    for child in element:
+        if _local_name(child.tag) == name:
+            return (child.text or "").strip()
+    return ""
+
+
+def _iter_elements(path, name):
+    """
+    Yields every element with the given local name of an XML file, parsed
+    incrementally. Each element is complete when yielded and is discarded
+    afterwards, as is everything outside of them, so memory stays flat.
+    """
+    stack = []
+    # Number of open elements that are (inside) a wanted element
+    inside = 0
+    for event, element in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            stack.append(element)
+            if inside or _local_name(element.tag) == name:
+                inside += 1
+            continue
+        stack.pop()
+        if inside:
+            inside -= 1
+            if inside:
+                continue
+            yield element
+        if stack:
+            stack[-1].remove(element)
+
+
+def _gpx_marker_id(element):
+    for child in element:
+        if _local_name(child.tag) == "extensions":
+            marker_id = child.find(f"{{{GPX_EXTENSION_NAMESPACE}}}id")
+            return (marker_id.text or "").strip() if marker_id is not None else ""
+    return ""
+
+
+def _gpx_waypoints(path):
+    for element in _iter_elements(path, "wpt"):
+        yield {
+            "id": _gpx_marker_id(element),
+            "lat": element.get("lat"),
+            "lon": element.get("lon"),
+            "name": _child_text(element, "name"),
+            "description": _child_text(element, "desc") or _child_text(element, "cmt"),
+            "icon": _child_text(element, "sym"),
+        }
+
+
+def _kml_waypoints(path):
+    for element in _iter_elements(path, "Placemark"):
+        coordinates, icon, marker_id = None, "", ""
+        for child in element.iter():
+            tag = _local_name(child.tag)
+            if tag == "Point" and coordinates is None:
+                coordinates = _child_text(child, "coordinates")
+            elif tag == "Data" and child.get("name") == "icon":
+                icon = _child_text(child, "value")
+            elif tag == "Data" and child.get("name") == "id":
+                marker_id = _child_text(child, "value")
+        if not coordinates:
+            # Lines and polygons are not waypoints
+            continue
+        lon, lat = (coordinates.split()[0].split(",") + ["", ""])[:2]
+        yield {
+            "id": marker_id,
+            "lat": lat,
+            "lon": lon,
+            "name": _child_text(element, "name"),
+            "description": _child_text(element, "description"),
+            "icon": icon,
+        }
+
+
+def _csv_waypoints(path):
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        sample = f.read(CSV_SNIFF_SIZE)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        header = [column.strip().lower() for column in next(reader, [])]
+        columns = {}
+        for field, names in CSV_COLUMNS.items():
+            for name in names:
+                if name in header:
+                    columns[field] = header.index(name)
+                    break
+        if "lat" not in columns or "lon" not in columns:
+            raise ValueError("CSV file needs a latitude and a longitude column")
+        for row in reader:
+            if not any(row):
+                continue
+            yield {field: row[index].strip() if index < len(row) else "" for field, index in columns.items()}
+
+
+def read_waypoints(path, progress=None):
+    """
+    Yields the waypoints of a GPX, KML or CSV file one at a time, without reading
+    the whole file into memory. GPX files contribute their <wpt> elements, KML
+    files their point placemarks.
+
+    Args:
+        path (str): Path of the file; the format follows from its extension.
+        progress (callable): Optional; called with the number of waypoints read
+            every PROGRESS_INTERVAL waypoints.
+
+    Yields:
+        dict: 'lat' and 'lon' as floats, 'name', 'description' and 'icon' as
+            strings (possibly empty) and 'id' if the file names one, as the files
+            written by write_waypoints do.
+            Waypoints without valid coordinates are skipped.
+
+    Raises:
+        ValueError: If the format is not supported or the CSV file has no coordinate columns.
+        xml.etree.ElementTree.ParseError: If a GPX or KML file is malformed.
+    """
+    readers = {"gpx": _gpx_waypoints, "kml": _kml_waypoints, "csv": _csv_waypoints}
+    count = 0
+    for waypoint in readers[file_format(path)](path):
+        try:
+            # Decimal commas come with semicolon-separated CSV files from German spreadsheets
+            lat = float(str(waypoint["lat"]).replace(",", "."))
+            lon = float(str(waypoint["lon"]).replace(",", "."))
+        except (TypeError, ValueError):
+            continue
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            continue
+        waypoint["lat"], waypoint["lon"] = lat, lon
+        if not waypoint.get("id"):
+            waypoint.pop("id", None)
+        yield waypoint
+        count += 1
+        if progress and count % PROGRESS_INTERVAL == 0:
+            progress(count)
+
+
+def _gpx_lines(markers):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield (f'<gpx version="1.1" creator="Treasure Hunter" xmlns="{GPX_NAMESPACE}" '
+           f'xmlns:th="{GPX_EXTENSION_NAMESPACE}">\n')
+    for marker in markers:
+        yield (f'  <wpt lat="{marker["lat"]}" lon="{marker["lon"]}"><name>{escape(marker["comment"] or "")}</name>'
+               f'<sym>{escape(marker["icon"] or "")}</sym>'
+               f'<extensions><th:id>{escape(marker["id"])}</th:id></extensions></wpt>\n')
+    yield "</gpx>\n"
+
+
+def _kml_lines(markers):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f'<kml xmlns="{KML_NAMESPACE}"><Document><name>Meine Fundorte</name>\n'
+    for marker in markers:
+        yield (f'  <Placemark><name>{escape(marker["comment"] or "")}</name>'
+               f'<ExtendedData><Data name="id"><value>{escape(marker["id"])}</value></Data>'
+               f'<Data name="icon"><value>{escape(marker["icon"] or "")}</value></Data></ExtendedData>'
+               f'<Point><coordinates>{marker["lon"]},{marker["lat"]}</coordinates></Point></Placemark>\n')
+    yield "</Document></kml>\n"
+
+
+def write_waypoints(path, markers, progress=None):
+    """
+    Writes markers to a GPX, KML or CSV file one at a time. The file is written
+    under a temporary name and only replaces path once it is complete.
+
+    Args:
+        path (str): Path of the file; the format follows from its extension.
+        markers (iterable): Marker dicts (id, lat, lon, comment, icon), e.g. MarkerStore.iter_markers().
+        progress (callable): Optional; called with the number of markers written
+            every PROGRESS_INTERVAL markers.
+
+    Returns:
+        int: Number of written markers.
+
+    Raises:
+        ValueError: If the format is not supported.
+        OSError: If the file cannot be written.
+    """
+    file_type = file_format(path)
+    count = 0
+
+    def counted(markers):
+        nonlocal count
+        for marker in markers:
+            yield marker
+            count += 1
+            if progress and count % PROGRESS_INTERVAL == 0:
+                progress(count)
+
+    temp_path = path + ".part"
+    try:
+        with open(temp_path, "w", encoding="utf-8", newline="") as f:
+            if file_type == "csv":
+                writer = csv.writer(f)
+                writer.writerow(CSV_EXPORT_COLUMNS)
+                for marker in counted(markers):
+                    writer.writerow([marker.get(column, "") for column in CSV_EXPORT_COLUMNS])
+            else:
+                lines = _gpx_lines if file_type == "gpx" else _kml_lines
+                f.writelines(lines(counted(markers)))
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return count
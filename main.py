@@ -1,5 +1,6 @@
 import sys
 import re
+import bisect
 import json
 import os
 import uuid
@@ -7,7 +8,6 @@ import webbrowser
 import http.server
 import socketserver
 import threading
-import requests
 
 # This must be set before the QApplication is instantiated.
 os.environ["QTWEBENGINE_REMOTE_DEBUGGING"] = "8888"
@@ -15,73 +15,311 @@ os.environ["QTWEBENGINE_REMOTE_DEBUGGING"] = "8888"
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLineEdit, QPushButton, QLabel, QMessageBox, QStatusBar, QSlider,
-    QTextEdit, QComboBox, QListWidget, QListWidgetItem, QDialog,
-    QDialogButtonBox, QFormLayout, QCheckBox, QFrame, QMenu
+    QTextEdit, QComboBox, QListView, QDialog,
+    QDialogButtonBox, QFormLayout, QCheckBox, QFrame, QMenu, QSpinBox, QInputDialog, QFileDialog
 )
 from PyQt6.QtGui import QAction
-from PyQt6.QtCore import QFile, QTextStream, Qt, pyqtSignal, QThread
+from PyQt6.QtCore import (
+    QFile, QTextStream, Qt, pyqtSignal, QThread, QObject, QAbstractListModel, QModelIndex, QSortFilterProxyModel
+)
 
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
 
 # Local Imports
-from map_widget import MapWidget
+from map_widget import MapWidget, register_app_scheme
 from assets import border_fetcher
-from assets.countries.europe import germany as germany_assets
-from assets.countries.europe import austria as austria_assets
-from assets.countries.europe import switzerland as switzerland_assets
-from assets.countries.europe import italy as italy_assets
-
-class UrlFetcherThread(QThread):
-    """ A QThread to fetch data from a URL in the background without freezing the UI. """
+from assets import border_jobs
+from assets import fetch_proxy
+from assets import http_cache
+from assets import map_assets
+from assets import marker_store
+from assets import marker_sync
+from assets import region_store
+from assets import simplify
+from assets import tile_downloader
+from assets import terrain_registry
+from assets import tile_math
+from assets import tile_server
+from assets import tile_store
+from assets import waypoint_io
+
+# Icons a marker can have; markers store the lower-case name
+MARKER_ICONS = ["Start", "Punkt", "Münze", "Ziel", "Viereckschanze", "Kastell", "Siedlung", "Coin", "Treasure", "Modern"]
+# Waypoint files that can be imported into and exported from "Meine Fundorte"
+WAYPOINT_FILE_FILTER = "Wegpunkt-Dateien (*.gpx *.kml *.csv);;GPX (*.gpx);;KML (*.kml);;CSV (*.csv)"
+# Folder below poi_data that POI layers created by an import are written to
+POI_IMPORT_CATEGORY = "imports"
+# The user's markers ("Meine Fundorte"); markers.json is the format they were kept in before
+MARKER_STORE_FILE = "markers.sqlite"
+LEGACY_MARKERS_FILE = "markers.json"
+# Persistent cache for responses fetched on behalf of the page (e.g. UtfGrid JSON)
+HTTP_CACHE_FILE = os.path.join("cache", "http_cache.sqlite")
+HTTP_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Lifetime for cached responses without any freshness headers of their own
+HTTP_CACHE_DEFAULT_MAX_AGE = 7 * 24 * 3600
+# Compressed cache for border GeoJSON, stored together with its parsed form
+BORDER_CACHE_FILE = os.path.join("cache", "borders.sqlite")
+BORDER_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+# Border datasets change rarely; GitHub raw only allows them to be cached for five minutes
+BORDER_CACHE_MIN_MAX_AGE = 30 * 24 * 3600
+# Natural Earth regions split by country, so one country's regions load on their own
+REGION_STORE_FILE = os.path.join("cache", "regions.sqlite")
+# MBTiles files backing the local tile server, one per layer
+TILE_CACHE_DIR = os.path.join("cache", "tiles")
+TILE_CACHE_MAX_BYTES_PER_LAYER = 512 * 1024 * 1024
+# Parameters of an unfinished offline download, kept so it can be resumed
+TILE_DOWNLOAD_JOB_FILE = os.path.join("cache", "tile_download.json")
+# Directory of QtWebEngine's disk cache (HTTP cache and compiled page scripts)
+WEB_ENGINE_CACHE_DIR = os.path.join("cache", "webengine")
+# Pre-rasterised icon sprite sheets, keyed by a hash of the icon contents
+ICON_ATLAS_DIR = os.path.join("cache", "icons")
+
+
+class UrlFetchProxy(QObject):
+    """
+    Fetches URLs for the page through a shared worker pool and hands the results
+    back to the UI thread via queued signals.
+    """
     data_ready = pyqtSignal(str, object) # request_id, data
     error = pyqtSignal(str, str) # request_id, error_message
 
-    def __init__(self, request_id, url):
+    def __init__(self, cache=None, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.pool = fetch_proxy.FetchPool(self._emit_data, self._emit_error, cache=cache)
+
+    def fetch(self, request_id, url):
+        self.pool.submit(request_id, url)
+
+    def cancel(self, request_id):
+        self.pool.cancel(request_id)
+
+    def stop(self):
+        self.pool.shutdown()
+        if self.cache:
+            self.cache.close()
+
+    def _emit_data(self, request_ids, data):
+        for request_id in request_ids:
+            self.data_ready.emit(request_id, data)
+
+    def _emit_error(self, request_ids, error_message):
+        for request_id in request_ids:
+            self.error.emit(request_id, error_message)
+
+
+class BorderJobRunner(QObject):
+    """
+    Fetches border layers on a shared BorderJobScheduler, one job per page layer id,
+    and hands the results back to the UI thread via queued signals. The data is
+    handed over as simplify.BorderLevels, whose resolution levels are precomputed
+    on the worker as well.
+    """
+    data_ready = pyqtSignal(str, object) # layer_id, BorderLevels
+    progress = pyqtSignal(str, int, int) # layer_id, bytes, features
+    error = pyqtSignal(str, str) # layer_id, error_message
+    message = pyqtSignal(str, str) # layer_id, log_message
+
+    def __init__(self, cache=None, region_store=None, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.region_store = region_store
+        self.scheduler = border_jobs.BorderJobScheduler(self.data_ready.emit, self.error.emit, self.progress.emit)
+
+    def fetch(self, layer_id, admin_level, country_name=None):
+        """ Queues a border layer; returns False if it is already being fetched. """
+        def work(cancelled, progress):
+            data = border_fetcher.get_admin_borders(
+                admin_level, country_name, self.cache, self.region_store, progress=progress, cancelled=cancelled,
+                log=lambda text: self.message.emit(layer_id, text)
+            )
+            if cancelled():
+                raise border_fetcher.DownloadCancelled()
+            return simplify.BorderLevels(data)
+        return self.scheduler.submit(layer_id, work)
+
+    def cancel(self, layer_id):
+        self.scheduler.cancel(layer_id)
+
+    def stop(self):
+        """
+        Cancels all border jobs and waits at most border_jobs.SHUTDOWN_TIMEOUT for running ones.
+        Returns False if some are still running.
+        """
+        return self.scheduler.shutdown()
+
+
+class TileDownloadThread(QThread):
+    """
+    A QThread running a TileDownloader so the UI stays responsive during
+    large offline downloads.
+    """
+    progress = pyqtSignal(dict)
+
+    def __init__(self, downloader):
         super().__init__()
-        self.request_id = request_id
-        self.url = url
-        self.is_running = True
+        self.downloader = downloader
+        self.downloader.on_progress = self.progress.emit
+        self.result = None
 
     def run(self):
-        try:
-            if not self.is_running: return
-            response = requests.get(self.url, timeout=10)
-            if not self.is_running: return
-            response.raise_for_status()
-            self.data_ready.emit(self.request_id, response.json())
-        except requests.exceptions.RequestException as e:
-            if self.is_running: self.error.emit(self.request_id, str(e))
-        except json.JSONDecodeError:
-            if self.is_running: self.error.emit(self.request_id, "Invalid JSON response")
+        self.result = self.downloader.run()
 
     def stop(self):
-        self.is_running = False
+        self.downloader.cancel()
 
 
-class BorderFetcherThread(QThread):
+class WaypointFileThread(QThread):
     """
-    A QThread to fetch border data in the background to avoid freezing the UI.
+    A QThread running a waypoint import or export, so reading or writing hundreds
+    of thousands of waypoints does not block the UI.
     """
-    data_ready = pyqtSignal(int, str, dict)
-    error = pyqtSignal(str)
-    
-    def __init__(self, admin_level, country_name=None):
+    progress = pyqtSignal(int)
+
+    def __init__(self, work):
+        """
+        Args:
+            work (callable): Called as work(progress) on the thread; progress(count)
+                reports the number of waypoints processed. Its return value is the result.
+        """
         super().__init__()
-        self.admin_level = admin_level
-        self.country_name = country_name
-        self.is_running = True
+        self.work = work
+        self.result = None
+        self.error = None
 
     def run(self):
         try:
-            if not self.is_running: return
-            data = border_fetcher.get_admin_borders(self.admin_level, self.country_name)
-            if self.is_running: self.data_ready.emit(self.admin_level, self.country_name, data)
+            self.result = self.work(self.progress.emit)
         except Exception as e:
-            if self.is_running: self.error.emit(str(e))
-            
-    def stop(self):
-        self.is_running = False
+            self.error = str(e)
+
+
+class PoiRegionThread(QThread):
+    """
+    A QThread preparing border regions and assigning the POIs to them, so counting
+    or filtering large POI layers does not block the UI.
+    """
+
+    def __init__(self, work):
+        """
+        Args:
+            work (callable): Called without arguments on the thread. Its return value is the result.
+        """
+        super().__init__()
+        self.work = work
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.work()
+        except Exception as e:
+            self.error = str(e)
+
+
+def poi_coordinates(pois):
+    """ Returns the indices, longitudes and latitudes of the valid entries of a POI layer. """
+    entries = [
+        (index, poi['lon'], poi['lat']) for index, poi in enumerate(pois)
+        if isinstance(poi, dict) and isinstance(poi.get('lat'), (int, float)) and isinstance(poi.get('lon'), (int, float))
+    ]
+    indices, lons, lats = zip(*entries) if entries else ((), (), ())
+    return list(indices), lons, lats
+
+
+def poi_regions(levels, file_key, pois):
+    """
+    Returns the indices of a POI layer's entries and the region (index into the
+    prepared regions of the border levels, -1 for none) of each. Assignments are
+    cached per border layer.
+    """
+    indices, lons, lats = poi_coordinates(pois)
+    return indices, levels.prepared_regions().assign(file_key, lons, lats)
+
+
+def waypoint_to_marker(waypoint):
+    """ Turns a waypoint read by waypoint_io into a marker; unknown icons become 'punkt'. """
+    icon = waypoint.get("icon", "").lower()
+    return {
+        "id": waypoint.get("id") or str(uuid.uuid4()),
+        "lat": waypoint["lat"],
+        "lon": waypoint["lon"],
+        "comment": waypoint.get("name") or waypoint.get("description") or "Unbenannter Marker",
+        "icon": icon if icon in (name.lower() for name in MARKER_ICONS) else "punkt",
+    }
+
+
+def poi_to_marker(layer_key, index, poi):
+    """ Turns an entry of a POI layer into a marker for waypoint_io.write_waypoints. """
+    return {
+        "id": f"{os.path.splitext(layer_key)[0]}/{index}",
+        "lat": poi["lat"],
+        "lon": poi["lon"],
+        "comment": poi.get("name") or "",
+        "icon": "punkt",
+    }
+
+
+class TileDownloadDialog(QDialog):
+    """
+    Dialog for choosing the layers and zoom range of an offline download.
+    """
+    def __init__(self, bbox, layer_labels, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Gebiet offline verfügbar machen")
+        self.setModal(True)
+        self.bbox = bbox
+        self.layout = QFormLayout(self)
+        south, west, north, east = bbox
+        self.layout.addRow("Gebiet:", QLabel(f"{south:.4f}, {west:.4f} – {north:.4f}, {east:.4f}"))
+
+        self.layer_checkboxes = {}
+        for layer_id, label in layer_labels.items():
+            checkbox = QCheckBox(label)
+            checkbox.stateChanged.connect(self.update_estimate)
+            self.layer_checkboxes[layer_id] = checkbox
+            self.layout.addRow(checkbox)
+
+        self.min_zoom_input = QSpinBox()
+        self.min_zoom_input.setRange(0, 20)
+        self.min_zoom_input.setValue(10)
+        self.min_zoom_input.valueChanged.connect(self.update_estimate)
+        self.layout.addRow("Min. Zoom:", self.min_zoom_input)
+        self.max_zoom_input = QSpinBox()
+        self.max_zoom_input.setRange(0, 20)
+        self.max_zoom_input.setValue(15)
+        self.max_zoom_input.valueChanged.connect(self.update_estimate)
+        self.layout.addRow("Max. Zoom:", self.max_zoom_input)
+
+        self.estimate_label = QLabel()
+        self.layout.addRow("Kacheln:", self.estimate_label)
+        self.button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        self.button_box.accepted.connect(self.accept)
+        self.button_box.rejected.connect(self.reject)
+        self.layout.addRow(self.button_box)
+        self.update_estimate()
+
+    def update_estimate(self):
+        data = self.get_data()
+        per_layer = 0
+        if data["min_zoom"] <= data["max_zoom"]:
+            per_layer = tile_math.count_tiles(self.bbox, data["min_zoom"], data["max_zoom"])
+        total = per_layer * len(data['layer_ids'])
+        too_many = total > tile_downloader.MAX_TILES
+        limit_text = f" – höchstens {tile_downloader.MAX_TILES} erlaubt" if too_many else ""
+        self.estimate_label.setText(f"max. {total}{limit_text}")
+        self.button_box.button(QDialogButtonBox.StandardButton.Ok).setEnabled(
+            per_layer > 0 and bool(data["layer_ids"]) and not too_many
+        )
+
+    def get_data(self):
+        return {
+            "bbox": list(self.bbox),
+            "layer_ids": [layer_id for layer_id, checkbox in self.layer_checkboxes.items() if checkbox.isChecked()],
+            "min_zoom": self.min_zoom_input.value(),
+            "max_zoom": self.max_zoom_input.value()
+        }
 
 
 class AddMarkerDialog(QDialog):
@@ -97,7 +335,7 @@ class AddMarkerDialog(QDialog):
         self.comment_input.setPlaceholderText("z.B. Keltenschanze, Römische Münze...")
         self.layout.addRow("Kommentar:", self.comment_input)
         self.icon_selector = QComboBox()
-        self.icon_selector.addItems(["Start", "Punkt", "Münze", "Ziel", "Viereckschanze", "Kastell", "Siedlung", "Coin", "Treasure", "Modern"])
+        self.icon_selector.addItems(MARKER_ICONS)
         self.layout.addRow("Icon:", self.icon_selector)
         self.button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         self.button_box.accepted.connect(self.accept)
@@ -110,11 +348,72 @@ class AddMarkerDialog(QDialog):
             "icon": self.icon_selector.currentText().lower()
         }
 
+class MarkerListModel(QAbstractListModel):
+    """
+    List model of the user's markers, kept sorted by comment. It only holds the
+    order of the marker ids; the marker dicts stay in the shared markers dict.
+    Markers are inserted and removed row by row (binary search on the sort keys),
+    so views and proxies on top of it never have to be rebuilt or re-sorted.
+    """
+    def __init__(self, markers, parent=None):
+        super().__init__(parent)
+        self._markers = markers
+        self._ids = []
+        self._keys = []
+
+    @staticmethod
+    def _sort_key(marker):
+        return (marker['comment'].casefold(), marker['id'])
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        marker = self._markers[self._ids[index.row()]]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f"{marker['comment']} ({marker['icon']})"
+        if role == Qt.ItemDataRole.UserRole:
+            return marker['id']
+        return None
+
+    def set_markers(self, markers):
+        """ Replaces the whole list, e.g. after loading; markers becomes the dict the model reads. """
+        self.beginResetModel()
+        self._markers = markers
+        ordered = sorted(markers.values(), key=self._sort_key)
+        self._ids = [marker['id'] for marker in ordered]
+        self._keys = [self._sort_key(marker) for marker in ordered]
+        self.endResetModel()
+
+    def add_marker(self, marker):
+        """ Inserts the row of a marker that was just added to the markers dict. """
+        key = self._sort_key(marker)
+        row = bisect.bisect(self._keys, key)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._keys.insert(row, key)
+        self._ids.insert(row, marker['id'])
+        self.endInsertRows()
+
+    def remove_marker(self, marker):
+        """ Removes the row of a marker; call it before the marker leaves the markers dict. """
+        key = self._sort_key(marker)
+        row = bisect.bisect_left(self._keys, key)
+        if row == len(self._keys) or self._keys[row] != key:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._keys[row]
+        del self._ids[row]
+        self.endRemoveRows()
+
+
 class TreasureHunterApp(QMainWindow):
     """
     Main application window for the Treasure Hunter app.
     """
     request_add_marker_dialog = pyqtSignal(float, float)
+    marker_write_failed = pyqtSignal(list, str) # marker_ids, error_message
 
     def __init__(self):
         super().__init__()
@@ -122,11 +421,41 @@ class TreasureHunterApp(QMainWindow):
         self.setGeometry(100, 100, 1300, 850)
         self.geolocator = Nominatim(user_agent="treasure_hunter_app_v40")
         self.markers = {}
-        self.markers_file = "markers.json"
+        # Failed writes are reported from the store's writer thread, hence through a signal
+        self.marker_write_failed.connect(self.on_marker_write_failed)
+        self.marker_store = marker_store.MarkerStore(MARKER_STORE_FILE, on_error=self.marker_write_failed.emit)
+        # One model of the markers behind both the marker list and the destination selector
+        self.marker_model = MarkerListModel(self.markers, self)
+        # What the page's permanent markers show, so only changes are sent to it
+        self.marker_sync = marker_sync.MarkerSync()
         self.poi_data = {}
         self.current_location = None
-        self.border_fetcher_thread = None
-        self.url_fetcher_threads = {}
+        # Resolution levels of the loaded border layers, by page layer id
+        self.border_levels = {}
+        # Menu actions of the border layers being fetched, by page layer id
+        self.border_actions = {}
+        self.http_cache = http_cache.HttpCache(
+            HTTP_CACHE_FILE, max_bytes=HTTP_CACHE_MAX_BYTES, default_max_age=HTTP_CACHE_DEFAULT_MAX_AGE
+        )
+        self.url_fetch_proxy = UrlFetchProxy(self.http_cache, self)
+        self.border_cache = http_cache.HttpCache(
+            BORDER_CACHE_FILE, max_bytes=BORDER_CACHE_MAX_BYTES, min_max_age=BORDER_CACHE_MIN_MAX_AGE, compress=True
+        )
+        self.region_store = region_store.RegionStore(REGION_STORE_FILE, max_age=BORDER_CACHE_MIN_MAX_AGE)
+        self.border_jobs = BorderJobRunner(self.border_cache, self.region_store, self)
+        self.border_jobs.data_ready.connect(self.on_border_job_finished)
+        self.border_jobs.progress.connect(self.on_border_fetch_progress)
+        self.border_jobs.error.connect(self.on_border_job_error)
+        self.border_jobs.message.connect(lambda layer_id, text: self.add_log(f"Borders ({layer_id}): {text}"))
+        self.tile_server = tile_server.TileServer(
+            tile_store.TileCache(TILE_CACHE_DIR, TILE_CACHE_MAX_BYTES_PER_LAYER)
+        )
+        self.tile_server.start()
+        self.tile_download_thread = None
+        self.waypoint_thread = None
+        self.poi_region_thread = None
+        self.url_fetch_proxy.data_ready.connect(self.on_url_data_ready)
+        self.url_fetch_proxy.error.connect(self.on_url_fetch_error)
         
         self.init_ui()
         self.setStatusBar(QStatusBar(self))
@@ -173,6 +502,14 @@ class TreasureHunterApp(QMainWindow):
         control_layout.addWidget(ziel_label)
         self.destination_selector = QComboBox()
         self.destination_selector.setToolTip("Wählen Sie einen gespeicherten Fundort als Ziel")
+        self.destination_selector.setPlaceholderText("Ziel auswählen...")
+        # Measuring every entry to size the box would touch all markers
+        self.destination_selector.setSizeAdjustPolicy(QComboBox.SizeAdjustPolicy.AdjustToMinimumContentsLengthWithIcon)
+        destination_view = QListView()
+        destination_view.setUniformItemSizes(True)
+        self.destination_selector.setView(destination_view)
+        self.destination_selector.setModel(self.marker_model)
+        self.destination_selector.setCurrentIndex(-1)
         control_layout.addWidget(self.destination_selector)
         navigate_button = QPushButton("Route starten")
         navigate_button.clicked.connect(self.navigate_to_destination)
@@ -198,10 +535,20 @@ class TreasureHunterApp(QMainWindow):
         marker_label = QLabel("Meine Fundorte")
         marker_label.setObjectName("titleLabel")
         control_layout.addWidget(marker_label)
-        self.marker_list_widget = QListWidget()
-        self.marker_list_widget.setObjectName("markerList")
-        self.marker_list_widget.itemDoubleClicked.connect(self.center_on_marker)
-        control_layout.addWidget(self.marker_list_widget)
+        self.marker_filter_input = QLineEdit()
+        self.marker_filter_input.setPlaceholderText("Fundorte filtern...")
+        control_layout.addWidget(self.marker_filter_input)
+        # The model is already sorted, the proxy only filters
+        self.marker_proxy = QSortFilterProxyModel(self)
+        self.marker_proxy.setSourceModel(self.marker_model)
+        self.marker_proxy.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        self.marker_filter_input.textChanged.connect(self.marker_proxy.setFilterFixedString)
+        self.marker_list_view = QListView()
+        self.marker_list_view.setObjectName("markerList")
+        self.marker_list_view.setUniformItemSizes(True)
+        self.marker_list_view.setModel(self.marker_proxy)
+        self.marker_list_view.doubleClicked.connect(self.center_on_marker)
+        control_layout.addWidget(self.marker_list_view)
         delete_marker_button = QPushButton("Ausgewählten Marker löschen")
         delete_marker_button.clicked.connect(self.delete_selected_marker)
         control_layout.addWidget(delete_marker_button)
@@ -215,34 +562,17 @@ class TreasureHunterApp(QMainWindow):
         self.log_console.setFixedHeight(120)
         control_layout.addWidget(self.log_console)
 
-        terrain_data = {
-            'germany': {
-                'layers': germany_assets.terrain_layers,
-                'bounds': germany_assets.bounds,
-                'logic': germany_assets.layer_logic
-            },
-            'austria': {
-                'layers': austria_assets.terrain_layers,
-                'bounds': austria_assets.bounds,
-                'logic': austria_assets.layer_logic
-            },
-            'switzerland': {
-                'layers': switzerland_assets.terrain_layers,
-                'bounds': switzerland_assets.bounds,
-                'logic': switzerland_assets.layer_logic
-            },
-            'italy': {
-                'layers': italy_assets.terrain_layers,
-                'bounds': italy_assets.bounds,
-                'logic': italy_assets.layer_logic
-            }
-        }
-        self.map_widget = MapWidget(terrain_data)
+        terrain_data = terrain_registry.build_terrain_registry()
+        self.map_widget = MapWidget(terrain_data, self.tile_server, WEB_ENGINE_CACHE_DIR, ICON_ATLAS_DIR)
         
         self.map_widget.bridge.log_requested.connect(self.add_log)
         self.map_widget.bridge.map_ready.connect(self.on_map_ready)
         self.map_widget.bridge.map_right_clicked.connect(self.handle_map_right_click)
         self.map_widget.bridge.fetch_url_requested.connect(self.fetch_url_from_js)
+        self.map_widget.bridge.fetch_cancel_requested.connect(self.url_fetch_proxy.cancel)
+        self.map_widget.bridge.area_selected.connect(self.show_tile_download_dialog)
+        self.map_widget.bridge.border_view_requested.connect(self.on_border_view_requested)
+        self.map_widget.bridge.marker_resync_requested.connect(self.resync_markers_on_map)
         
         main_layout.addWidget(control_panel)
         main_layout.addWidget(self.map_widget)
@@ -284,11 +614,63 @@ class TreasureHunterApp(QMainWindow):
         # Regions
         self.regions_menu = border_menu.addMenu("Regions")
         self.populate_regions_menu()
+
+        border_menu.addSeparator()
+        count_pois_action = QAction("POIs nach Regionen zählen", self)
+        count_pois_action.triggered.connect(self.count_pois_by_region)
+        border_menu.addAction(count_pois_action)
+        filter_pois_action = QAction("POIs auf Region beschränken...", self)
+        filter_pois_action.triggered.connect(self.filter_pois_by_region)
+        border_menu.addAction(filter_pois_action)
         
+        offline_menu = menu_bar.addMenu("&Offline")
+        offline_menu.aboutToShow.connect(self.handle_menu_show)
+        offline_menu.aboutToHide.connect(self.handle_menu_hide)
+        select_area_action = QAction("Gebiet herunterladen...", self)
+        select_area_action.triggered.connect(self.start_area_selection)
+        offline_menu.addAction(select_area_action)
+        self.resume_download_action = QAction("Unterbrochenen Download fortsetzen", self)
+        self.resume_download_action.triggered.connect(self.resume_tile_download)
+        self.resume_download_action.setEnabled(tile_downloader.load_job(TILE_DOWNLOAD_JOB_FILE) is not None)
+        offline_menu.addAction(self.resume_download_action)
+        self.cancel_download_action = QAction("Download abbrechen", self)
+        self.cancel_download_action.triggered.connect(self.cancel_tile_download)
+        self.cancel_download_action.setEnabled(False)
+        offline_menu.addAction(self.cancel_download_action)
+        release_tiles_action = QAction("Offline-Kacheln freigeben", self)
+        release_tiles_action.triggered.connect(self.release_offline_tiles)
+        offline_menu.addAction(release_tiles_action)
+
+        marker_menu = menu_bar.addMenu("&Fundorte")
+        marker_menu.aboutToShow.connect(self.handle_menu_show)
+        marker_menu.aboutToHide.connect(self.handle_menu_hide)
+        import_action = QAction("Wegpunkte importieren (GPX/KML/CSV)...", self)
+        import_action.triggered.connect(self.import_waypoints)
+        marker_menu.addAction(import_action)
+        export_action = QAction("Fundorte exportieren (GPX/KML/CSV)...", self)
+        export_action.triggered.connect(self.export_markers)
+        marker_menu.addAction(export_action)
+        export_poi_action = QAction("POI-Layer exportieren (GPX/KML/CSV)...", self)
+        export_poi_action.triggered.connect(self.export_poi_layer)
+        marker_menu.addAction(export_poi_action)
+
         debug_menu = menu_bar.addMenu("&Debug")
         dev_tools_action = QAction("Open Remote Debugger", self)
         dev_tools_action.triggered.connect(self.open_remote_debugger)
         debug_menu.addAction(dev_tools_action)
+        debug_menu.addSeparator()
+        cache_stats_action = QAction("HTTP-Cache Statistik", self)
+        cache_stats_action.triggered.connect(self.log_http_cache_stats)
+        debug_menu.addAction(cache_stats_action)
+        clear_cache_action = QAction("HTTP-Cache leeren", self)
+        clear_cache_action.triggered.connect(self.clear_http_cache)
+        debug_menu.addAction(clear_cache_action)
+        tile_stats_action = QAction("Kachel-Cache Statistik", self)
+        tile_stats_action.triggered.connect(self.log_tile_cache_stats)
+        debug_menu.addAction(tile_stats_action)
+        border_benchmark_action = QAction("Grenz-Renderer Benchmark (SVG/Canvas)", self)
+        border_benchmark_action.triggered.connect(self.benchmark_border_renderers)
+        debug_menu.addAction(border_benchmark_action)
 
     def handle_menu_show(self):
         self.sender().menuAction().setProperty("mouse-over", True)
@@ -327,45 +709,200 @@ class TreasureHunterApp(QMainWindow):
         layer_id = f"regions_{country_name}".replace(" ", "_")
 
         if is_checked:
-            self.add_log(f"Fetching regions for {country_name}...")
-            self.border_fetcher_thread = BorderFetcherThread(6, country_name)
-            self.border_fetcher_thread.data_ready.connect(
-                lambda level, name, data, lid=layer_id: self.on_country_regions_data_ready(lid, data)
-            )
-            self.border_fetcher_thread.error.connect(lambda msg: self.add_log(f"Failed to fetch regions: {msg}"))
-            self.border_fetcher_thread.start()
+            if layer_id in self.border_levels:
+                self.show_country_regions(layer_id)
+                return
+            self.border_actions[layer_id] = action
+            if self.border_jobs.fetch(layer_id, 6, country_name):
+                self.add_log(f"Fetching regions for {country_name}...")
+            else:
+                self.add_log(f"Regions for {country_name} are already being fetched.")
         else:
+            self.border_jobs.cancel(layer_id)
+            self.border_actions.pop(layer_id, None)
             self.map_widget.run_js(f"window.removeBorderLayer('{layer_id}');")
 
-    def on_country_regions_data_ready(self, layer_id, data):
+    def on_country_regions_data_ready(self, layer_id, levels):
         self.add_log(f"Region data for {layer_id} has been successfully loaded.")
-        feature_collection_json = json.dumps(data)
-        self.map_widget.run_js(f"window.addCountryRegionsLayer('{layer_id}', {feature_collection_json});")
+        self.border_levels[layer_id] = levels
+        self.show_country_regions(layer_id)
+
+    def show_country_regions(self, layer_id):
+        zooms = self.border_levels[layer_id].zooms
+        self.map_widget.run_js(f"window.addCountryRegionsLayer('{layer_id}', {json.dumps(zooms)});")
+
+    def on_border_view_requested(self, layer_id, level, south, west, north, east):
+        """
+        Sends the page the part of a border layer it asked for after moving the map:
+        the polygons intersecting its (padded) view in the level for its zoom.
+        """
+        levels = self.border_levels.get(layer_id)
+        if levels is None or not 0 <= level < len(levels.zooms):
+            return
+        level_data = levels.encoded_level(level, (south, west, north, east))
+        # Passed as a string literal: the page hands the text to its border worker to parse
+        level_json = json.dumps(json.dumps(level_data, separators=(',', ':')))
+        self.map_widget.run_js(f"window.setBorderLevelData('{layer_id}', {level}, {level_json});")
         
     def open_remote_debugger(self):
         webbrowser.open("http://localhost:8888")
 
+    def log_http_cache_stats(self):
+        for label, cache in (("HTTP-Cache", self.http_cache), ("Grenzen-Cache", self.border_cache)):
+            stats = cache.stats()
+            self.add_log(
+                f"{label}: {stats['hits']} Treffer, {stats['revalidated']} revalidiert, "
+                f"{stats['misses']} Fehlschläge | {stats['entries']} Einträge, "
+                f"{stats['bytes'] / 1048576:.1f} / {stats['max_bytes'] / 1048576:.0f} MB"
+            )
+
+    def benchmark_border_renderers(self):
+        """ Times the SVG and the canvas border renderer on a loaded border layer; the page logs the result. """
+        if not self.border_levels:
+            self.add_log("Keine Grenzen geladen. Bitte zuerst Länder oder Regionen einblenden.")
+            return
+        layer_id, ok = QInputDialog.getItem(self, "Benchmark", "Grenz-Layer:", sorted(self.border_levels), 0, False)
+        if ok:
+            self.add_log(f"Benchmark für '{layer_id}' läuft...")
+            self.map_widget.run_js(f"window.benchmarkBorderRenderers('{layer_id}', 60);")
+
+    def clear_http_cache(self):
+        self.http_cache.clear()
+        self.border_cache.clear()
+        self.add_log("HTTP-Cache geleert.")
+
+    def log_tile_cache_stats(self):
+        stats = self.tile_server.tile_cache.stats()
+        self.add_log(f"Kachel-Server: {self.tile_server.upstream_requests} Anfragen an Kachel-Dienste.")
+        if not stats:
+            self.add_log("Kachel-Cache: noch keine Kacheln geladen.")
+        for layer_id, layer_stats in sorted(stats.items()):
+            self.add_log(
+                f"Kachel-Cache '{layer_id}': {layer_stats['tiles']} Kacheln ({layer_stats['pinned']} offline), "
+                f"{layer_stats['images']} Bilder, {layer_stats['bytes'] / 1048576:.1f} MB"
+            )
+
+    def start_area_selection(self):
+        if self.tile_download_thread and self.tile_download_thread.isRunning():
+            QMessageBox.information(self, "Offline", "Es läuft bereits ein Download.")
+            return
+        self.add_log("Ziehen Sie ein Rechteck auf der Karte auf, um das Gebiet auszuwählen.")
+        self.map_widget.run_js("window.startAreaSelection();")
+
+    def tile_layer_labels(self):
+        """ Returns the labels of the layers whose providers allow offline downloads. """
+        labels = {info['id']: name for name, info in map_assets.base_layers.items()}
+        for layer_id in self.tile_server.layers:
+            labels.setdefault(layer_id, f"Gelände: {layer_id}")
+        return {
+            layer_id: label for layer_id, label in labels.items()
+            if layer_id in self.tile_server.layers
+            and tile_downloader.bulk_download_allowed(self.tile_server.layers[layer_id]['url'])
+        }
+
+    def show_tile_download_dialog(self, south, west, north, east):
+        dialog = TileDownloadDialog((south, west, north, east), self.tile_layer_labels(), self)
+        if dialog.exec():
+            self.start_tile_download(dialog.get_data())
+        else:
+            self.map_widget.run_js("window.clearAreaSelection();")
+
+    def resume_tile_download(self):
+        job = tile_downloader.load_job(TILE_DOWNLOAD_JOB_FILE)
+        if job:
+            self.start_tile_download(job)
+
+    def start_tile_download(self, job):
+        if self.tile_download_thread and self.tile_download_thread.isRunning():
+            return
+        layer_ids = [layer_id for layer_id in job["layer_ids"] if layer_id in self.tile_layer_labels()]
+        try:
+            downloader = tile_downloader.TileDownloader(
+                self.tile_server, layer_ids, job["bbox"], job["min_zoom"], job["max_zoom"]
+            )
+        except ValueError as e:
+            # A saved job that is no longer allowed cannot be resumed either
+            tile_downloader.clear_job(TILE_DOWNLOAD_JOB_FILE)
+            self.resume_download_action.setEnabled(False)
+            self.map_widget.run_js("window.clearAreaSelection();")
+            self.add_log(f"Offline-Download nicht möglich: {e}")
+            QMessageBox.warning(self, "Offline", f"Der Download ist nicht möglich: {e}")
+            return
+        tile_downloader.save_job(TILE_DOWNLOAD_JOB_FILE, job)
+        self.add_log(f"Offline-Download gestartet: {downloader.total} Kacheln in {len(layer_ids)} Layer(n).")
+        self.tile_download_thread = TileDownloadThread(downloader)
+        self.tile_download_thread.progress.connect(self.on_tile_download_progress)
+        self.tile_download_thread.finished.connect(self.on_tile_download_finished)
+        self.tile_download_thread.start()
+        self.resume_download_action.setEnabled(False)
+        self.cancel_download_action.setEnabled(True)
+
+    def cancel_tile_download(self):
+        if self.tile_download_thread and self.tile_download_thread.isRunning():
+            self.tile_download_thread.stop()
+            self.add_log("Offline-Download wird abgebrochen...")
+
+    def release_offline_tiles(self):
+        if self.tile_download_thread and self.tile_download_thread.isRunning():
+            QMessageBox.information(self, "Offline", "Es läuft gerade ein Download.")
+            return
+        answer = QMessageBox.question(
+            self, "Offline-Kacheln freigeben",
+            "Heruntergeladene Kacheln werden wieder wie normal zwischengespeicherte behandelt und "
+            "bei vollem Cache gelöscht. Fortfahren?"
+        )
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        count = self.tile_server.tile_cache.unpin_all()
+        self.add_log(f"{count} Offline-Kacheln freigegeben.")
+
+    def on_tile_download_progress(self, progress):
+        eta = progress["eta"]
+        eta_text = f", noch ca. {int(eta // 60)}:{int(eta % 60):02d} min" if eta is not None else ""
+        self.statusBar().showMessage(
+            f"Offline-Download: {progress['done']}/{progress['total']} Kacheln "
+            f"({progress['downloaded']} geladen, {progress['skipped']} vorhanden, "
+            f"{progress['failed']} Fehler){eta_text}"
+        )
+
+    def on_tile_download_finished(self):
+        thread = self.tile_download_thread
+        result = thread.result or thread.downloader.progress()
+        self.cancel_download_action.setEnabled(False)
+        self.map_widget.run_js("window.clearAreaSelection();")
+        if thread.downloader.is_cancelled or result["failed"]:
+            self.resume_download_action.setEnabled(True)
+            self.add_log(
+                f"Offline-Download unterbrochen: {result['done']}/{result['total']} Kacheln, "
+                f"{result['failed']} Fehler. Er kann über das Offline-Menü fortgesetzt werden."
+            )
+            if result["last_error"]:
+                self.add_log(f"Letzter Fehler beim Offline-Download: {result['last_error']}")
+        else:
+            tile_downloader.clear_job(TILE_DOWNLOAD_JOB_FILE)
+            self.add_log(
+                f"Offline-Download abgeschlossen: {result['downloaded']} geladen, {result['skipped']} bereits vorhanden, "
+                f"{result['deduplicated']} identische Kacheln zusammengefasst."
+            )
+        self.statusBar().clearMessage()
+
     def fetch_url_from_js(self, request_id, url):
-        thread = UrlFetcherThread(request_id, url)
-        thread.data_ready.connect(self.on_url_data_ready)
-        thread.error.connect(self.on_url_fetch_error)
-        self.url_fetcher_threads[request_id] = thread
-        thread.start()
+        self.url_fetch_proxy.fetch(request_id, url)
 
     def on_url_data_ready(self, request_id, data):
         self.map_widget.run_js(f"window.onDataFetched('{request_id}', {json.dumps(data)});")
-        if request_id in self.url_fetcher_threads:
-            del self.url_fetcher_threads[request_id]
 
     def on_url_fetch_error(self, request_id, error_msg):
         self.add_log(f"Proxy Error for request {request_id}: {error_msg}")
-        self.map_widget.run_js(f"window.onDataFetchError('{request_id}', '{error_msg}');")
-        if request_id in self.url_fetcher_threads:
-            del self.url_fetcher_threads[request_id]
+        self.map_widget.run_js(f"window.onDataFetchError('{request_id}', {json.dumps(error_msg)});")
 
     def on_map_ready(self):
-        self.add_log("[JS] Karte ist bereit.")
-        self.draw_all_markers_on_map()
+        startup_ms = self.map_widget.startup_time_ms()
+        if startup_ms is None:
+            self.add_log("[JS] Karte ist bereit.")
+        else:
+            self.add_log(f"[JS] Karte ist bereit ({startup_ms:.0f} ms nach Ladebeginn).")
+        self.resync_markers_on_map()
         self.set_terrain_opacity(self.opacity_slider.value())
         self.map_widget.run_js(f"window.setInitialPoiData({json.dumps(self.poi_data)});")
         for key in self.poi_data:
@@ -388,24 +925,46 @@ class TreasureHunterApp(QMainWindow):
         level = action.data()
         
         if is_checked:
-            self.start_border_fetch(level, action)
+            if str(level) in self.border_levels:
+                self.map_widget.run_js(f"window.toggleBorderLayer({level}, true);")
+            else:
+                self.start_border_fetch(level, action)
         else:
+            self.border_jobs.cancel(str(level))
+            self.border_actions.pop(str(level), None)
             self.map_widget.run_js(f"window.toggleBorderLayer({level}, false);")
 
     def start_border_fetch(self, level, action_to_update):
-        self.add_log(f"Fetching global borders for level {level}...")
-        # Pass None for country_name when fetching all countries
-        self.border_fetcher_thread = BorderFetcherThread(level)
-        self.border_fetcher_thread.data_ready.connect(
-            lambda lvl, name, data: self.on_border_data_ready(lvl, data)
-        )
-        self.border_fetcher_thread.error.connect(lambda msg: self.on_border_fetch_error(msg, action_to_update))
-        self.border_fetcher_thread.start()
+        self.border_actions[str(level)] = action_to_update
+        if self.border_jobs.fetch(str(level), level):
+            self.add_log(f"Fetching global borders for level {level}...")
 
-    def on_border_data_ready(self, level, data):
+    def on_border_fetch_progress(self, layer_id, received, features):
+        self.add_log(f"Downloading borders ({layer_id}): {received / (1024 * 1024):.1f} MB, {features} features so far...")
+
+    def on_border_job_finished(self, layer_id, levels):
+        action = self.border_actions.pop(layer_id, None)
+        if action is None or not action.isChecked():
+            # Unticked while the result was on its way to the UI thread
+            return
+        if layer_id.startswith("regions_"):
+            self.on_country_regions_data_ready(layer_id, levels)
+        else:
+            self.on_border_data_ready(int(layer_id), levels)
+
+    def on_border_job_error(self, layer_id, error_message):
+        action = self.border_actions.pop(layer_id, None)
+        if layer_id.startswith("regions_"):
+            self.add_log(f"Failed to fetch regions: {error_message}")
+            if action:
+                action.setChecked(False)
+        else:
+            self.on_border_fetch_error(error_message, action)
+
+    def on_border_data_ready(self, level, levels):
         self.add_log(f"Border data received for level {level}. Updating map.")
-        json_data_str = json.dumps(data)
-        self.map_widget.run_js(f"window.updateBorderLayer({level}, {json_data_str});")
+        self.border_levels[str(level)] = levels
+        self.map_widget.run_js(f"window.setBorderLevels({level}, {json.dumps(levels.zooms)});")
         self.map_widget.run_js(f"window.toggleBorderLayer({level}, true);")
 
     def on_border_fetch_error(self, error_message, action_to_update):
@@ -414,6 +973,90 @@ class TreasureHunterApp(QMainWindow):
         if action_to_update:
             action_to_update.setChecked(False)
 
+    def count_pois_by_region(self):
+        if not self.border_levels:
+            self.add_log("Keine Grenzen geladen. Bitte zuerst Länder oder Regionen einblenden.")
+            return
+        # The thread works on snapshots; layers loaded or imported meanwhile are not counted
+        border_levels, poi_data = dict(self.border_levels), dict(self.poi_data)
+
+        def count():
+            lines = []
+            for layer_id, levels in border_levels.items():
+                regions = levels.prepared_regions()
+                for file_key in sorted(poi_data):
+                    _, assignment = poi_regions(levels, file_key, poi_data[file_key])
+                    counts = regions.counts(assignment)
+                    if counts:
+                        summary = ", ".join(
+                            f"{name}: {count}" for name, count in sorted(counts.items(), key=lambda item: -item[1])
+                        )
+                        lines.append(f"{file_key} ({layer_id}): {summary}")
+            return lines
+
+        self.start_poi_region_thread(count, self.on_poi_counts_finished)
+
+    def on_poi_counts_finished(self, lines):
+        for line in lines:
+            self.add_log(line)
+
+    def filter_pois_by_region(self):
+        # Preparing the regions for their names can take a while the first time
+        border_levels = dict(self.border_levels)
+        self.start_poi_region_thread(
+            lambda: [(layer_id, levels.prepared_regions().names) for layer_id, levels in border_levels.items()],
+            lambda region_names: self.choose_poi_filter_region(border_levels, region_names)
+        )
+
+    def choose_poi_filter_region(self, border_levels, region_names):
+        """ Asks for the region to filter the POIs by and assigns them on a PoiRegionThread. """
+        choices = ["Alle Regionen (kein Filter)"]
+        targets = [None]
+        for layer_id, names in region_names:
+            for region_index, name in enumerate(names):
+                choices.append(f"{name} ({layer_id})")
+                targets.append((layer_id, region_index))
+        choice, ok = QInputDialog.getItem(self, "POIs filtern", "Nur POIs in dieser Region anzeigen:", choices, 0, False)
+        if not ok:
+            return
+        target = targets[choices.index(choice)]
+        if target is None:
+            self.map_widget.run_js("window.setPoiRegionFilter(null);")
+            self.add_log("POI-Filter aufgehoben.")
+            return
+        layer_id, region_index = target
+        levels, poi_data = border_levels[layer_id], dict(self.poi_data)
+
+        def select():
+            poi_filter = {}
+            for file_key, pois in poi_data.items():
+                indices, assignment = poi_regions(levels, file_key, pois)
+                poi_filter[file_key] = [index for index, region in zip(indices, assignment.tolist()) if region == region_index]
+            return poi_filter
+
+        self.start_poi_region_thread(select, lambda poi_filter: self.on_poi_filter_finished(poi_filter, choice))
+
+    def on_poi_filter_finished(self, poi_filter, choice):
+        self.map_widget.run_js(f"window.setPoiRegionFilter({json.dumps(poi_filter)});")
+        self.add_log(f"POI-Filter: {sum(map(len, poi_filter.values()))} POIs in {choice}.")
+
+    def start_poi_region_thread(self, work, on_success):
+        if self.poi_region_thread and self.poi_region_thread.isRunning():
+            QMessageBox.information(self, "POIs", "Es läuft bereits eine Zuordnung von POIs zu Regionen.")
+            return
+        self.statusBar().showMessage("POIs werden Regionen zugeordnet...")
+        self.poi_region_thread = PoiRegionThread(work)
+        self.poi_region_thread.finished.connect(lambda: self.on_poi_region_thread_finished(on_success))
+        self.poi_region_thread.start()
+
+    def on_poi_region_thread_finished(self, on_success):
+        self.statusBar().clearMessage()
+        thread = self.poi_region_thread
+        if thread.error is not None:
+            self.add_log(f"Fehler beim Zuordnen der POIs zu Regionen: {thread.error}")
+            return
+        on_success(thread.result)
+
     def toggle_terrain_layer(self, state):
         is_visible = state == Qt.CheckState.Checked.value
         self.map_widget.run_js(f"window.setTerrainAutoMode({str(is_visible).lower()});")
@@ -573,79 +1216,244 @@ class TreasureHunterApp(QMainWindow):
             marker_id = str(uuid.uuid4())
             new_marker = {"id": marker_id, "lat": lat, "lon": lon, **data}
             self.markers[marker_id] = new_marker
-            self.update_marker_list_ui()
-            self.map_widget.add_permanent_marker(new_marker)
-            self.save_markers()
-
-    def update_marker_list_ui(self):
-        self.marker_list_widget.clear()
-        self.destination_selector.clear()
-        self.destination_selector.addItem("Ziel auswählen...", None)
-        sorted_markers = sorted(self.markers.values(), key=lambda m: m['comment'])
-        for marker in sorted_markers:
-            item = QListWidgetItem(f"{marker['comment']} ({marker['icon']})")
-            item.setData(Qt.ItemDataRole.UserRole, marker['id'])
-            self.marker_list_widget.addItem(item)
-            self.destination_selector.addItem(marker['comment'], marker['id'])
-
-    def center_on_marker(self, item):
-        marker_id = item.data(Qt.ItemDataRole.UserRole)
+            self.marker_model.add_marker(new_marker)
+            self.sync_markers_to_map([marker_id])
+            self.marker_store.add(new_marker)
+
+    def center_on_marker(self, index):
+        marker_id = index.data(Qt.ItemDataRole.UserRole)
         if marker_id in self.markers:
             marker = self.markers[marker_id]
             self.map_widget.run_js(f"window.setView({marker['lat']}, {marker['lon']}, 15);")
             self.map_widget.run_js(f"window.openMarkerPopup('{marker_id}');")
 
     def delete_selected_marker(self):
-        selected_items = self.marker_list_widget.selectedItems()
-        if not selected_items:
+        selected_indexes = self.marker_list_view.selectionModel().selectedIndexes()
+        if not selected_indexes:
             QMessageBox.information(self, "Löschen", "Bitte wählen Sie einen Marker zum Löschen aus.")
             return
-        marker_id = selected_items[0].data(Qt.ItemDataRole.UserRole)
+        marker_id = selected_indexes[0].data(Qt.ItemDataRole.UserRole)
         if marker_id in self.markers:
+            self.marker_model.remove_marker(self.markers[marker_id])
             del self.markers[marker_id]
-            self.save_markers()
-            self.update_marker_list_ui()
-            self.map_widget.remove_permanent_marker(marker_id)
+            self.marker_store.delete(marker_id)
+            self.sync_markers_to_map([marker_id])
             self.add_log(f"Marker '{marker_id}' gelöscht.")
 
-    def save_markers(self):
-        try:
-            with open(self.markers_file, 'w', encoding='utf-8') as f:
-                json.dump(self.markers, f, indent=4)
-            self.add_log("Marker gespeichert.")
-        except IOError as e:
-            QMessageBox.critical(self, "Speicherfehler", f"Fehler beim Speichern der Marker: {e}")
+    def on_marker_write_failed(self, marker_ids, error_message):
+        """ Puts the markers whose changes could not be saved back to their stored state. """
+        stored = self.marker_store.get_many(marker_ids)
+        for marker_id in marker_ids:
+            if marker_id in self.markers:
+                self.marker_model.remove_marker(self.markers.pop(marker_id))
+            if marker_id in stored:
+                self.markers[marker_id] = stored[marker_id]
+                self.marker_model.add_marker(stored[marker_id])
+        self.sync_markers_to_map(marker_ids)
+        self.add_log(f"Speichern von {len(marker_ids)} Marker(n) fehlgeschlagen: {error_message}")
+        QMessageBox.critical(
+            self, "Speicherfehler", f"Die Änderung konnte nicht gespeichert werden und wurde zurückgenommen: {error_message}."
+        )
 
     def load_markers(self):
-        if not os.path.exists(self.markers_file):
-            return
         try:
-            with open(self.markers_file, 'r', encoding='utf-8') as f:
-                self.markers = json.load(f)
+            migrated = self.marker_store.migrate_json(LEGACY_MARKERS_FILE)
+            if migrated:
+                self.add_log(f"{migrated} Marker aus {LEGACY_MARKERS_FILE} übernommen.")
+        except Exception as e:
+            QMessageBox.critical(self, "Ladefehler", f"Fehler beim Übernehmen der Marker-Datei: {e}.")
+        try:
+            self.markers = self.marker_store.load_all()
             self.add_log("Marker geladen.")
-            self.update_marker_list_ui()
         except Exception as e:
-            QMessageBox.critical(self, "Ladefehler", f"Fehler beim Laden der Marker-Datei: {e}.")
+            QMessageBox.critical(self, "Ladefehler", f"Fehler beim Laden der Marker: {e}.")
             self.markers = {}
+        self.reload_marker_list()
 
-    def draw_all_markers_on_map(self):
-        if self.markers:
-            self.map_widget.update_all_markers(list(self.markers.values()))
+    def reload_marker_list(self):
+        """ Rebuilds the marker list in one step, e.g. after loading or importing many markers. """
+        self.marker_model.set_markers(self.markers)
+        # The selector picks the first entry after a reset; show the placeholder instead
+        self.destination_selector.setCurrentIndex(-1)
+
+    def import_waypoints(self):
+        if self.waypoint_thread and self.waypoint_thread.isRunning():
+            QMessageBox.information(self, "Import", "Es läuft bereits ein Import oder Export.")
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "Wegpunkte importieren", "", WAYPOINT_FILE_FILTER)
+        if not path:
+            return
+        targets = ["Meine Fundorte", "Neuer POI-Layer"]
+        target, ok = QInputDialog.getItem(self, "Import", "Wegpunkte importieren nach:", targets, 0, False)
+        if not ok:
+            return
+        self.add_log(f"Importiere Wegpunkte aus '{path}'...")
+        if target == targets[0]:
+            self.start_waypoint_thread(lambda progress: self.read_waypoint_markers(path, progress),
+                                       self.on_marker_import_finished)
+        else:
+            layer_key = self.new_poi_layer_key(path)
+            self.start_waypoint_thread(lambda progress: self.read_waypoint_poi_layer(path, layer_key, progress),
+                                       lambda pois: self.on_poi_import_finished(layer_key, pois))
+
+    def export_markers(self):
+        if self.waypoint_thread and self.waypoint_thread.isRunning():
+            QMessageBox.information(self, "Export", "Es läuft bereits ein Import oder Export.")
+            return
+        path, selected_filter = QFileDialog.getSaveFileName(self, "Fundorte exportieren", "fundorte.gpx", WAYPOINT_FILE_FILTER)
+        if not path:
+            return
+        if os.path.splitext(path)[1].lower() not in waypoint_io.FORMATS:
+            extension = re.search(r"\*(\.\w+)", selected_filter)
+            path += extension.group(1) if extension else ".gpx"
+        self.add_log(f"Exportiere Fundorte nach '{path}'...")
+        self.start_waypoint_thread(
+            lambda progress: waypoint_io.write_waypoints(path, self.marker_store.iter_markers(), progress),
+            lambda count: self.add_log(f"{count} Fundorte nach '{path}' exportiert.")
+        )
+
+    def export_poi_layer(self):
+        if self.waypoint_thread and self.waypoint_thread.isRunning():
+            QMessageBox.information(self, "Export", "Es läuft bereits ein Import oder Export.")
+            return
+        layer_keys = sorted(self.poi_data)
+        if not layer_keys:
+            QMessageBox.information(self, "Export", "Es sind keine POI-Layer geladen.")
+            return
+        layer_key, ok = QInputDialog.getItem(self, "Export", "POI-Layer exportieren:", layer_keys, 0, False)
+        if not ok:
+            return
+        default_name = os.path.splitext(os.path.basename(layer_key))[0] + ".gpx"
+        path, selected_filter = QFileDialog.getSaveFileName(self, "POI-Layer exportieren", default_name, WAYPOINT_FILE_FILTER)
+        if not path:
+            return
+        if os.path.splitext(path)[1].lower() not in waypoint_io.FORMATS:
+            extension = re.search(r"\*(\.\w+)", selected_filter)
+            path += extension.group(1) if extension else ".gpx"
+        pois = self.poi_data[layer_key]
+        self.add_log(f"Exportiere POI-Layer '{layer_key}' nach '{path}'...")
+        self.start_waypoint_thread(
+            lambda progress: waypoint_io.write_waypoints(
+                path, (poi_to_marker(layer_key, index, poi) for index, poi in enumerate(pois)), progress
+            ),
+            lambda count: self.add_log(f"{count} POIs aus '{layer_key}' nach '{path}' exportiert.")
+        )
+
+    def start_waypoint_thread(self, work, on_success):
+        self.waypoint_thread = WaypointFileThread(work)
+        self.waypoint_thread.progress.connect(lambda count: self.statusBar().showMessage(f"{count} Wegpunkte verarbeitet..."))
+        self.waypoint_thread.finished.connect(lambda: self.on_waypoint_thread_finished(on_success))
+        self.waypoint_thread.start()
+
+    def on_waypoint_thread_finished(self, on_success):
+        self.statusBar().clearMessage()
+        thread = self.waypoint_thread
+        if thread.error is not None:
+            self.add_log(f"Fehler bei Import/Export: {thread.error}")
+            QMessageBox.critical(self, "Import/Export Fehler", f"Import/Export fehlgeschlagen: {thread.error}")
+            return
+        on_success(thread.result)
+
+    def read_waypoint_markers(self, path, progress):
+        """ Runs on the import thread: reads a waypoint file and stores its waypoints as markers in one transaction. """
+        markers = [waypoint_to_marker(waypoint) for waypoint in waypoint_io.read_waypoints(path, progress)]
+        self.marker_store.add_many(markers)
+        return markers
+
+    def on_marker_import_finished(self, markers):
+        for marker in markers:
+            self.markers[marker['id']] = marker
+        # One reset is far cheaper than a row insert per imported marker
+        self.reload_marker_list()
+        self.sync_markers_to_map([marker['id'] for marker in markers])
+        self.add_log(f"{len(markers)} Fundorte importiert.")
+
+    def new_poi_layer_key(self, path):
+        """ Returns an unused POI layer key below POI_IMPORT_CATEGORY, named after the imported file. """
+        name = re.sub(r"[^\w\- ]", "_", os.path.splitext(os.path.basename(path))[0]) or "import"
+        layer_key, number = f"{POI_IMPORT_CATEGORY}/{name}.json", 1
+        while layer_key in self.poi_data or os.path.exists(os.path.join("poi_data", layer_key)):
+            number += 1
+            layer_key = f"{POI_IMPORT_CATEGORY}/{name}_{number}.json"
+        return layer_key
+
+    def read_waypoint_poi_layer(self, path, layer_key, progress):
+        """ Runs on the import thread: reads a waypoint file and writes its waypoints as a POI layer file. """
+        pois = [
+            {"name": waypoint.get("name") or waypoint.get("description") or "", "lat": waypoint["lat"], "lon": waypoint["lon"]}
+            for waypoint in waypoint_io.read_waypoints(path, progress)
+        ]
+        layer_path = os.path.join("poi_data", layer_key)
+        os.makedirs(os.path.dirname(layer_path), exist_ok=True)
+        # Written under a temporary name, so an interrupted import leaves no half layer behind
+        with open(layer_path + ".part", 'w', encoding='utf-8') as f:
+            json.dump(pois, f, ensure_ascii=False)
+        os.replace(layer_path + ".part", layer_path)
+        return pois
+
+    def on_poi_import_finished(self, layer_key, pois):
+        self.poi_data[layer_key] = pois
+        self.map_widget.set_poi_layer_data(layer_key, pois)
+        # Rebuilding the menu unchecks every layer; the visible ones stay on the map and get their check back
+        shown = {action.data() for action in self.poi_layer_actions() if action.isChecked()}
+        self.populate_poi_menu()
+        for action in self.poi_layer_actions():
+            if action.data() in shown:
+                action.blockSignals(True)
+                action.setChecked(True)
+                action.blockSignals(False)
+            elif action.data() == layer_key:
+                action.setChecked(True)
+        self.add_log(f"POI-Layer '{layer_key}' mit {len(pois)} Einträgen angelegt.")
+
+    def poi_layer_actions(self):
+        """ Yields the checkable actions of the POI layers in the POI menu. """
+        for category_action in self.poi_menu.actions():
+            if category_action.menu() is None:
+                continue
+            for action in category_action.menu().actions():
+                if action.isCheckable():
+                    yield action
+
+    def sync_markers_to_map(self, changed=None):
+        """ Sends the changes of the markers since the last sync to the page, optionally only those of the given ids. """
+        diff = self.marker_sync.diff(self.markers, changed)
+        if diff:
+            self.map_widget.apply_marker_diff(diff)
+
+    def resync_markers_on_map(self):
+        """ Replaces all markers on the page, e.g. once it has (re)loaded. """
+        self.marker_sync.reset()
+        self.sync_markers_to_map()
 
     def closeEvent(self, event):
         """ Handles the window close event to ensure clean shutdown of threads. """
         self.add_log("Anwendung wird beendet... Warte auf Threads.")
         
-        # Stop border fetcher thread if it's running
-        if self.border_fetcher_thread and self.border_fetcher_thread.isRunning():
-            self.border_fetcher_thread.stop()
-            self.border_fetcher_thread.wait() # Wait for it to finish
-
-        # Stop all URL fetcher threads
-        for request_id, thread in list(self.url_fetcher_threads.items()):
-            if thread.isRunning():
-                thread.stop()
-                thread.wait()
+        # Cancel the border jobs; downloads stop before their next chunk
+        if self.border_jobs.stop():
+            self.border_cache.close()
+            self.region_store.close()
+        else:
+            # A job still simplifying or ingesting would fail on closed stores; SQLite
+            # rolls back whatever it has not committed once the process exits
+            self.add_log("Grenzlinien-Jobs laufen noch; ihre Ergebnisse werden verworfen.")
+        # An import has to finish its transaction before the marker store closes
+        if self.waypoint_thread and self.waypoint_thread.isRunning():
+            self.waypoint_thread.wait()
+        if self.poi_region_thread and self.poi_region_thread.isRunning():
+            self.poi_region_thread.wait()
+        # Commits the marker writes that are still queued
+        self.marker_store.close()
+
+        # Stop an offline download; it can be resumed on the next start
+        if self.tile_download_thread and self.tile_download_thread.isRunning():
+            self.tile_download_thread.stop()
+            self.tile_download_thread.wait()
+
+        # Stop the URL fetcher pool; running downloads are abandoned
+        self.url_fetch_proxy.stop()
+        self.tile_server.stop()
 
         self.add_log("Alle Threads beendet. Anwendung wird geschlossen.")
         event.accept()
@@ -653,6 +1461,8 @@ class TreasureHunterApp(QMainWindow):
 
 def main():
     # The local server is not needed with the Python proxy approach
+    # Custom URL schemes have to be known before the QApplication is created
+    register_app_scheme()
     app = QApplication(sys.argv)
     
     # Lade das Stylesheet
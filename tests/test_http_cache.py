@@ -0,0 +1,169 @@
+# This module contains regression tests for the persistent HTTP cache.
+
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from assets import http_cache
+
+
+class FakeResponse:
+    """ The parts of a requests response that HttpCache uses. """
+
+    def __init__(self, body, headers, status_code=200):
+        self.content = body
+        self.headers = headers
+        self.status_code = status_code
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    """ Answers every GET with the next of the given responses. """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.request_headers = []
+
+    def get(self, url, timeout=None, headers=None, stream=False):
+        self.request_headers.append(headers)
+        return self.responses.pop(0)
+
+
+class HttpCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite")
+        self.cache = http_cache.HttpCache(self.path)
+        self.addCleanup(self.cache.close)
+
+    def reopen(self, **options):
+        self.cache.close()
+        self.cache = http_cache.HttpCache(self.path, **options)
+
+    def test_fresh_response_is_served_from_cache(self):
+        url = "https://example.org/fresh"
+        session = FakeSession([FakeResponse(b"body", {"Cache-Control": "max-age=60"})])
+        self.assertEqual(self.cache.fetch(session, url, 10), b"body")
+        self.assertEqual(self.cache.fetch(session, url, 10), b"body")
+        self.assertEqual(len(session.request_headers), 1)
+        stats = self.cache.stats()
+        self.assertEqual((stats["misses"], stats["hits"]), (1, 1))
+
+    def test_stale_response_is_revalidated(self):
+        url = "https://example.org/stale"
+        session = FakeSession([
+            FakeResponse(b"body", {"Cache-Control": "max-age=1", "ETag": '"v1"'}),
+            FakeResponse(b"", {"Cache-Control": "max-age=60"}, status_code=304),
+        ])
+        self.assertEqual(self.cache.fetch_parsed(session, url, 10, bytes.decode), "body")
+
+        later = time.time() + 2
+        with mock.patch.object(http_cache.time, "time", return_value=later):
+            self.assertEqual(self.cache.fetch_parsed(session, url, 10, bytes.decode), "body")
+            self.assertEqual(session.request_headers[1]["If-None-Match"], '"v1"')
+            # The 304 renewed the lifetime, so the next fetch needs no request
+            self.assertEqual(self.cache.fetch(session, url, 10), b"body")
+        self.assertEqual(len(session.request_headers), 2)
+        self.assertEqual(self.cache.stats()["revalidated"], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.max_bytes = 10
+        session = FakeSession([
+            FakeResponse(b"aaaa", {"Cache-Control": "max-age=86400"}),
+            FakeResponse(b"bbbb", {"Cache-Control": "max-age=86400"}),
+            FakeResponse(b"cccc", {"Cache-Control": "max-age=86400"}),
+        ])
+        now = time.time()
+        with mock.patch.object(http_cache.time, "time", return_value=now):
+            self.cache.fetch(session, "https://example.org/a", 10)
+            self.cache.fetch(session, "https://example.org/b", 10)
+        # Reading a is only recorded once its access time is older than ACCESS_RESOLUTION
+        with mock.patch.object(http_cache.time, "time", return_value=now + http_cache.ACCESS_RESOLUTION + 1):
+            self.cache.fetch(session, "https://example.org/a", 10)
+            self.cache.fetch(session, "https://example.org/c", 10)
+        self.assertEqual(self.cache.stats()["bytes"], 8)
+        self.assertEqual(self.cache._lookup("https://example.org/b"), None)
+        self.assertIsNotNone(self.cache._lookup("https://example.org/a"))
+
+    def test_hits_within_access_resolution_do_not_write(self):
+        url = "https://example.org/hit"
+        session = FakeSession([FakeResponse(b"body", {"Cache-Control": "max-age=60"})])
+        self.cache.fetch(session, url, 10)
+        before = self.cache._db.total_changes
+        self.cache.fetch(session, url, 10)
+        self.assertEqual(self.cache._db.total_changes, before)
+
+    def test_compressed_round_trip(self):
+        self.reopen(compress=True)
+        url = "https://example.org/compressed.json"
+        document = {"features": [{"name": "x" * 100, "id": i} for i in range(100)]}
+        body = json.dumps(document).encode()
+        session = FakeSession([FakeResponse(body, {"Cache-Control": "max-age=60"})])
+        self.assertEqual(self.cache.fetch_parsed(session, url, 10, json.loads), document)
+        self.assertLess(self.cache.stats()["bytes"], len(body))
+
+        # Bodies and parsed forms are read by their stored encoding, not the current setting
+        self.reopen(compress=False)
+        self.assertEqual(self.cache.fetch(session, url, 10), body)
+        self.assertEqual(self.cache.fetch_parsed(session, url, 10, self.fail), document)
+        self.assertEqual(self.cache.stats()["hits"], 2)
+
+    def test_parsed_forms_of_old_databases_are_rebuilt(self):
+        url = "https://example.org/old.json"
+        session = FakeSession([FakeResponse(b'"value"', {"Cache-Control": "max-age=60"})])
+        self.cache.fetch_parsed(session, url, 10, json.loads)
+        self.cache.close()
+        db = sqlite3.connect(self.path)
+        db.execute("ALTER TABLE responses DROP COLUMN parsed_encoding")
+        db.commit()
+        db.close()
+
+        self.cache = http_cache.HttpCache(self.path)
+        self.assertEqual(self.cache.stats()["bytes"], len(b'"value"'))
+        self.assertEqual(self.cache.fetch_parsed(session, url, 10, json.loads), "value")
+
+    def test_uncacheable_response_replaces_stale_parsed_value(self):
+        url = "https://example.org/data.json"
+        session = FakeSession([
+            FakeResponse(b'"old"', {"Cache-Control": "max-age=1"}),
+            FakeResponse(b'"new"', {"Cache-Control": "no-store"}),
+        ])
+        self.assertEqual(self.cache.fetch_parsed(session, url, 10, json.loads), "old")
+
+        later = time.time() + 2
+        with mock.patch.object(http_cache.time, "time", return_value=later):
+            self.assertEqual(self.cache.fetch_parsed(session, url, 10, json.loads), "new")
+        self.assertEqual(self.cache.stats()["entries"], 0)
+        self.assertEqual(self.cache.stats()["bytes"], 0)
+
+    def test_oversized_response_replaces_stale_body(self):
+        url = "https://example.org/big"
+        self.cache.max_bytes = 8
+        session = FakeSession([
+            FakeResponse(b"old", {"Cache-Control": "max-age=1"}),
+            FakeResponse(b"new and too large", {"Cache-Control": "max-age=60"}),
+        ])
+        self.assertEqual(self.cache.fetch(session, url, 10), b"old")
+
+        later = time.time() + 2
+        with mock.patch.object(http_cache.time, "time", return_value=later):
+            self.assertEqual(self.cache.fetch(session, url, 10), b"new and too large")
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+# This module contains tests for the terrain registry and its priority rules.
+
+import unittest
+from types import SimpleNamespace
+
+from assets import terrain_registry
+from assets.terrain_registry import build_terrain_registry, find_terrain_layer
+
+
+def _country(bounds, layer_logic, priority=None):
+    module = SimpleNamespace(
+        bounds=bounds,
+        terrain_layers={key: {"url": f"https://example.invalid/{key}"} for logic in layer_logic.values() for key in logic.values()},
+        layer_logic=layer_logic,
+    )
+    if priority is not None:
+        module.priority = priority
+    return module
+
+
+class TerrainRegistryTest(unittest.TestCase):
+
+    def test_higher_priority_wins_where_regions_overlap(self):
+        modules = {
+            "outer": _country({"outer": [[40.0, 0.0], [50.0, 20.0]]}, {"outer": {"0": "outer_layer"}}, {"outer": 10}),
+            "inner": _country({"inner": [[44.0, 5.0], [46.0, 15.0]]}, {"inner": {"0": "inner_layer"}}, {"inner": 20}),
+        }
+        registry = build_terrain_registry(modules, cell_size=1.0)
+        self.assertEqual(find_terrain_layer(registry, 45.0, 10.0, 12), "inner_layer")
+        self.assertEqual(find_terrain_layer(registry, 48.0, 10.0, 12), "outer_layer")
+        self.assertIsNone(find_terrain_layer(registry, 60.0, 10.0, 12))
+
+    def test_winning_region_without_rule_for_zoom_shows_nothing(self):
+        modules = {
+            "outer": _country({"outer": [[40.0, 0.0], [50.0, 20.0]]}, {"outer": {"0": "outer_layer"}}),
+            "inner": _country({"inner": [[44.0, 5.0], [46.0, 15.0]]}, {"inner": {"14": "inner_layer"}}, {"inner": 1}),
+        }
+        registry = build_terrain_registry(modules, cell_size=1.0)
+        self.assertEqual(find_terrain_layer(registry, 45.0, 10.0, 14), "inner_layer")
+        # Lower regions are not consulted, the same as in the page's lookup
+        self.assertIsNone(find_terrain_layer(registry, 45.0, 10.0, 10))
+
+    def test_country_modules(self):
+        registry = build_terrain_registry(terrain_registry.discover_country_modules())
+        munich, salzburg, vienna, zurich = (48.14, 11.58), (47.80, 13.04), (48.21, 16.37), (47.37, 8.54)
+        self.assertEqual(find_terrain_layer(registry, *munich, 15), "by_lidar_kombiniert")
+        self.assertEqual(find_terrain_layer(registry, *munich, 14), "by_lidar_schraeglicht")
+        self.assertEqual(find_terrain_layer(registry, *munich, 10), "de_gelaende")
+        # Salzburg lies inside Bavaria's bounding box, which outranks Austria
+        self.assertEqual(find_terrain_layer(registry, *salzburg, 10), "de_gelaende")
+        self.assertEqual(find_terrain_layer(registry, *vienna, 10), "at_dtm")
+        self.assertEqual(find_terrain_layer(registry, *zurich, 10), "ch_dtm")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# This module contains tests for the offline tile downloader against a local stand-in tile server.
+
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from assets import tile_math
+from assets import tile_downloader
+from assets.tile_server import TileServer
+from assets.tile_store import TileCache
+
+# Smallest valid PNG (1x1, transparent); every tile of the stand-in server is this image.
+TILE_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000100ffff03000006000557bfabd4"
+    "0000000049454e44ae426082"
+)
+BBOX = (48.10, 11.50, 48.20, 11.65)
+MIN_ZOOM, MAX_ZOOM = 10, 12
+
+
+class _StandInTileHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(TILE_PNG)))
+        self.end_headers()
+        self.wfile.write(TILE_PNG)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TileDownloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.upstream = ThreadingHTTPServer(("127.0.0.1", 0), _StandInTileHandler)
+        self.upstream.requests = []
+        threading.Thread(target=self.upstream.serve_forever, daemon=True).start()
+        self.addCleanup(self.upstream.server_close)
+        self.addCleanup(self.upstream.shutdown)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.tile_server = TileServer(TileCache(os.path.join(directory.name, "tiles"), 1024 * 1024))
+        self.tile_server.start()
+        self.addCleanup(self.tile_server.stop)
+        host, port = self.upstream.server_address[:2]
+        self.tile_server.register_layer("standin", f"http://{host}:{port}/{{z}}/{{x}}/{{y}}.png")
+        self.total = tile_math.count_tiles(BBOX, MIN_ZOOM, MAX_ZOOM)
+
+    def download(self):
+        downloader = tile_downloader.TileDownloader(
+            self.tile_server, ["standin"], BBOX, MIN_ZOOM, MAX_ZOOM, rate_per_host=1000
+        )
+        return downloader.run()
+
+    def test_download_pins_tiles_and_resumes(self):
+        result = self.download()
+        self.assertEqual(result["total"], self.total)
+        self.assertEqual(result["downloaded"], self.total)
+        self.assertEqual(result["failed"], 0)
+        # Every tile is the same image, so all but the first are stored as duplicates
+        self.assertEqual(result["deduplicated"], self.total - 1)
+        stats = self.tile_server.tile_cache.store("standin").stats()
+        self.assertEqual(stats["tiles"], self.total)
+        self.assertEqual(stats["pinned"], self.total)
+        self.assertEqual(stats["images"], 1)
+        self.assertEqual(len(self.upstream.requests), self.total)
+
+        resumed = self.download()
+        self.assertEqual(resumed["skipped"], self.total)
+        self.assertEqual(resumed["downloaded"], 0)
+        self.assertEqual(len(self.upstream.requests), self.total)
+
+    def test_store_errors_count_as_failed(self):
+        store = self.tile_server.tile_cache.store("standin")
+        with mock.patch.object(store, "put_many", side_effect=sqlite3.OperationalError("database is locked")):
+            result = self.download()
+        self.assertEqual(result["done"], self.total)
+        self.assertEqual(result["failed"], self.total)
+        self.assertIn("database is locked", result["last_error"])
+
+
+if __name__ == "__main__":
+    unittest.main()